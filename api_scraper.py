@@ -5,77 +5,143 @@
 2.  **ЧТО ДЕЛАЕТ СКРИПТ:**
     Скрипт выполняет следующие шаги:
     - В начале настраивает систему записи событий (логирования) в два разных файла.
-    - Загружает список ОГРН компаний, которые нужно обработать, из текстового файла `ogrns.txt`.
+    - Читает список ОГРН компаний, которые нужно обработать, из файла `ogrns.txt` (или `OGRN_INPUT`) потоком, не загружая его в память (`ogrn_input.py`): неверные по контрольной сумме номера и повторы отбрасываются до запроса к API.
     - Загружает из файла `APIs.txt` список доступных ключей доступа к API Checko.
     - Загружает из файла `api_count.json` статистику использования этих ключей за сегодняшний день.
     - Очищает статистику от ключей, которых больше нет в списке активных.
+    - Читает журнал прогресса `progress_journal.txt` (`progress_journal.py`) и по мере чтения списка пропускает уже скачанные и несуществующие ОГРН.
+    - В режиме координатора (задана переменная `COORDINATOR`, см. `coordinator.py`) вместо `ogrns.txt`, `APIs.txt` и журнала прогресса берет ключи и пачки ОГРН во временную аренду у общего координатора и сообщает ему результаты и статистику ключей.
     - Выбирает из доступных ключей тот, у которого наименьшее количество сделанных за сегодня запросов.
-    - По очереди обрабатывает каждый выбранный ОГРН:
-      - Делает запрос к API Checko для получения данных по этому ОГРН.
+    - Параллельно обрабатывает ОГРН в пуле рабочих потоков: на каждый ключ приходится `API_CONCURRENCY_PER_KEY` одновременных запросов (по умолчанию 1), так что время работы ограничено лимитами ключей, а не задержкой сети. Для каждого ОГРН:
+      - Делает запрос к API Checko для получения данных по этому ОГРН через общий пул постоянных соединений (`http_client.py`); таймауты, разрывы соединения и ответы 5xx повторяются с экспоненциальной паузой. Попытка, которая могла дойти до API, сразу засчитывается в счетчик ключа и повторяется не более `API_MAX_SENT_RETRIES` раз, причем повтор ждет нового токена ключа у планировщика скорости.
       - Обновляет статистику использования ключа на основе ответа API.
       - Если API возвращает ошибку, связанную с превышением лимита, или если текущий ключ достиг лимита, скрипт переключается на следующий доступный ключ.
       - Если API возвращает ошибку, указывающую на недействительность ключа (например, ошибка 401), этот ключ удаляется из системы.
-      - Если данные успешно получены, скрипт сохраняет их в сжатом формате JSON.GZ в отдельный файл в папке `JSONs`, имя файла соответствует ОГРН.
-      - Делает небольшую паузу перед следующим запросом, чтобы не превышать скорость запросов к API.
+      - Если данные успешно получены, ответ в виде сырых байтов (без повторного разбора и сериализации JSON) ставится в ограниченную очередь записи. Потоки записи сжимают и сохраняют его выбранным способом (`OUTPUT_SINK`): по умолчанию в сжатом формате JSON.GZ в отдельный файл в папке `JSONs`, имя файла соответствует ОГРН; либо в сжатые сегменты NDJSON или базу SQLite (`output_sinks.py`).
+      - Записывает итог в журнал прогресса: `ok` (сохранено), `dead` (компания не найдена, повторно не запрашивается) или `retry` (временная ошибка, повтор при следующем запуске).
+      - Перед запросом ждет места в адаптивном лимите одновременных запросов (`concurrency_limiter.py`) и получает ключ у планировщика скорости (`rate_scheduler.py`): у каждого ключа свое "ведро токенов", поэтому пауза добавляется только перед реальными запросами и только когда она нужна.
+    - Во время работы собирает метрики (`scraper_metrics.py`): время запросов, ожидания ключа, очереди и записи, счетчики по ключам и скорость обработки. Периодически записывает их в `metrics.json` и, если задан `METRICS_PORT`, отдает по HTTP.
+    - Если задан кэш ответов (`RESPONSE_CACHE`, `response_cache.py`), не запрашивает ОГРН, полученные в пределах срока годности `CACHE_TTL_HOURS`, и не перезаписывает ответы, которые не изменились (сравнение по хешу). В режиме обновления (`REFRESH=1`) вместо списка ОГРН повторно запрашивает устаревшие записи кэша, начиная с самых старых.
     - Если все ОГРН из списка обработаны или все ключи доступа исчерпали дневной лимит, скрипт завершает работу.
+      Если задан `RESET_WAIT_HOURS` и лимит одного из ключей сбросится в пределах этого окна от старта, скрипт
+      вместо завершения ждет сброса и продолжает работу; сигнал завершения (SIGINT/SIGTERM) прерывает ожидание.
     - В конце выводит краткую статистику о проделанной работе в консоль и логи.
 
 3.  **ОСНОВНЫЕ ФУНКЦИИ:**
     Основные функции, определенные в скрипте:
     - `main()`: Главная функция, которая запускает весь процесс, управляет циклом обработки ОГРН, переключением ключей и сохранением прогресса.
-    - `load_api_keys(file_path)`: Загружает ключи доступа к API из текстового файла.
-    - `load_api_usage(file_path)`: Загружает данные об использовании ключей API из JSON файла.
-    - `save_api_usage(api_usage, file_path)`: Сохраняет текущую статистику использования ключей API в JSON файл.
+    - `load_api_keys(file_path)`: Загружает ключи доступа к API из текстового файла (`scraper_files.py`).
+    - `load_api_usage(file_path)`: Загружает данные об использовании ключей API из JSON файла (`scraper_files.py`).
+    - `save_api_usage(api_usage, file_path)`: Сохраняет текущую статистику использования ключей API в JSON файл (атомарно, через временный файл).
+    - `ApiUsageStore`: Отложенная запись статистики ключей: пакетами по числу обновлений и по времени, сразу - при событиях лимита и завершении работы.
     - `clean_api_usage(api_keys, api_usage)`: Удаляет из статистики ключи, которых больше нет в актуальном списке.
-    - `get_available_api_key(api_keys, api_usage)`: Выбирает ключ API, который можно использовать, учитывая дневные лимиты.
-    - `update_api_usage(api_key, api_usage, api_usage_file, success=True)`: Обновляет статистику использования конкретного ключа после запроса.
+    - `get_available_api_key(api_keys, api_usage)`: Ключ API с наибольшим остатком дневного лимита (вершина кучи реестра ключей).
+    - `next_reset_in_window()` / `wait_for_key_reset()`: Ближайший сброс лимита в окне `RESET_WAIT_HOURS` и ожидание его (прерывается по `stop_event`).
+    - `acquire_api_key(api_keys, api_usage)` / `release_api_key(api_key)`: Занимают и освобождают слот ключа для рабочего потока; какой ключ готов к запросу немедленно, решает планировщик скорости.
+    - `concurrency_limiter.AdaptiveLimiter`: Адаптивный (AIMD) лимит одновременных запросов и таймаут запроса по p95/p99 задержки и доле ошибок.
+    - `key_registry.KeyRegistry`: Реестр ключей в памяти: куча доступных ключей по числу использованных запросов (выбор за O(log n)) и колесо таймеров для сброса лимитов.
+    - `extract_meta(raw)`: Достает объект `meta` из сырого ответа API, не разбирая весь JSON.
+    - `snapshot_api_usage(api_keys, api_usage)`: Копия статистики ключей для синхронизации с координатором.
+    - `request_error_class(e)`: Класс ошибки запроса для счетчиков метрик (`timeout`, `connection`, `http_<код>`).
+    - `scraper_metrics.MetricsReporter`: Периодический снимок метрик в `metrics.json` и HTTP-сервер метрик.
+    - `process_ogrn(ogrn, api_keys, api_usage, api_keys_file, api_usage_file, stats, journal, writer)`: Получает данные по одному ОГРН с переключением ключей и передает ответ в очередь записи.
+    - `write_pipeline.WritePipeline`: Ограниченная очередь ответов и пул потоков, которые сжимают и записывают их на диск.
+    - `output_sinks.create_sink(kind, output_dir, codec, segment_bytes)`: Создает выбранный способ сохранения ответов (`files`, `ndjson`, `sqlite`).
+    - `update_api_usage(api_key, api_usage, api_usage_file, success=True, today_request_count=None)`: Обновляет статистику использования конкретного ключа после запроса (с учетом счетчика по данным API); файл записывается уже без общей блокировки.
     - `get_company_data(inn, api_key, api_usage, api_usage_file, proxy=None)`: Делает запрос к API Checko для получения данных по конкретному ОГРН.
-    - `save_to_json(data, inn)`: Сохраняет полученные данные в JSON.GZ файл.
-    - `load_ogrns_from_file(file_path)`: Загружает список ОГРН для обработки из текстового файла.
+    - `is_company_not_found(message)`: Признак того, что компании с таким ОГРН нет (только сообщение о компании/организации, не о ключе или методе API).
+    - `scraper_files.load_ogrns_from_file(file_path)`: Загружает весь список ОГРН в память (используется планировщиком квот).
+    - `response_cache.ResponseCache` / `response_cache.CachingSink`: Кэш ответов с временем получения, TTL и вытеснением LRU; обертка способа сохранения, пропускающая неизмененные ответы.
+    - `ogrn_input.OgrnStream`: Потоковое чтение списка ОГРН (текст, gzip, CSV) с проверкой контрольных сумм, отбрасыванием повторов и прогрессом в байтах.
     - `remove_invalid_api_key(api_key, api_keys, api_usage, api_keys_file)`: Удаляет ключ API из списков и файла, если он оказался недействительным.
     - (Вспомогательные функции для логирования и работы с файлами также используются, но они стандартные или простые)
 
     Импортированные из модулей:
-    - `requests`: Используется для отправки HTTP-запросов к внешнему API Checko.
+    - `requests`: Используется для отправки HTTP-запросов к внешнему API Checko (через `http_client.CheckoClient`).
     - `logging`: Используется для записи подробного журнала работы скрипта.
     - `json`: Используется для работы с данными в формате JSON (чтение/запись статистики ключей и сохранение результатов запросов).
     - `os`: Используется для работы с файловой системой (создание папок, проверка существования файлов, работа с путями).
     - `datetime`, `time`: Используются для работы с датой и временем (формирование имен лог-файлов, отслеживание времени сброса лимитов API).
+    - `threading`, `concurrent.futures`: Используются для параллельных запросов (пул рабочих потоков и общая блокировка статистики ключей).
+    - `socket`: Используется для имени воркера в режиме координатора.
+    - `signal`: Используется для сохранения статистики при получении SIGTERM/SIGINT (например, при отмене задания GitHub Actions).
     - `random`: Используется для добавления случайности (в текущей версии не используется активно, но может применяться для задержек или выбора ключей/прокси).
-    - `gzip`: Используется для сжатия JSON-файлов.
+    - `output_sinks`: Используется для сохранения ответов (`gzip`/`zstandard` для сжатия, `sqlite3` для базы).
 
 4.  **ВХОДНЫЕ ДАННЫЕ:**
-    - `ogrns.txt`: Текстовый файл, содержащий список ОГРН компаний, которые нужно обработать. Каждый ОГРН должен быть на отдельной строке.
+    - `ogrns.txt`: Текстовый файл, содержащий список ОГРН компаний, которые нужно обработать. Каждый ОГРН должен быть на отдельной строке. Файл может быть сжат gzip; можно указать и CSV (`*.csv`, `*.csv.gz`), см. `OGRN_INPUT`. Допускаются ОГРН (13 цифр) и ОГРНИП (15 цифр); номера с неверной контрольной суммой пропускаются.
     - `APIs.txt`: Текстовый файл, содержащий список ключей доступа к API Checko. Каждый ключ должен быть на отдельной строке.
+    - `proxies.txt` (необязательный): Список прокси (`host:port` или полный URL), по одному на строке. Запросы идут через прокси по кругу.
     - `api_count.json`: JSON файл, используемый для хранения статистики использования каждого ключа API (сколько запросов сделано сегодня, когда ожидается сброс лимита). Этот файл создается или обновляется автоматически.
+    - Переменные окружения (необязательные):
+      - `API_CONCURRENCY_PER_KEY`: сколько запросов одновременно может выполняться с одним ключом (по умолчанию 1).
+      - `API_MAX_WORKERS`: общее число рабочих потоков (по умолчанию - число ключей, умноженное на `API_CONCURRENCY_PER_KEY`).
+      - `ADAPTIVE_CONCURRENCY`: `1` (по умолчанию) - подстраивать число одновременных запросов и таймаут под задержки и ошибки API, `0` - постоянное число и таймаут `API_TIMEOUT`.
+      - `API_CONCURRENCY_MIN`: ниже какого числа одновременных запросов адаптивный лимит не опускается (по умолчанию 1).
+      - `API_TIMEOUT`, `API_TIMEOUT_MIN`: верхняя и нижняя граница таймаута запроса в секундах (по умолчанию 30 и 5).
+      - `API_RATE_PER_KEY`, `API_BURST_PER_KEY`: скорость (запросов в секунду) и допустимая серия запросов для одного ключа (по умолчанию 1 и 1).
+      - `API_GLOBAL_RATE`, `API_GLOBAL_BURST`: общее ограничение скорости по всем ключам (по умолчанию не ограничено).
+      - `RESET_WAIT_HOURS`: сколько часов от старта ждать сброса лимита, если все ключи исчерпаны (по умолчанию 0 -
+        не ждать). В GitHub Actions совпадает с окном планировщика (`quota_planner.py --window-hours`).
+      - `COORDINATOR`: путь к базе SQLite или URL HTTP-сервиса координатора (по умолчанию не задан - работа по файлам).
+      - `COORDINATOR_TOKEN`: общий секрет HTTP-сервиса координатора (передается в заголовке `X-Coordinator-Token`).
+      - `COORDINATOR_KEYS`, `COORDINATOR_BATCH`, `COORDINATOR_LEASE_SECONDS`, `WORKER_ID`: сколько ключей арендовать за раз (10; когда у арендованных исчерпан лимит, воркер арендует еще), по сколько ОГРН (50), срок аренды в секундах (300) и имя воркера (по умолчанию имя машины и PID).
+      - `OUTPUT_SINK`: способ сохранения ответов: `files` (по умолчанию), `ndjson` или `sqlite`.
+      - `OUTPUT_CODEC`, `OUTPUT_SEGMENT_MB`: сжатие для `ndjson`/`sqlite` (`gzip` или `zstd`) и размер сегмента NDJSON в мегабайтах (по умолчанию 64).
+      - `WRITER_THREADS`, `WRITE_QUEUE_SIZE`: число потоков сжатия и записи (по умолчанию 2) и размер очереди записи (по умолчанию вдвое больше числа рабочих потоков). Когда очередь заполнена, рабочие потоки ждут.
+      - `API_USAGE_FLUSH_EVERY`, `API_USAGE_FLUSH_SECONDS`: как часто записывать `api_count.json` (по умолчанию каждые 20 обновлений или 10 секунд).
+      - `API_MAX_RETRIES`, `API_BACKOFF_BASE`, `API_BACKOFF_MAX`: число повторов временных ошибок и параметры экспоненциальной паузы (по умолчанию 3, 0.5 и 30 секунд).
+      - `API_MAX_SENT_RETRIES`: сколько из этих повторов может приходиться на запросы, которые могли дойти до API (таймаут чтения, разрыв после отправки, 5xx; по умолчанию 1). Каждая такая попытка сразу засчитывается в счетчик ключа.
+      - `OGRN_INPUT`: файл со списком ОГРН (по умолчанию `ogrns.txt`): текст, gzip или CSV.
+      - `OGRN_CSV_COLUMN`: номер (с 0) или название колонки CSV с ОГРН (по умолчанию колонка "ОГРН"/"ogrn" из заголовка или первая).
+      - `OGRN_DEDUP`: как отбрасывать повторы: `set` (точное множество, по умолчанию), `bloom` (фильтр Блума фиксированного размера) или `none`.
+      - `OGRN_BLOOM_CAPACITY`, `OGRN_BLOOM_ERROR`: на сколько ОГРН рассчитан фильтр Блума и доля ложных срабатываний (по умолчанию 10 млн и 1e-5, около 30 МБ; ложное срабатывание означает пропуск уникального ОГРН).
+      - `RESPONSE_CACHE`: файл SQLite кэша ответов, например `JSONs/cache.sqlite` (по умолчанию кэш не используется). При первом запуске в кэш попадают уже сохраненные ОГРН как самые устаревшие.
+      - `CACHE_TTL_HOURS`: срок годности ответа в кэше в часах (по умолчанию 168 - неделя).
+      - `CACHE_MAX_MB`: объем тел ответов в кэше (по умолчанию 512 МБ); сверх него тела вытесняются по давности обращения, записи о времени и хеше остаются.
+      - `REFRESH`: `1` - режим обновления: запрашиваются только записи кэша старше `CACHE_TTL_HOURS`, от самых старых (файл `ogrns.txt` не нужен).
+      - `CHECKO_API_URL`: адрес API Checko (по умолчанию `https://api.checko.ru/v2/company`). Используется для замеров на локальной заглушке `benchmarks/mock_checko.py`.
+      - `METRICS_PORT`, `METRICS_HOST`: порт и адрес HTTP-сервера метрик (по умолчанию сервер не запускается; адрес 127.0.0.1). `/metrics` - формат Prometheus, `/metrics.json` - JSON.
+      - `METRICS_SNAPSHOT_SECONDS`: как часто записывать `metrics.json` (по умолчанию раз в 30 секунд).
+      - `METRICS_SAMPLES`: файл, в который в конце работы записываются все наблюдения гистограмм (время запросов,
+        ожидания ключа и т.д.) для точных перцентилей в замерах (по умолчанию не записываются).
 
 5.  **ВЫХОДНЫЕ ДАННЫЕ:**
-    - `JSONs/{ОГРН}.json.gz`: Папка и сжатые JSON.GZ файлы, содержащие полные данные, полученные от API Checko для каждого успешно обработанного ОГРН. Имя каждого файла совпадает с ОГРН компании.
-    - `api_count.json`: Обновленный JSON файл со статистикой использования ключей API после каждого запроса.
+    - `JSONs/{ОГРН}.json.gz`: Папка и сжатые JSON.GZ файлы, содержащие полные данные, полученные от API Checko для каждого успешно обработанного ОГРН (ответ API в исходном виде). Имя каждого файла совпадает с ОГРН компании.
+    - `JSONs/segments/part-NNNNN.ndjson.gz` и `JSONs/segments/index.tsv` (при `OUTPUT_SINK=ndjson`): Сегменты NDJSON по строке JSON на компанию (ответ API как есть; многострочный ответ - в компактном виде) и индекс ОГРН -> сегмент, смещение, длина.
+    - `JSONs/responses.sqlite` (при `OUTPUT_SINK=sqlite`): Таблица `responses` со сжатым JSON по каждому ОГРН.
+    - `api_count.json`: Обновленный JSON файл со статистикой использования ключей API. Записывается пакетами (каждые `API_USAGE_FLUSH_EVERY` обновлений или `API_USAGE_FLUSH_SECONDS` секунд), сразу при достижении лимита ключа и при завершении работы. Запись атомарная: сначала во временный файл, затем переименование.
+    - Кэш ответов (при `RESPONSE_CACHE`): таблицы `entries` (ОГРН, хеш, время получения и изменения) и `objects` (сжатые тела ответов по хешу).
+    - `metrics.json`: Снимок метрик: гистограммы времени (`request`, `key_wait`, `write_submit_wait`, `write_queue_wait`, `write`, `compress`) с p50/p95/p99, счетчики по ключам (`requests`, `ok`, `limit_hits`, `unauthorized`, `not_found`, `error_*`; ключи маскируются), ОГРН и запросов в минуту, остаток квоты и оценки времени до ее исчерпания и до конца списка. Записывается периодически и при завершении работы.
+    - Файл `METRICS_SAMPLES` (если задан): все наблюдения гистограмм в секундах, `{"request": [...], ...}`.
+    - `progress_journal.txt`: Журнал прогресса, строки `ОГРН<TAB>статус` (`ok`, `dead`, `retry`). Только дописывается; при повторном запуске определяет, какие ОГРН еще нужно обработать.
     - `logs/YYYYMMDD_HHMMSS.log`: Основной файл лога, содержащий все информационные сообщения, предупреждения и ошибки.
     - `logs/issues_report_YYYYMMDD_HHMMSS.log`: Дополнительный файл лога, содержащий только предупреждения (WARNING) и ошибки (ERROR, CRITICAL).
 
 6.  **РАБОЧИЙ ЦИКЛ:**
-    Скрипт запускается как обычный Python скрипт из командной строки (или среды разработки), выполняя код в блоке `if __name__ == "__main__":`. У него нет параметров командной строки. Он последовательно проходит по списку ОГРН, полученных из файла, делает запросы, сохраняет данные.
+    Скрипт запускается как обычный Python скрипт из командной строки (или среды разработки), выполняя код в блоке `if __name__ == "__main__":`. У него нет параметров командной строки, настройки передаются переменными окружения. Рабочие потоки забирают ОГРН из общего списка, делают запросы и сохраняют данные; доступ к статистике ключей защищен общей блокировкой.
 
 7.  **ВЗАИМОДЕЙСТВИЕ С ДРУГИМИ МОДУЛЯМИ:**
-    Скрипт является самостоятельным исполняемым модулем и не предоставляет функции или классы для импорта другими частями проекта. Он активно использует стандартные библиотеки Python (`os`, `json`, `logging` и другие) и внешнюю библиотеку `requests` для взаимодействия с веб-сервисом.
+    Скрипт является самостоятельным исполняемым модулем. Функции загрузки ключей, ОГРН и статистики вынесены в `scraper_files.py`, их использует и планировщик квот `quota_planner.py` (сам скрипт он не импортирует), который перед запуском воркеров распределяет ключи и ОГРН между шардами по остаткам дневных лимитов. В режиме координатора скрипт вместо файлов работает с `coordinator.py`: несколько воркеров на разных машинах делят одну очередь ОГРН и пул ключей, а ключ в каждый момент арендован только одним воркером. Скрипт активно использует стандартные библиотеки Python (`os`, `json`, `logging` и другие) и внешнюю библиотеку `requests` для взаимодействия с веб-сервисом.
 
 8.  **ЗАВИСИМОСТИ:**
     - Внешние библиотеки: `requests` (необходимо установить с помощью pip: `pip install requests`).
-    - Стандартные библиотеки Python: `json`, `os`, `time`, `datetime`, `random`, `logging`, `gzip`.
-    - Внутренние модули проекта: Нет (скрипт работает автономно, взаимодействуя с файлами проекта напрямую).
+    - Необязательные библиотеки: `zstandard` (сжатие zstd для `OUTPUT_CODEC=zstd`), `pyarrow` (выгрузка таблиц `extract_tables.py` в Parquet).
+    - Стандартные библиотеки Python: `json`, `os`, `time`, `datetime`, `random`, `logging`, `gzip`, `sqlite3`, `threading`, `signal`, `socket`, `csv`, `hashlib`, `concurrent.futures`, `http.server` (HTTP-сервер метрик).
+    - Внутренние модули проекта: `rate_scheduler.py` (планировщик скорости запросов по ключам), `http_client.py` (пул соединений, повторы, прокси), `progress_journal.py` (журнал прогресса), `output_sinks.py` (способы сохранения ответов), `write_pipeline.py` (фоновая запись), `coordinator.py` (общий координатор воркеров), `scraper_metrics.py` (метрики), `ogrn_input.py` (потоковое чтение списков ОГРН), `response_cache.py` (кэш ответов), `key_registry.py` (реестр ключей и их лимитов), `scraper_files.py` (файлы ключей, статистики и ОГРН, дневной лимит API), `concurrency_limiter.py` (адаптивный лимит одновременных запросов).
 
 9.  **МЕСТО В АРХИТЕКТУРЕ ПРОЕКТА:**
-    Этот скрипт является частью этапа "Извлечение" (Extract) в общем процессе сбора и обработки данных о компаниях. Он отвечает за получение (скачивание) первичных структурированных данных с сервиса Checko. Скрипты, следующие за этим, вероятно, будут заниматься обработкой и анализом скачанных JSON файлов.
+    Этот скрипт является частью этапа "Извлечение" (Extract) в общем процессе сбора и обработки данных о компаниях. Он отвечает за получение (скачивание) первичных структурированных данных с сервиса Checko. Следующий этап - `extract_tables.py`: он в пуле процессов разбирает сохраненные ответы (любым способом сохранения) в таблицы SQLite с индексами (компании, ОКВЭД, учредители, финансы) и, при наличии `pyarrow`, в Parquet. Обновление инкрементальное: разбираются только новые и изменившиеся (по хешу содержимого) ответы.
 
 10. **ОГРАНИЧЕНИЯ И ОСОБЕННОСТИ:**
     - **Зависимость от API Checko:** Работа скрипта полностью зависит от доступности и стабильности API Checko.
-    - **Лимиты API:** Скрипт учитывает дневной лимит запросов на каждый ключ (установлен в коде как 99 запросов). При достижении лимита он пытается переключиться на другой ключ. Если все ключи исчерпаны, работа останавливается.
-    - **Обработка ошибок:** Скрипт обрабатывает стандартные ошибки HTTP (например, 401 Unauthorized для недействительных ключей, ошибки превышения лимита). Ошибки запросов (проблемы с сетью, таймауты) также перехватываются.
-    - **Отслеживание прогресса:** Прогресс отслеживается через файлы статистики и наличие сохраненных JSON.GZ-файлов. Если скрипт прервется, при следующем запуске он продолжит с необработанных ОГРН (для которых еще нет сохраненных файлов).
-    - **Скорость:** Между запросами к API есть фиксированная задержка в 1 секунду для снижения нагрузки на сервер API.
-    - **Прокси:** В коде есть упоминание прокси, но в текущей логике они не используются активно для запросов к API Checko (параметр `proxy=None` в `get_company_data`).
+    - **Лимиты API:** Скрипт учитывает дневной лимит запросов на каждый ключ (установлен в коде как 99 запросов). При достижении лимита он пытается переключиться на другой ключ. Если все ключи исчерпаны, работа останавливается. Состояние ключей держится в памяти (`key_registry.py`): время сброса разбирается один раз при загрузке, выбор ключа не перебирает все ключи, а сброс лимита срабатывает по таймеру - и тогда, когда о превышении лимита сообщил сам API.
+    - **Обработка ошибок:** Скрипт обрабатывает стандартные ошибки HTTP (например, 401 Unauthorized для недействительных ключей, ошибки превышения лимита). Временные ошибки (проблемы с сетью, таймауты, ответы 5xx) сначала повторяются, и только затем ОГРН считается необработанным.
+    - **Прерывание:** При SIGTERM/SIGINT статистика ключей сразу записывается на диск, новые ОГРН не берутся в работу, текущие запросы завершаются. Повторный сигнал завершает процесс немедленно.
+    - **Отслеживание прогресса:** Прогресс отслеживается через файлы статистики и журнал `progress_journal.txt`, который читается один раз при старте. Прогресс чтения списка ОГРН выводится как смещение в байтах и доля файла, общее число ОГРН заранее не подсчитывается. Если скрипт прервется, при следующем запуске он продолжит с необработанных ОГРН. Если журнала нет (например, после старых версий скрипта), он создается по уже сохраненным результатам (для отдельных файлов - по списку файлов в папке `JSONs`).
+    - **Скорость:** Запросы выполняются параллельно, по одному (или `API_CONCURRENCY_PER_KEY`) на ключ. Скорость каждого ключа ограничена ведром токенов (по умолчанию 1 запрос в секунду), при необходимости задается и общее ограничение. Пропущенные ОГРН паузы не добавляют. Число одновременных запросов подстраивается (`concurrency_limiter.py`): растет на 1, пока p95 задержки и доля ошибок в норме, и снижается в 0.7 раза при таймаутах, ответах 429/5xx и всплесках задержки. Таймаут запроса - p99 задержки, умноженный на 4, в пределах `API_TIMEOUT_MIN`..`API_TIMEOUT`.
+    - **Замеры:** `benchmarks/bench_scraper.py` запускает скрипт целиком на локальной заглушке API (`benchmarks/mock_checko.py`) и выводит пропускную способность, задержки, процессорное время, пиковую память и объем записанных данных.
+    - **Прокси:** Если есть файл `proxies.txt`, запросы распределяются по прокси из него по кругу. Параметр `proxy` в `get_company_data` задает конкретный прокси для запроса.
 """
 
 import requests
@@ -85,7 +151,24 @@ import time
 import datetime
 import random
 import logging
-import gzip
+import threading
+import signal
+import socket
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from concurrency_limiter import AdaptiveLimiter
+from coordinator import CoordinatorSession, open_coordinator
+from http_client import CheckoClient, load_proxies
+from key_registry import KeyRegistry
+from ogrn_input import OgrnStream
+from output_sinks import create_sink
+from progress_journal import ProgressJournal, STATUS_OK, STATUS_DEAD, STATUS_RETRY, FINAL_STATUSES
+from rate_scheduler import RateScheduler
+from response_cache import CachingSink, ResponseCache
+from scraper_files import API_DAILY_LIMIT, API_RESET_HOURS, load_api_keys, load_api_usage, write_file_atomic
+from scraper_metrics import MetricsReporter, metrics
+from write_pipeline import WritePipeline
 
 import datetime
 from datetime import timezone
@@ -125,38 +208,145 @@ logger.addHandler(console_handler)
 logger.info(f"Начало работы скрипта. Основной лог: {main_log_file}, Отчет об ошибках: {issues_log_file}")
 # --- Конец настройки логирования ---
 
-API_URL = "https://api.checko.ru/v2/company"
-API_DAILY_LIMIT = 99
-API_RESET_HOURS = 25  # 24 часа + 1 час запаса для гарантированного сброса
-
-def load_api_keys(file_path):
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            api_keys = [line.strip() for line in f if line.strip()]
-        logger.info(f"Загружено {len(api_keys)} API-ключей из файла {file_path}")
-        return api_keys
-    except Exception as e:
-        logger.error(f"Ошибка при загрузке списка API-ключей из файла {file_path}: {e}")
-        return []
-
-def load_api_usage(file_path):
-    try:
-        if os.path.exists(file_path):
-            with open(file_path, 'r', encoding='utf-8') as f:
-                return json.load(f)
-        logger.info(f"Файл статистики {file_path} не существует. Создаем новый.")
-        return {}
-    except Exception as e:
-        logger.error(f"Ошибка при загрузке статистики использования API-ключей: {e}")
-        return {}
+API_URL = os.environ.get("CHECKO_API_URL", "https://api.checko.ru/v2/company")  # Подменяется для замеров на заглушке API
+API_RATE_PER_KEY = float(os.environ.get("API_RATE_PER_KEY", "1"))  # Запросов в секунду на один ключ
+API_BURST_PER_KEY = float(os.environ.get("API_BURST_PER_KEY", "1"))  # Сколько запросов ключ может отправить подряд без паузы
+API_GLOBAL_RATE = float(os.environ.get("API_GLOBAL_RATE", "0"))  # Запросов в секунду по всем ключам (0 - без ограничения)
+API_GLOBAL_BURST = float(os.environ.get("API_GLOBAL_BURST", "1"))
+API_MAX_RETRIES = int(os.environ.get("API_MAX_RETRIES", "3"))  # Повторы при таймаутах, разрывах соединения и ответах 5xx
+API_MAX_SENT_RETRIES = int(os.environ.get("API_MAX_SENT_RETRIES", "1"))  # ...из них - запросов, которые могли дойти до API
+API_BACKOFF_BASE = float(os.environ.get("API_BACKOFF_BASE", "0.5"))  # Базовая пауза (сек) экспоненциального повтора
+API_BACKOFF_MAX = float(os.environ.get("API_BACKOFF_MAX", "30"))
+OUTPUT_SINK = os.environ.get("OUTPUT_SINK", "files")  # files | ndjson | sqlite
+OUTPUT_CODEC = os.environ.get("OUTPUT_CODEC", "gzip")  # gzip | zstd (для ndjson и sqlite)
+OUTPUT_SEGMENT_MB = int(os.environ.get("OUTPUT_SEGMENT_MB", "64"))  # Размер сегмента NDJSON
+WRITER_THREADS = int(os.environ.get("WRITER_THREADS", "2"))  # Потоков сжатия и записи ответов
+WRITE_QUEUE_SIZE = int(os.environ.get("WRITE_QUEUE_SIZE", "0"))  # 0 - вдвое больше числа рабочих потоков
+API_USAGE_FLUSH_EVERY = int(os.environ.get("API_USAGE_FLUSH_EVERY", "20"))  # Записывать api_count.json каждые N обновлений
+API_USAGE_FLUSH_SECONDS = float(os.environ.get("API_USAGE_FLUSH_SECONDS", "10"))  # ...или не реже, чем раз в T секунд
+RESET_WAIT_HOURS = float(os.environ.get("RESET_WAIT_HOURS", "0"))  # Ждать сброса лимита, если он наступит за N часов от старта
+COORDINATOR = os.environ.get("COORDINATOR", "")  # Файл SQLite или URL сервиса координатора (пусто - работа по файлам)
+COORDINATOR_TOKEN = os.environ.get("COORDINATOR_TOKEN", "")  # Общий секрет для HTTP-сервиса координатора
+COORDINATOR_KEYS = int(os.environ.get("COORDINATOR_KEYS", "10"))  # Сколько ключей арендовать у координатора
+COORDINATOR_BATCH = int(os.environ.get("COORDINATOR_BATCH", "50"))  # По сколько ОГРН арендовать за раз
+COORDINATOR_LEASE_SECONDS = int(os.environ.get("COORDINATOR_LEASE_SECONDS", "300"))  # Срок аренды, продлевается каждую треть срока
+WORKER_ID = os.environ.get("WORKER_ID") or f"{socket.gethostname()}-{os.getpid()}"
+# Сообщение API о том, что компании с таким ОГРН нет и повторный запрос бесполезен (статус `dead` необратим,
+# поэтому нужен именно "компания/организация ... не найдена", а не любое "не найден")
+API_NOT_FOUND_PATTERN = re.compile(
+    r"\b(?:компани|организаци|юридическ\w*\s+лиц|company|organi[sz]ation)\w*(?:\s+[^\s,.;:]+){0,4}?\s+(?:не\s+найден|not\s+found)",
+    re.IGNORECASE,
+)
+# ...и если в сообщении речь о ключе или методе API, это не про компанию: такой ОГРН остается `retry`
+API_NOT_FOUND_EXCLUDE = re.compile(r"ключ|токен|метод|\bkey\b|token|method|endpoint", re.IGNORECASE)
+API_CONCURRENCY_PER_KEY = int(os.environ.get("API_CONCURRENCY_PER_KEY", "1"))  # Одновременных запросов на один ключ
+API_MAX_WORKERS = int(os.environ.get("API_MAX_WORKERS", "0"))  # 0 - по числу слотов (ключи * запросы на ключ)
+ADAPTIVE_CONCURRENCY = os.environ.get("ADAPTIVE_CONCURRENCY", "1") == "1"  # Подстраивать число одновременных запросов и таймаут
+API_CONCURRENCY_MIN = int(os.environ.get("API_CONCURRENCY_MIN", "1"))  # Ниже этого адаптивный лимит не опускается
+API_TIMEOUT = float(os.environ.get("API_TIMEOUT", "30"))  # Таймаут запроса (сек); при адаптации - верхняя граница
+API_TIMEOUT_MIN = float(os.environ.get("API_TIMEOUT_MIN", "5"))  # Нижняя граница адаптивного таймаута
+OGRN_INPUT = os.environ.get("OGRN_INPUT", "ogrns.txt")  # Список ОГРН: текст, gzip или CSV
+OGRN_CSV_COLUMN = os.environ.get("OGRN_CSV_COLUMN", "")  # Номер или название колонки CSV (пусто - найти по заголовку)
+OGRN_DEDUP = os.environ.get("OGRN_DEDUP", "set")  # set | bloom | none
+OGRN_BLOOM_CAPACITY = int(os.environ.get("OGRN_BLOOM_CAPACITY", "10000000"))  # На сколько ОГРН рассчитан фильтр Блума
+OGRN_BLOOM_ERROR = float(os.environ.get("OGRN_BLOOM_ERROR", "1e-5"))  # Доля ложных срабатываний фильтра Блума
+RESPONSE_CACHE = os.environ.get("RESPONSE_CACHE", "")  # Файл SQLite кэша ответов (пусто - без кэша)
+CACHE_TTL_HOURS = float(os.environ.get("CACHE_TTL_HOURS", "168"))  # Срок годности ответа в кэше
+CACHE_MAX_MB = int(os.environ.get("CACHE_MAX_MB", "512"))  # Объем тел ответов в кэше, сверх него - вытеснение LRU
+REFRESH = os.environ.get("REFRESH", "0") == "1"  # Режим обновления: запрашивать только устаревшие записи кэша
+METRICS_PORT = int(os.environ.get("METRICS_PORT", "0"))  # Порт HTTP для /metrics и /metrics.json (0 - не запускать)
+METRICS_HOST = os.environ.get("METRICS_HOST", "127.0.0.1")
+METRICS_SNAPSHOT_SECONDS = float(os.environ.get("METRICS_SNAPSHOT_SECONDS", "30"))  # Как часто записывать metrics.json
+METRICS_SAMPLES = os.environ.get("METRICS_SAMPLES", "")  # Файл для всех наблюдений гистограмм (для замеров; пусто - нет)
+
+# Общая блокировка для статистики ключей: ее разделяют все рабочие потоки
+api_usage_lock = threading.RLock()
+api_key_released = threading.Condition(api_usage_lock)
+# Реестр ключей: выбор ключа с наибольшим остатком лимита за O(log n), сбросы лимитов по таймеру
+key_registry = KeyRegistry(API_DAILY_LIMIT, API_CONCURRENCY_PER_KEY, API_RESET_HOURS, api_usage_lock)
+# В режиме координатора - функция, которая арендует еще ключи, когда у арендованных исчерпан лимит
+api_key_source = None
+api_key_lease_lock = threading.Lock()
+stop_event = threading.Event()  # Запрошено завершение (сигнал или исчерпание ключей): ожидание ключа прерывается
+run_started = time.time()  # Начало запуска: от него отсчитывается окно ожидания сброса лимитов (RESET_WAIT_HOURS)
+rate_scheduler = RateScheduler(API_RATE_PER_KEY, API_BURST_PER_KEY, API_GLOBAL_RATE, API_GLOBAL_BURST)
+# Адаптивный лимит одновременных запросов (верхняя граница задается в main по числу рабочих потоков)
+concurrency_limiter = AdaptiveLimiter(1, API_CONCURRENCY_MIN, min_timeout=API_TIMEOUT_MIN, max_timeout=API_TIMEOUT)
+http_client = CheckoClient(max_retries=API_MAX_RETRIES, backoff_base=API_BACKOFF_BASE, backoff_max=API_BACKOFF_MAX,
+                           max_sent_retries=API_MAX_SENT_RETRIES,
+                           observer=concurrency_limiter.observe if ADAPTIVE_CONCURRENCY else None)
 
 def save_api_usage(api_usage, file_path):
     try:
-        with open(file_path, 'w', encoding='utf-8') as f:
-            json.dump(api_usage, f, indent=4, ensure_ascii=False)
+        with api_usage_lock:
+            content = json.dumps(api_usage, indent=4, ensure_ascii=False)
+        write_file_atomic(file_path, content)
     except Exception as e:
         logger.error(f"Ошибка при сохранении статистики использования API-ключей: {e}")
 
+class ApiUsageStore:
+    """Отложенная (write-behind) запись статистики ключей в api_count.json.
+
+    Изменения копятся в памяти и записываются на диск каждые `flush_every` обновлений, не реже раза
+    в `flush_interval` секунд (фоновым потоком), а также сразу при событиях лимита и при завершении работы."""
+
+    def __init__(self, flush_every, flush_interval):
+        self.flush_every = max(1, flush_every)
+        self.flush_interval = flush_interval
+        self.api_usage = None
+        self.file_path = None
+        self.pending = 0
+        self.seq = 0
+        self.written_seq = 0
+        self.last_flush = time.monotonic()
+        self.write_lock = threading.Lock()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def save(self, api_usage, file_path, force=False):
+        """Отмечает изменение статистики и при необходимости записывает файл. Вызывается без `api_usage_lock`:
+        под блокировкой только снимается снимок, запись и fsync идут после ее освобождения."""
+        with api_usage_lock:
+            self.api_usage, self.file_path = api_usage, file_path
+            self.pending += 1
+            self.seq += 1
+            due = force or self.pending >= self.flush_every or time.monotonic() - self.last_flush >= self.flush_interval
+        if due:
+            self.flush()
+
+    def flush(self):
+        with api_usage_lock:
+            if not self.pending or self.api_usage is None:
+                return
+            content = json.dumps(self.api_usage, indent=4, ensure_ascii=False)
+            file_path, seq = self.file_path, self.seq
+            self.pending = 0
+            self.last_flush = time.monotonic()
+        with self.write_lock:
+            if seq <= self.written_seq:
+                return # Более свежий снимок уже записан другим потоком
+            try:
+                write_file_atomic(file_path, content)
+                self.written_seq = seq
+            except Exception as e:
+                logger.error(f"Ошибка при сохранении статистики использования API-ключей: {e}")
+
+    def start(self):
+        def run():
+            while not self._stop.wait(self.flush_interval):
+                self.flush()
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="api-usage-flush", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread and self._thread is not threading.current_thread():
+            self._thread.join()
+        self.flush()
+
+api_usage_store = ApiUsageStore(API_USAGE_FLUSH_EVERY, API_USAGE_FLUSH_SECONDS)
+
 def clean_api_usage(api_keys, api_usage):
     keys_to_remove = [key for key in api_usage if key not in api_keys]
     if keys_to_remove:
@@ -165,258 +355,523 @@ def clean_api_usage(api_keys, api_usage):
         logger.info(f"Удалено {len(keys_to_remove)} неактуальных API-ключей из статистики: {', '.join(keys_to_remove)}")
     return api_usage
 
+def ensure_key_registry(api_keys, api_usage):
+    """Загружает реестр ключей, если он построен не по этому словарю статистики."""
+    with api_usage_lock:
+        if key_registry.api_usage is not api_usage:
+            key_registry.load(api_keys, api_usage)
+
 def get_available_api_key(api_keys, api_usage):
-    now = datetime.datetime.now(timezone.utc)
-    available_keys = []
-    
-    for key in api_keys:
-        if key not in api_usage:
-            api_usage[key] = {"total_requests": 0, "today_requests": 0, "last_used": None, "last_reset": None}
-        
-        key_data = api_usage[key]
-        
-        if "next_reset" in key_data and key_data["next_reset"]:
-            try:
-                next_reset_time = datetime.datetime.fromisoformat(key_data["next_reset"])
-                if next_reset_time.tzinfo is None: # Если время из файла naive (без часового пояса)
-                    next_reset_time = next_reset_time.replace(tzinfo=timezone.utc) # Делаем его aware UTC
-                else: # Если время уже aware, убедимся, что оно в UTC
-                    next_reset_time = next_reset_time.astimezone(timezone.utc)
-
-                if now >= next_reset_time:
-                    logger.info(f"Сброс счетчика для ключа ...{key[-4:]} по таймеру (UTC).")
-                    key_data["today_requests"] = 0
-                    key_data.pop("next_reset", None)
-                    key_data["last_reset"] = now.isoformat()
-            except (ValueError, TypeError):
-                 logger.warning(f"Некорректный формат времени сброса для ключа ...{key[-4:]}. Сбрасываем счетчик.")
-                 key_data["today_requests"] = 0
-                 key_data.pop("next_reset", None)
-
-        if key_data["today_requests"] < API_DAILY_LIMIT:
-            available_keys.append((key, key_data["today_requests"]))
-    
-    if available_keys:
-        available_keys.sort(key=lambda x: x[1])
-        selected_key = available_keys[0][0]
-        logger.debug(f"Выбран API-ключ: ...{selected_key[-4:]}, использовано запросов: {api_usage[selected_key]['today_requests']}")
+    """Ключ с наибольшим остатком дневного лимита (вершина кучи реестра, без перебора всех ключей)."""
+    ensure_key_registry(api_keys, api_usage)
+    selected_key = key_registry.peek()
+    if selected_key:
+        logger.debug(f"Выбран API-ключ: ...{selected_key[-4:]}, использовано запросов: {key_registry.today_requests(selected_key)}")
         return selected_key
     
     logger.warning("Все API-ключи достигли дневного лимита запросов!")
     return None
 
+def acquire_api_key(api_keys, api_usage):
+    """Занимает слот ключа с наибольшим остатком лимита, с которым планировщик скорости разрешает отправить
+    запрос немедленно. Ждет ровно столько, сколько нужно до появления токена или свободного слота.
+    Возвращает None, когда у всех ключей исчерпан дневной лимит и новых ключей взять негде или запрошено завершение."""
+    started = time.monotonic()
+    ensure_key_registry(api_keys, api_usage)
+    while True:
+        with api_key_released:
+            while True:
+                if stop_event.is_set():
+                    return None
+                global_delay = rate_scheduler.global_delay()
+                if global_delay > 0 and key_registry.peek():
+                    api_key_released.wait(timeout=global_delay)
+                    continue
+                api_key, delay = key_registry.acquire(rate_scheduler.try_key)
+                if api_key:
+                    metrics.observe("key_wait", time.monotonic() - started)
+                    logger.debug(f"Выбран API-ключ: ...{api_key[-4:]}, использовано запросов: {key_registry.today_requests(api_key)}")
+                    return api_key
+                if delay is not None:
+                    api_key_released.wait(timeout=delay)
+                elif key_registry.in_flight_total:
+                    api_key_released.wait(timeout=1) # Все слоты заняты - ждем освобождения
+                else:
+                    break
+        # Аренда новых ключей идет без общей блокировки: это запрос к координатору
+        if stop_event.is_set():
+            return None
+        if not lease_more_api_keys(api_keys, api_usage) and not wait_for_key_reset():
+            if not stop_event.is_set():
+                logger.warning("Все API-ключи достигли дневного лимита запросов!")
+            return None
+
+def next_reset_in_window():
+    """Ближайший сброс лимита (секунды UTC), если он наступит в пределах `RESET_WAIT_HOURS` от начала запуска, иначе None."""
+    next_reset = key_registry.earliest_reset()
+    if next_reset is None or next_reset > run_started + RESET_WAIT_HOURS * 3600:
+        return None
+    return next_reset
+
+def wait_for_key_reset():
+    """Если лимит какого-то ключа сбросится в пределах `RESET_WAIT_HOURS` от начала запуска, ждет сброса.
+    Возвращает False, если ждать нечего или во время ожидания запрошено завершение (`stop_event`)."""
+    next_reset = next_reset_in_window()
+    if next_reset is None:
+        return False
+    delay = max(0.0, next_reset - time.time())
+    if delay > 0:
+        logger.info(f"Все API-ключи исчерпаны, ближайший сброс лимита через {delay:.0f} с. Ожидание.")
+        with api_key_released:
+            # Обработчик сигнала будит ожидающих через notify_all
+            api_key_released.wait_for(stop_event.is_set, timeout=delay + key_registry.wheel.resolution)
+    if stop_event.is_set():
+        return False
+    key_registry.advance()
+    return True
+
+def lease_more_api_keys(api_keys, api_usage):
+    """В режиме координатора арендует еще ключи, когда у арендованных исчерпан лимит.
+    Возвращает True, если появились ключи, с которыми можно работать."""
+    if api_key_source is None:
+        return False
+    with api_key_lease_lock:
+        with api_usage_lock:
+            if key_registry.peek() or key_registry.in_flight_total:
+                return True # Пока ждали, ключи арендовал другой поток (и, возможно, уже занял их слоты)
+        leased = {key: usage for key, usage in api_key_source().items() if key not in api_usage}
+        if not leased:
+            return False
+        with api_key_released:
+            for key, usage in leased.items():
+                api_usage[key] = usage
+                api_keys.append(key)
+            key_registry.add(leased)
+            api_key_released.notify_all()
+            available = key_registry.peek() is not None
+        logger.info(f"Арендовано еще {len(leased)} API-ключей, с остатком лимита: {'есть' if available else 'нет'}.")
+        return available
+
+def release_api_key(api_key):
+    with api_key_released:
+        key_registry.release(api_key)
+        api_key_released.notify() # Освободился один слот - будим один ожидающий поток
+
 # ИЗМЕНЕНО: Исправлена логика расчета времени сброса лимита на "плавающее окно 24+1 час"
-def update_api_usage(api_key, api_usage, api_usage_file, success=True):
-    """Обновляет статистику использования API-ключа."""
-    now = datetime.datetime.now(timezone.utc)
-    if api_key not in api_usage:
-        api_usage[api_key] = {"total_requests": 0, "today_requests": 0, "last_used": None, "last_reset": None}
-    
-    if success:
-        api_usage[api_key]["total_requests"] += 1
-        api_usage[api_key]["today_requests"] += 1
-        api_usage[api_key]["last_used"] = now.isoformat()
-        
-        if api_usage[api_key]["today_requests"] >= API_DAILY_LIMIT:
-            # Устанавливаем сброс ровно через API_RESET_HOURS (25) часов от текущего момента
-            next_reset_time = now + datetime.timedelta(hours=API_RESET_HOURS)
-            api_usage[api_key]["next_reset"] = next_reset_time.isoformat()
+def update_api_usage(api_key, api_usage, api_usage_file, success=True, today_request_count=None):
+    """Обновляет статистику использования API-ключа (через реестр ключей, который пишет и в `api_usage`).
+    `today_request_count` - счетчик запросов ключа по данным API, он учитывает и сброс счетчика на стороне API.
+    Вызывается без `api_usage_lock`: статистика меняется под блокировкой, файл записывается после нее."""
+    with api_usage_lock:
+        if today_request_count is not None and api_key in api_usage:
+            if key_registry.today_requests(api_key) > today_request_count:
+                logger.info(f"Обнаружен сброс счетчика API для ключа ...{api_key[-4:]}: {key_registry.today_requests(api_key)} -> {today_request_count}")
+                api_usage[api_key]["last_reset"] = datetime.datetime.now(timezone.utc).isoformat()
+            key_registry.set_today_requests(api_key, today_request_count)
+        # Сброс назначается ровно через API_RESET_HOURS (25) часов от текущего момента
+        next_reset = key_registry.record_request(api_key, success)
+        if next_reset is not None:
+            next_reset_time = datetime.datetime.fromtimestamp(next_reset, timezone.utc)
             logger.warning(f"Достигнут дневной лимит для ключа ...{api_key[-4:]}. Следующий сброс в UTC: {next_reset_time.strftime('%Y-%m-%d %H:%M:%S')}")
-    
-    save_api_usage(api_usage, api_usage_file)
+        
+        # На диск сразу уходят только события лимита, остальные изменения записываются пакетами
+        limit_reached = key_registry.today_requests(api_key) >= API_DAILY_LIMIT
+    # Запись файла - уже без общей блокировки, чтобы fsync не задерживал выбор ключей другими потоками
+    api_usage_store.save(api_usage, api_usage_file, force=limit_reached)
     return api_usage
 
+def is_company_not_found(message):
+    """Сообщение API означает, что компании с таким ОГРН нет (ОГРН получит необратимый статус `dead`)."""
+    return bool(API_NOT_FOUND_PATTERN.search(message)) and not API_NOT_FOUND_EXCLUDE.search(message)
+
+json_decoder = json.JSONDecoder()
+
+def extract_meta(raw):
+    """Достает объект "meta" из сырого ответа API, не разбирая весь JSON.
+
+    API отдает "meta" после объемного "data", поэтому разбирается только хвост ответа.
+    Если найти "meta" так не удалось, ответ разбирается целиком."""
+    pos = raw.rfind(b'"meta"')
+    if pos != -1:
+        tail = raw[pos + len(b'"meta"'):].lstrip()
+        if tail.startswith(b":"):
+            try:
+                meta, _ = json_decoder.raw_decode(tail[1:].decode("utf-8").lstrip())
+                if isinstance(meta, dict) and "status" in meta:
+                    return meta
+            except ValueError:
+                pass
+    data = json.loads(raw)
+    meta = data.get("meta") if isinstance(data, dict) else None
+    return meta if isinstance(meta, dict) else {}
+
+def request_error_class(e):
+    """Класс ошибки запроса для метрик: timeout, connection, http_<код> или request."""
+    if isinstance(e, requests.exceptions.Timeout):
+        return "timeout"
+    if isinstance(e, requests.exceptions.ConnectionError):
+        return "connection"
+    if getattr(e, "response", None) is not None:
+        return f"http_{e.response.status_code}"
+    return "request"
+
 def get_company_data(ogrn, api_key, api_usage, api_usage_file, proxy=None):
     params = {"key": api_key, "ogrn": ogrn, "source": "true"}
-    proxies = {'http': f'http://{proxy}', 'https': f'http://{proxy}'} if proxy else None
     
     logger.debug(f"Запрос ОГРН {ogrn} [Ключ: ...{api_key[-4:]}]...")
+    metrics.inc("requests")
+    metrics.inc_key(api_key, "requests")
+    started = time.monotonic()
     try:
-        response = requests.get(API_URL, params=params, proxies=proxies, timeout=30)
+        try:
+            # Попытка, которая могла дойти до API, засчитывается ключу сразу: лимит лучше недоиспользовать, чем превысить
+            response = http_client.get(API_URL, params=params, timeout=concurrency_limiter.timeout(), proxy=proxy,
+                                       before_retry=lambda: rate_scheduler.wait_key(api_key),
+                                       charge_attempt=lambda: update_api_usage(api_key, api_usage, api_usage_file, True))
+        finally:
+            metrics.observe("request", time.monotonic() - started)
         response.raise_for_status()
-        data = response.json()
+        raw = response.content
+        meta = extract_meta(raw)
         
-        if data.get("meta", {}).get("status") == "ok":
-            today_request_count = data.get("meta", {}).get("today_request_count", 0)
-            
-            if api_key in api_usage and api_usage[api_key]["today_requests"] > today_request_count:
-                logger.info(f"Обнаружен сброс счетчика API для ключа ...{api_key[-4:]}: {api_usage[api_key]['today_requests']} -> {today_request_count}")
-                api_usage[api_key]["last_reset"] = datetime.datetime.now(timezone.utc).isoformat()
-                api_usage[api_key]["today_requests"] = 0 # Сбрасываем счетчик, т.к. API его сбросил
-            
-            if api_key in api_usage:
-                api_usage[api_key]["today_requests"] = today_request_count
-            
-            api_usage = update_api_usage(api_key, api_usage, api_usage_file, True)
+        if meta.get("status") == "ok":
+            today_request_count = meta.get("today_request_count", 0)
+            api_usage = update_api_usage(api_key, api_usage, api_usage_file, True, today_request_count)
             needs_switch = today_request_count >= API_DAILY_LIMIT
+            metrics.inc_key(api_key, "ok")
             if needs_switch:
                 logger.warning(f"API-ключ ...{api_key[-4:]} достиг лимита. Необходимо переключение.")
+                metrics.inc_key(api_key, "limit_hits")
             
-            return data, api_usage, needs_switch, False
+            return raw, api_usage, needs_switch, False, False
         else:
-            error_message = data.get("meta", {}).get("message", "Неизвестная ошибка")
+            error_message = meta.get("message", "Неизвестная ошибка")
             logger.warning(f"Ошибка API для ОГРН {ogrn}: {error_message}")
             needs_switch = "limit exceeded" in error_message.lower() or "daily limit" in error_message.lower()
             if needs_switch:
                 logger.warning(f"Обнаружено превышение лимита для ключа ...{api_key[-4:]}.")
-                if api_key in api_usage:
-                    api_usage[api_key]["today_requests"] = API_DAILY_LIMIT
-                    # Запускаем обновление, чтобы установилось время сброса
-                    api_usage = update_api_usage(api_key, api_usage, api_usage_file, False)
-
-
-            return None, api_usage, needs_switch, False
+                metrics.inc_key(api_key, "limit_hits")
+                # Счетчик - по лимиту, а обновление назначает время сброса
+                api_usage = update_api_usage(api_key, api_usage, api_usage_file, False, API_DAILY_LIMIT)
+
+            not_found = not needs_switch and is_company_not_found(error_message)
+            if not_found:
+                metrics.inc_key(api_key, "not_found")
+            elif not needs_switch:
+                metrics.inc_key(api_key, "error_api")
+            return None, api_usage, needs_switch, False, not_found
             
     except requests.exceptions.RequestException as e:
         logger.error(f"Ошибка запроса для ОГРН {ogrn}: {e}")
         key_invalid = hasattr(e, 'response') and e.response is not None and e.response.status_code == 401
         if key_invalid:
             logger.error(f"Ошибка 401 Unauthorized для ключа ...{api_key[-4:]}. Ключ недействителен.")
-            if api_key in api_usage:
-                api_usage[api_key]["today_requests"] = API_DAILY_LIMIT
-            return None, api_usage, True, True
-        return None, api_usage, False, False
+            metrics.inc_key(api_key, "unauthorized")
+            with api_usage_lock:
+                if api_key in api_usage:
+                    key_registry.set_today_requests(api_key, API_DAILY_LIMIT)
+            return None, api_usage, True, True, False
+        metrics.inc_key(api_key, f"error_{request_error_class(e)}")
+        return None, api_usage, False, False, False
     
-    except json.JSONDecodeError:
+    except ValueError:
         logger.error(f"Ошибка при разборе JSON-ответа для ОГРН {ogrn}")
-        return None, api_usage, False, False
-
-def save_to_json(data, ogrn):
-    filename = f"{ogrn}.json.gz"
-    full_path = os.path.join("JSONs", filename)
-    
-    try:
-        os.makedirs(os.path.dirname(full_path), exist_ok=True)
-        with gzip.open(full_path, 'wt', encoding='utf-8') as f:
-            json.dump(data, f, ensure_ascii=False, indent=4)
-        logger.info(f"Успешно: данные для ОГРН {ogrn} сохранены в {filename}.")
-    except Exception as e:
-        logger.error(f"Ошибка при сохранении данных в файл {full_path}: {e}")
+        metrics.inc_key(api_key, "error_bad_json")
+        return None, api_usage, False, False, False
 
 def remove_invalid_api_key(api_key, api_keys, api_usage, api_keys_file):
-    logger.warning(f"УДАЛЕНИЕ недействительного API-ключа: ...{api_key[-4:]}")
-    if api_key in api_usage: del api_usage[api_key]
-    if api_key in api_keys: api_keys.remove(api_key)
-    try:
-        if os.path.exists(api_keys_file):
-            with open(api_keys_file, 'r', encoding='utf-8') as f: lines = f.readlines()
-            new_lines = [line for line in lines if line.strip() != api_key]
-            if len(lines) != len(new_lines):
-                with open(api_keys_file, 'w', encoding='utf-8') as f: f.writelines(new_lines)
-                logger.info(f"API-ключ ...{api_key[-4:]} удален из файла {api_keys_file}")
-    except Exception as e:
-        logger.error(f"Ошибка при удалении API-ключа ...{api_key[-4:]} из файла {api_keys_file}: {e}")
+    with api_usage_lock:
+        if api_key not in api_keys:
+            return api_keys, api_usage # Ключ уже удален другим потоком
+        logger.warning(f"УДАЛЕНИЕ недействительного API-ключа: ...{api_key[-4:]}")
+        if api_key in api_usage: del api_usage[api_key]
+        api_keys.remove(api_key)
+        key_registry.remove(api_key)
+        try:
+            if api_keys_file and os.path.exists(api_keys_file):
+                with open(api_keys_file, 'r', encoding='utf-8') as f: lines = f.readlines()
+                new_lines = [line for line in lines if line.strip() != api_key]
+                if len(lines) != len(new_lines):
+                    with open(api_keys_file, 'w', encoding='utf-8') as f: f.writelines(new_lines)
+                    logger.info(f"API-ключ ...{api_key[-4:]} удален из файла {api_keys_file}")
+        except Exception as e:
+            logger.error(f"Ошибка при удалении API-ключа ...{api_key[-4:]} из файла {api_keys_file}: {e}")
     return api_keys, api_usage
 
-def load_ogrns_from_file(file_path):
-    try:
-        with open(file_path, 'r', encoding='utf-8') as f:
-            ogrns_list = [line.strip() for line in f if line.strip()]
-        logger.info(f"Загружено {len(ogrns_list)} ОГРН из файла {file_path} для обработки.")
-        return ogrns_list
-    except Exception as e:
-        logger.error(f"Ошибка при загрузке списка ОГРН из файла {file_path}: {e}")
-        return []
+def snapshot_api_usage(api_keys, api_usage):
+    """Копия статистики и списка действующих ключей для передачи координатору."""
+    with api_usage_lock:
+        return {key: dict(key_data) for key, key_data in api_usage.items()}, set(api_keys)
+
+def increment_stat(stats, name, value=1):
+    with api_usage_lock:
+        stats[name] += value
+    metrics.inc(name, value)
+    if name in ("successful", "failed", "dead"):
+        metrics.inc("ogrn_processed", value)
+
+def process_ogrn(ogrn, api_keys, api_usage, api_keys_file, api_usage_file, stats, journal, writer):
+    """Получает данные по одному ОГРН, при необходимости переключая ключи, и передает ответ в очередь записи.
+    Неудачи записываются в журнал сразу, успех - после записи ответа на диск.
+    Возвращает False, если все API-ключи исчерпаны и обработку нужно остановить."""
+    max_attempts = len(api_keys) if api_keys else 1
+    for attempt in range(max_attempts):
+        concurrency_limiter.acquire()
+        current_api_key = acquire_api_key(api_keys, api_usage)
+        if not current_api_key:
+            concurrency_limiter.release()
+            return False
+
+        try:
+            company_data, api_usage, needs_switch, key_invalid, not_found = get_company_data(
+                ogrn, current_api_key, api_usage, api_usage_file, None
+            )
+            if key_invalid:
+                with api_usage_lock:
+                    if current_api_key in api_keys:
+                        api_keys, api_usage = remove_invalid_api_key(current_api_key, api_keys, api_usage, api_keys_file)
+                        rate_scheduler.remove_key(current_api_key)
+                        increment_stat(stats, "removed_keys")
+        finally:
+            release_api_key(current_api_key)
+            concurrency_limiter.release()
+
+        if key_invalid:
+            increment_stat(stats, "api_switches")
+            continue
+
+        if company_data:
+            writer.submit(ogrn, company_data)
+            if needs_switch:
+                increment_stat(stats, "api_switches")
+            return True
+
+        if not_found:
+            logger.warning(f"ОГРН {ogrn} отмечен как несуществующий и больше не будет запрашиваться.")
+            journal.record(ogrn, STATUS_DEAD)
+            increment_stat(stats, "dead")
+            return True
+
+        if needs_switch:
+            increment_stat(stats, "api_switches")
+            if attempt < max_attempts - 1:
+                continue
+
+        logger.error(f"Не удалось получить данные для ОГРН {ogrn} после {attempt + 1} попыток.")
+        journal.record(ogrn, STATUS_RETRY)
+        increment_stat(stats, "failed")
+        return True
+
+    logger.error(f"Не удалось получить данные для ОГРН {ogrn} после {max_attempts} попыток.")
+    journal.record(ogrn, STATUS_RETRY)
+    increment_stat(stats, "failed")
+    return True
 
 def main():
+    global api_key_source
     api_keys_file = "APIs.txt"
     api_usage_file = "api_count.json"
-    ogrns_file_path = "ogrns.txt"
+    ogrns_file_path = OGRN_INPUT
+    proxies_file = "proxies.txt"
+    journal_file = "progress_journal.txt"
+    metrics_file = "metrics.json"
     output_dir = "JSONs"
 
     os.makedirs(output_dir, exist_ok=True)
-
-    ogrns_list = load_ogrns_from_file(ogrns_file_path)
-    if not ogrns_list:
-        logger.critical("Список ОГРН для обработки пуст. Завершение работы.")
-        return
-
-    total_ogrns = len(ogrns_list)
-
-    api_keys = load_api_keys(api_keys_file)
-    if not api_keys:
-        logger.critical("Не удалось загрузить API-ключи. Проверьте файл APIs.txt.")
-        return
-
-    api_usage = load_api_usage(api_usage_file)
-    api_usage = clean_api_usage(api_keys, api_usage)
+    if METRICS_SAMPLES:
+        metrics.record_samples()  # До первых наблюдений: гистограммы создаются при первом обращении
+
+    coordinator = None
+    if COORDINATOR:
+        # Режим координатора: ключи и ОГРН берутся в аренду, результаты сообщаются координатору
+        coordinator = CoordinatorSession(
+            open_coordinator(COORDINATOR, COORDINATOR_LEASE_SECONDS, API_DAILY_LIMIT, COORDINATOR_TOKEN),
+            WORKER_ID, COORDINATOR_BATCH, COORDINATOR_LEASE_SECONDS / 3,
+        )
+        api_usage = coordinator.lease_keys(COORDINATOR_KEYS)
+        api_keys = list(api_usage)
+        api_key_source = lambda: coordinator.lease_more_keys(COORDINATOR_KEYS)
+        if not api_keys:
+            logger.critical("Координатор не выдал ни одного API-ключа с остатком лимита. Завершение работы.")
+            coordinator.close()
+            return
+        api_keys_file = None
+        if REFRESH:
+            logger.warning("Режим обновления не поддерживается вместе с координатором и будет пропущен.")
+    else:
+        if REFRESH and not RESPONSE_CACHE:
+            logger.critical("Режим обновления (REFRESH=1) работает по кэшу ответов, но RESPONSE_CACHE не задан.")
+            return
+        if not REFRESH and (not os.path.exists(ogrns_file_path) or not os.path.getsize(ogrns_file_path)):
+            logger.critical(f"Список ОГРН для обработки ({ogrns_file_path}) пуст или не найден. Завершение работы.")
+            return
+
+        api_keys = load_api_keys(api_keys_file)
+        if not api_keys:
+            logger.critical("Не удалось загрузить API-ключи. Проверьте файл APIs.txt.")
+            return
+
+        api_usage = load_api_usage(api_usage_file)
+        api_usage = clean_api_usage(api_keys, api_usage)
     save_api_usage(api_usage, api_usage_file)
+    key_registry.load(api_keys, api_usage)
 
-    current_api_key = get_available_api_key(api_keys, api_usage)
-    if not current_api_key:
+    # Если сброс лимита скоро, рабочие потоки дождутся его сами (и смогут прерваться по сигналу)
+    if not get_available_api_key(api_keys, api_usage) and next_reset_in_window() is None:
         logger.critical("Нет доступных API-ключей. Все ключи превысили дневной лимит.")
+        if coordinator:
+            coordinator.close()
         return
 
-    successful = 0
-    failed = 0
-    api_switches = 0
-    removed_keys = 0
-    
-    for i, ogrn in enumerate(ogrns_list):
-        logger.info(f"Обработка {i + 1}/{total_ogrns}. ОГРН: {ogrn}")
-
-        output_filename = f"{ogrn}.json.gz"
-        full_output_path = os.path.join(output_dir, output_filename)
-
-        if os.path.exists(full_output_path):
-            logger.debug(f"ОГРН {ogrn} уже обработан, файл существует. Пропускаем.")
-            successful += 1
-            continue
-
-        max_attempts = len(api_keys) if api_keys else 1
-        for attempt in range(max_attempts):
-            if not current_api_key:
-                logger.critical("Все API-ключи исчерпаны. Завершаем обработку.")
-                break
-            
-            company_data, api_usage, needs_switch, key_invalid = get_company_data(
-                ogrn, current_api_key, api_usage, api_usage_file, None
-            )
-            
-            if key_invalid:
-                api_keys, api_usage = remove_invalid_api_key(current_api_key, api_keys, api_usage, api_keys_file)
-                removed_keys += 1
-                current_api_key = get_available_api_key(api_keys, api_usage)
-                api_switches += 1
-                if current_api_key:
-                    continue
-                else:
-                    break
-            
-            save_api_usage(api_usage, api_usage_file)
-            
-            if company_data:
-                save_to_json(company_data, ogrn)
-                successful += 1
-                if needs_switch:
-                    current_api_key = get_available_api_key(api_keys, api_usage)
-                    api_switches += 1
-                break
-            
-            if needs_switch:
-                current_api_key = get_available_api_key(api_keys, api_usage)
-                api_switches += 1
-                if current_api_key:
-                    continue
-
-            if attempt == max_attempts - 1 or not needs_switch:
-                logger.error(f"Не удалось получить данные для ОГРН {ogrn} после {attempt + 1} попыток.")
-                failed += 1
-                break
-        
-        if not current_api_key:
-            logger.critical("Все API-ключи исчерпаны. Завершаем обработку.")
-            break
-        
-        time.sleep(1)
+    sink = create_sink(OUTPUT_SINK, output_dir, OUTPUT_CODEC, OUTPUT_SEGMENT_MB * 1024 * 1024)
+    cache = None
+    if RESPONSE_CACHE:
+        cache = ResponseCache(RESPONSE_CACHE, CACHE_TTL_HOURS * 3600, CACHE_MAX_MB * 1024 * 1024, OUTPUT_CODEC)
+        cache.bootstrap(sink.stored_ogrns)
+        sink = CachingSink(sink, cache)
+    refresh = REFRESH and cache is not None and not coordinator
+    stats = {"successful": 0, "failed": 0, "dead": 0, "cached": 0, "api_switches": 0, "removed_keys": 0}
+    # ОГРН, обработанные в прошлых запусках (по журналу): считаются при чтении списка
+    previously = {STATUS_OK: 0, STATUS_DEAD: 0}
+    ogrn_stream = None
+    total_pending = None
+    if coordinator:
+        journal = coordinator
+        ogrns_iter = enumerate(coordinator.iter_ogrns())
+        coordinator.start_heartbeat(lambda: snapshot_api_usage(api_keys, api_usage))
+    elif refresh:
+        # Режим обновления: список работы - записи кэша старше TTL, от самых старых
+        journal = ProgressJournal(journal_file).load(sink.stored_ogrns)
+        total_pending = cache.count_stale()
+        logger.info(f"Режим обновления: {total_pending} ОГРН получены более {CACHE_TTL_HOURS:g} ч назад.")
+        ogrns_iter = enumerate(cache.stale_ogrns())
+    else:
+        journal = ProgressJournal(journal_file).load(sink.stored_ogrns)
+
+        def already_processed(ogrn):
+            status = journal.status(ogrn)
+            if status in FINAL_STATUSES:
+                previously[status] += 1
+                return True
+            return False
+
+        # Список читается потоком: в памяти только множество уже встреченных ОГРН (или фильтр Блума)
+        ogrn_stream = OgrnStream(ogrns_file_path, OGRN_DEDUP, OGRN_CSV_COLUMN, already_processed,
+                                 OGRN_BLOOM_CAPACITY, OGRN_BLOOM_ERROR)
+        logger.info(f"Чтение ОГРН из {ogrns_file_path} ({ogrn_stream.size} байт), отбрасывание повторов: {OGRN_DEDUP}.")
+        ogrns_iter = enumerate(ogrn_stream)
+    ogrns_iter_lock = threading.Lock()
+
+    def handle_shutdown(signum, frame):
+        # Отмена задания GitHub Actions присылает SIGINT/SIGTERM: сразу сохраняем статистику ключей
+        api_usage_store.flush()
+        if stop_event.is_set():
+            logger.critical(f"Повторный сигнал {signal.Signals(signum).name}. Немедленное завершение.")
+            journal.close()
+            os._exit(128 + signum)
+        logger.warning(f"Получен сигнал {signal.Signals(signum).name}. Статистика сохранена, завершаем текущие запросы.")
+        stop_event.set()
+        with api_key_released:
+            api_key_released.notify_all() # Будим потоки, ждущие ключа или сброса лимита
+
+    if threading.current_thread() is threading.main_thread():
+        signal.signal(signal.SIGTERM, handle_shutdown)
+        signal.signal(signal.SIGINT, handle_shutdown)
+
+    def on_written(ogrn, success):
+        journal.record(ogrn, STATUS_OK if success else STATUS_RETRY)
+        increment_stat(stats, "successful" if success else "failed")
+
+    def metrics_gauges():
+        with api_usage_lock:
+            remaining_quota = key_registry.remaining_quota()
+            processed = stats["successful"] + stats["failed"] + stats["dead"]
+            gauges = {
+                "remaining_quota": remaining_quota,
+                "active_keys": len(api_keys),
+                "in_flight": key_registry.in_flight_total,
+            }
+        gauges["write_queue"] = writer.queue.qsize()
+        if ADAPTIVE_CONCURRENCY:
+            gauges.update(concurrency_limiter.snapshot())
+        if ogrn_stream is not None:
+            offset, size, yielded = ogrn_stream.offset, ogrn_stream.size, ogrn_stream.yielded
+            gauges["input_offset_bytes"] = offset
+            gauges["input_size_bytes"] = size
+            if offset:
+                # Остаток оценивается по доле выданных ОГРН в уже прочитанной части файла
+                gauges["remaining_ogrns"] = round(yielded / offset * (size - offset)) + max(0, yielded - processed)
+        elif total_pending is not None:
+            gauges["remaining_ogrns"] = max(0, total_pending - processed)
+        return gauges
+
+    def worker():
+        while not stop_event.is_set():
+            with ogrns_iter_lock:
+                i, ogrn = next(ogrns_iter, (None, None))
+            if ogrn is None:
+                return
+            if ogrn_stream is not None:
+                logger.info(f"Обработка {i + 1} (прочитано {ogrn_stream.offset} из {ogrn_stream.size} байт, {ogrn_stream.progress():.1%}). ОГРН: {ogrn}")
+            else:
+                logger.info(f"Обработка {i + 1}/{total_pending or '?'}. ОГРН: {ogrn}")
+
+            if cache is not None and not refresh and cache.is_fresh(ogrn):
+                # Ответ получен недавно (в пределах TTL): квота на него не тратится
+                logger.info(f"ОГРН {ogrn} есть в кэше и не устарел, запрос не нужен.")
+                journal.record(ogrn, STATUS_OK)
+                increment_stat(stats, "cached")
+                continue
+
+            if not process_ogrn(ogrn, api_keys, api_usage, api_keys_file, api_usage_file, stats, journal, writer):
+                if not stop_event.is_set():
+                    logger.critical("Все API-ключи исчерпаны. Завершаем обработку.")
+                stop_event.set()
+                return
+
+    num_workers = API_MAX_WORKERS or len(api_keys) * API_CONCURRENCY_PER_KEY
+    http_client.set_pool_size(num_workers)
+    concurrency_limiter.set_max_limit(num_workers)
+    http_client.set_proxies(load_proxies(proxies_file))
+    logger.info(f"Запуск {num_workers} рабочих потоков ({API_CONCURRENCY_PER_KEY} запрос(ов) на ключ).")
+    writer = WritePipeline(sink, on_written, WRITER_THREADS, WRITE_QUEUE_SIZE or num_workers * 2)
+    api_usage_store.start()
+    metrics.set_gauge_callback(metrics_gauges)
+    metrics_reporter = MetricsReporter(metrics, metrics_file, METRICS_SNAPSHOT_SECONDS, METRICS_PORT, METRICS_HOST)
+    metrics_reporter.start()
+    try:
+        with ThreadPoolExecutor(max_workers=num_workers, thread_name_prefix="fetch") as executor:
+            futures = [executor.submit(worker) for _ in range(num_workers)]
+            for future in futures:
+                future.result()
+    finally:
+        writer.close()
+        api_usage_store.stop()
+        metrics_reporter.stop()
+        if METRICS_SAMPLES:
+            metrics.write_samples(METRICS_SAMPLES)
+        journal.close()
+        sink.close()
     
     logger.info("\n------ Обработка завершена ------")
-    logger.info(f"Всего ОГРН в списке: {total_ogrns}")
-    logger.info(f"Успешно обработано (включая ранее скачанные): {successful}")
-    logger.info(f"Не удалось обработать: {failed}")
-    logger.info(f"Количество переключений API-ключей: {api_switches}")
-    logger.info(f"Количество удаленных недействительных API-ключей: {removed_keys}")
+    if ogrn_stream is None:
+        logger.info(f"Всего ОГРН получено от координатора: {stats['successful'] + stats['failed'] + stats['dead']}")
+    else:
+        logger.info(f"Прочитано ОГРН из списка: {ogrn_stream.lines} ({ogrn_stream.progress():.1%} файла)")
+        logger.info(f"Пропущено неверных ОГРН: {ogrn_stream.invalid}, повторов: {ogrn_stream.duplicates}")
+    logger.info(f"Успешно обработано (включая ранее скачанные): {stats['successful'] + previously[STATUS_OK]}")
+    logger.info(f"Не удалось обработать: {stats['failed']}")
+    logger.info(f"Несуществующих ОГРН (включая ранее выявленные): {stats['dead'] + previously[STATUS_DEAD]}")
+    if cache is not None:
+        logger.info(f"Взято из кэша без запроса: {stats['cached']}, не изменилось при повторном получении: {metrics.counters.get('unchanged', 0)}")
+    logger.info(f"Количество переключений API-ключей: {stats['api_switches']}")
+    logger.info(f"Количество удаленных недействительных API-ключей: {stats['removed_keys']}")
+    for name, title in (("request", "Запрос к API"), ("key_wait", "Ожидание ключа"), ("write", "Сжатие и запись")):
+        histogram = metrics.histogram(name).snapshot()
+        if histogram["count"]:
+            logger.info(f"{title}: p50 {histogram['p50']} с, p95 {histogram['p95']} с, среднее {histogram['avg']:.3f} с ({histogram['count']} раз)")
+    logger.info(f"Подробные метрики: {metrics_file}")
     logger.info("-----------------------------------")
 
 if __name__ == "__main__":
-    main()
\ No newline at end of file
+    main()
@@ -0,0 +1,82 @@
+"""
+Замер экономии на постоянных соединениях: `requests.get` без сессии против `http_client.CheckoClient`.
+
+Поднимает локальный HTTP/1.1 сервер-заглушку с keep-alive и делает одинаковое число запросов
+каждым способом. Выводит среднюю задержку, p50 и p99 на запрос. Локальный сервер не использует TLS,
+поэтому на реальном api.checko.ru экономия больше: там к TCP-рукопожатию добавляется TLS.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_connection_pool.py --requests 500
+"""
+
+import argparse
+import json
+import os
+import statistics
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+sys.path.insert(0, os.path.dirname(os.path.dirname(os.path.abspath(__file__))))
+from http_client import CheckoClient  # noqa: E402
+
+PAYLOAD = json.dumps({"data": {"ОГРН": "1027700132195"}, "meta": {"status": "ok", "today_request_count": 1}},
+                     ensure_ascii=False).encode("utf-8")
+
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True  # иначе заголовки и тело уходят разными пакетами с задержкой ACK
+
+    def do_GET(self):
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(PAYLOAD)))
+        self.end_headers()
+        self.wfile.write(PAYLOAD)
+
+    def log_message(self, *args):
+        pass
+
+
+def measure(fetch, url, count):
+    latencies = []
+    for i in range(count):
+        started = time.perf_counter()
+        response = fetch(url, params={"ogrn": str(i)}, timeout=30)
+        response.content
+        latencies.append((time.perf_counter() - started) * 1000)
+    return latencies
+
+
+def report(name, latencies):
+    latencies = sorted(latencies)
+    p99 = latencies[min(len(latencies) - 1, int(len(latencies) * 0.99))]
+    print(f"{name:<28} среднее {statistics.mean(latencies):7.3f} мс   p50 {statistics.median(latencies):7.3f} мс   p99 {p99:7.3f} мс")
+    return statistics.mean(latencies)
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--requests", type=int, default=300, help="число запросов на каждый способ")
+    args = parser.parse_args()
+
+    server = ThreadingHTTPServer(("127.0.0.1", 0), StubHandler)
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    url = f"http://127.0.0.1:{server.server_port}/v2/company"
+
+    try:
+        client = CheckoClient(pool_size=1)
+        measure(client.get, url, 10)  # прогрев
+        plain = report("requests.get (без сессии)", measure(requests.get, url, args.requests))
+        pooled = report("CheckoClient (keep-alive)", measure(client.get, url, args.requests))
+        print(f"Экономия на запрос: {plain - pooled:.3f} мс ({(plain - pooled) / plain:.0%})")
+    finally:
+        server.shutdown()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,232 @@
+"""
+Сквозной замер скрапера на локальной заглушке API Checko (`mock_checko.py`).
+
+Создает временную рабочую папку со сгенерированными `ogrns.txt` и `APIs.txt`, поднимает заглушку и запускает
+`api_scraper.py` отдельным процессом с `CHECKO_API_URL`, указывающим на заглушку. Выводит:
+- пропускную способность (ОГРН в секунду) и время работы;
+- точные p50/p99 времени запроса к API и ожидания ключа (по всем наблюдениям, которые скрапер записывает
+  в `metrics_samples.json` при `METRICS_SAMPLES`; без него - по гистограммам `metrics.json`, с точностью до корзины);
+- процессорное время (user + sys) и пиковую память (RSS) процесса скрапера;
+- объем записанных данных в `JSONs/` и итоги журнала прогресса.
+
+По умолчанию ограничение скорости ключей снято (`API_RATE_PER_KEY=1000`), чтобы замерять сам клиент, а не паузы.
+Любые переменные окружения скрапера задаются через `--env`, например `--env OUTPUT_SINK=ndjson`.
+С `--results` итог дописывается строкой JSON в файл и сравнивается с предыдущей строкой - так видно регрессии.
+
+Запуск из корня репозитория:
+    python benchmarks/bench_scraper.py --ogrns 2000 --latency-ms 50
+    python benchmarks/bench_scraper.py --samples "JSONs/*.json.gz" --env OUTPUT_SINK=sqlite --results bench_results.jsonl
+"""
+
+import argparse
+import datetime
+import json
+import math
+import os
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+import time
+from datetime import timezone
+
+from mock_checko import add_arguments, mock_from_args
+
+REPO_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SCRAPER = os.path.join(REPO_DIR, "api_scraper.py")
+SAMPLES_FILE = "metrics_samples.json"  # Все наблюдения гистограмм скрапера (METRICS_SAMPLES)
+# Метрики, по которым итог сравнивается с предыдущим запуском, и "лучшее" направление изменения
+COMPARED = {"ogrn_per_second": 1, "request_p50_ms": -1, "request_p99_ms": -1, "cpu_seconds": -1, "peak_rss_mb": -1}
+
+
+def prepare_workdir(workdir, ogrns, keys, bad_keys):
+    with open(os.path.join(workdir, "ogrns.txt"), 'w', encoding='utf-8') as f:
+        for i in range(ogrns):
+            base = 102770000000 + i  # 12 цифр, к ним добавляется контрольная цифра ОГРН
+            f.write(f"{base}{base % 11 % 10}\n")
+    with open(os.path.join(workdir, "APIs.txt"), 'w', encoding='utf-8') as f:
+        f.writelines(f"BENCHKEY{i:04d}\n" for i in range(keys))
+        f.writelines(f"BADKEY{i:04d}\n" for i in range(bad_keys))
+
+
+def directory_size(path):
+    total = 0
+    for root, _, files in os.walk(path):
+        total += sum(os.path.getsize(os.path.join(root, name)) for name in files)
+    return total
+
+
+def journal_totals(path):
+    statuses = {}
+    if os.path.exists(path):
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                ogrn, _, status = line.rstrip("\n").partition("\t")
+                statuses[ogrn] = status
+    totals = {}
+    for status in statuses.values():
+        totals[status] = totals.get(status, 0) + 1
+    return totals
+
+
+def run_once(args, url, keys):
+    workdir = tempfile.mkdtemp(prefix="bench_scraper_")
+    try:
+        prepare_workdir(workdir, args.ogrns, keys, args.bad_keys)
+        env = dict(os.environ)
+        env.update({"CHECKO_API_URL": url, "API_RATE_PER_KEY": str(args.rate_per_key), "API_BURST_PER_KEY": "1",
+                    "METRICS_SAMPLES": SAMPLES_FILE})
+        env.update(item.split("=", 1) for item in args.env)
+
+        started = time.perf_counter()
+        process = subprocess.Popen([sys.executable, SCRAPER], cwd=workdir, env=env,
+                                   stdout=subprocess.DEVNULL, stderr=subprocess.DEVNULL)
+        _, status, usage = os.wait4(process.pid, 0)
+        elapsed = time.perf_counter() - started
+        exit_code = os.waitstatus_to_exitcode(status)
+
+        with open(os.path.join(workdir, "metrics.json"), 'r', encoding='utf-8') as f:
+            metrics = json.load(f)
+        histograms = metrics["histograms"]
+        samples = {}
+        if os.path.exists(os.path.join(workdir, SAMPLES_FILE)):
+            with open(os.path.join(workdir, SAMPLES_FILE), 'r', encoding='utf-8') as f:
+                samples = json.load(f)
+
+        def quantile_ms(name, q):
+            if samples.get(name):
+                return to_ms(exact_quantile(sorted(samples[name]), q))
+            return to_ms(histograms.get(name, {}).get(f"p{round(q * 100)}"))  # Граница корзины
+
+        totals = journal_totals(os.path.join(workdir, "progress_journal.txt"))
+        processed = sum(totals.values())
+        result = {
+            "exit_code": exit_code,
+            "seconds": round(elapsed, 3),
+            "ogrn_processed": processed,
+            "ogrn_per_second": round(processed / elapsed, 2),
+            "journal": totals,
+            "requests": metrics["counters"].get("requests", 0),
+            "request_p50_ms": quantile_ms("request", 0.5),
+            "request_p99_ms": quantile_ms("request", 0.99),
+            "key_wait_p50_ms": quantile_ms("key_wait", 0.5),
+            "key_wait_p99_ms": quantile_ms("key_wait", 0.99),
+            "write_p99_ms": quantile_ms("write", 0.99),
+            "cpu_seconds": round(usage.ru_utime + usage.ru_stime, 3),
+            "peak_rss_mb": round(usage.ru_maxrss / 1024, 1),  # В Linux ru_maxrss в килобайтах
+            "bytes_written": directory_size(os.path.join(workdir, "JSONs")),
+        }
+        if args.keep:
+            result["workdir"] = workdir
+        return result
+    finally:
+        if not args.keep:
+            shutil.rmtree(workdir, ignore_errors=True)
+
+
+def exact_quantile(values, q):
+    """Квантиль q (0..1) по отсортированному списку наблюдений (ближайший ранг)."""
+    return values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))]
+
+
+def to_ms(seconds):
+    return None if seconds is None else round(seconds * 1000, 2)
+
+
+def median_result(results):
+    """Медиана числовых показателей по повторам (журнал и код выхода - из последнего повтора)."""
+    combined = dict(results[-1])
+    for name, value in results[-1].items():
+        if isinstance(value, (int, float)) and name != "exit_code":
+            values = [result[name] for result in results if result.get(name) is not None]
+            if not values:
+                combined[name] = None
+            elif all(isinstance(value, int) for value in values):
+                combined[name] = statistics.median_low(values)
+            else:
+                combined[name] = round(statistics.median(values), 3)
+    return combined
+
+
+def compare_with_previous(results_file, result):
+    if not os.path.exists(results_file):
+        return
+    with open(results_file, 'r', encoding='utf-8') as f:
+        lines = [line for line in f if line.strip()]
+    if not lines:
+        return
+    previous = json.loads(lines[-1])
+    print(f"\nСравнение с предыдущим запуском ({previous.get('time')}, {previous.get('commit') or '?'}):")
+    for name, better in COMPARED.items():
+        old, new = previous.get("result", {}).get(name), result.get(name)
+        if not old or new is None:
+            continue
+        change = (new - old) / old
+        mark = "лучше" if change * better > 0.05 else "хуже" if change * better < -0.05 else "без изменений"
+        print(f"  {name:<18} {old:>10} -> {new:<10} {change:+.1%} ({mark})")
+
+
+def git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], cwd=REPO_DIR, capture_output=True,
+                              text=True, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--ogrns", type=int, default=1000, help="число ОГРН в списке")
+    parser.add_argument("--keys", type=int, default=0, help="число ключей (по умолчанию - сколько нужно на все ОГРН)")
+    parser.add_argument("--bad-keys", type=int, default=1, help="число недействительных ключей (получают 401)")
+    parser.add_argument("--rate-per-key", type=float, default=1000, help="API_RATE_PER_KEY для скрапера")
+    parser.add_argument("--repeat", type=int, default=1, help="число повторов (выводится медиана)")
+    parser.add_argument("--env", action="append", default=[], metavar="ИМЯ=ЗНАЧЕНИЕ",
+                        help="переменная окружения для скрапера (можно указать несколько раз)")
+    parser.add_argument("--results", default="", help="файл JSONL для истории замеров и сравнения с предыдущим")
+    parser.add_argument("--keep", action="store_true", help="не удалять рабочую папку")
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    keys = args.keys or math.ceil(args.ogrns / max(1, args.daily_limit - 1)) + 1
+    results = []
+    for attempt in range(args.repeat):
+        mock = mock_from_args(args)  # У каждого повтора свои счетчики ключей
+        server = mock.start()
+        try:
+            result = run_once(args, f"http://127.0.0.1:{server.server_port}/v2/company", keys)
+        finally:
+            server.shutdown()
+            server.server_close()
+        result["mock"] = mock.stats
+        results.append(result)
+        print(f"Повтор {attempt + 1}/{args.repeat}: {result['ogrn_per_second']} ОГРН/с за {result['seconds']} с")
+
+    result = median_result(results)
+    print(f"\nОГРН: {args.ogrns}, ключей: {keys} (+{args.bad_keys} недействительных), задержка API: {args.latency_ms} мс")
+    print(f"Код выхода скрапера:    {result['exit_code']}")
+    print(f"Пропускная способность: {result['ogrn_per_second']} ОГРН/с ({result['ogrn_processed']} ОГРН за {result['seconds']} с)")
+    print(f"Итоги журнала:          {result['journal']}")
+    print(f"Запрос к API:           p50 {result['request_p50_ms']} мс, p99 {result['request_p99_ms']} мс ({result['requests']} запросов)")
+    print(f"Ожидание ключа:         p50 {result['key_wait_p50_ms']} мс, p99 {result['key_wait_p99_ms']} мс")
+    print(f"Процессорное время:     {result['cpu_seconds']} с")
+    print(f"Пиковая память (RSS):   {result['peak_rss_mb']} МБ")
+    print(f"Записано в JSONs/:      {result['bytes_written'] / 1024 / 1024:.2f} МБ")
+    if args.keep:
+        print(f"Рабочая папка:          {result['workdir']}")
+
+    if args.results:
+        compare_with_previous(args.results, result)
+        record = {
+            "time": datetime.datetime.now(timezone.utc).isoformat(),
+            "commit": git_commit(),
+            "params": {name: value for name, value in vars(args).items() if name not in ("results", "keep")},
+            "result": result,
+        }
+        with open(args.results, 'a', encoding='utf-8') as f:
+            f.write(json.dumps(record, ensure_ascii=False) + "\n")
+
+
+if __name__ == "__main__":
+    main()
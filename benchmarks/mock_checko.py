@@ -0,0 +1,181 @@
+"""
+Локальная заглушка API Checko (`/v2/company`) для замеров без сети и без расхода дневных лимитов.
+
+Повторяет поведение, на которое опирается `api_scraper.py`:
+- успешный ответ `{"data": {...}, "meta": {"status": "ok", "today_request_count": N}}`, счетчик ведется по ключу;
+- после `--daily-limit` запросов ключа - `{"meta": {"status": "error", "message": "Daily limit exceeded"}}`;
+- ключи с префиксом `--bad-key-prefix` получают 401 Unauthorized;
+- доля `--not-found-rate` ОГРН получает ошибку "Компания не найдена" (одни и те же ОГРН при каждом запуске);
+- доля `--error-rate` запросов получает случайный ответ 500/502/503/504.
+
+Задержка ответа - логнормальная с медианой `--latency-ms` и разбросом `--latency-sigma` (0 - постоянная).
+Тело `data` берется из реальных сохраненных ответов (`--samples "JSONs/*.json.gz"`) или генерируется
+размером около `--payload-kb` килобайт.
+
+Запуск отдельно (адрес передается скраперу через `CHECKO_API_URL`):
+    python benchmarks/mock_checko.py --port 8080 --latency-ms 150 --error-rate 0.01
+    CHECKO_API_URL=http://127.0.0.1:8080/v2/company python api_scraper.py
+"""
+
+import argparse
+import glob
+import gzip
+import json
+import random
+import threading
+import time
+import zlib
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlparse
+
+
+def load_samples(pattern, max_samples=200):
+    """Поля `data` реальных ответов (сериализованные байты) из файлов JSON.GZ / JSON."""
+    samples = []
+    for path in sorted(glob.glob(pattern, recursive=True))[:max_samples]:
+        opener = gzip.open if path.endswith(".gz") else open
+        try:
+            with opener(path, 'rt', encoding='utf-8') as f:
+                response = json.load(f)
+        except (OSError, ValueError):
+            continue
+        data = response.get("data") if isinstance(response, dict) else None
+        if data is not None:
+            samples.append(json.dumps(data, ensure_ascii=False).encode("utf-8"))
+    return samples
+
+
+def synthetic_payload(size_kb, seed=0):
+    """Тело `data` примерно заданного размера, похожее на карточку компании (с неповторяющимися числами)."""
+    rng = random.Random(seed)
+    data = {"ОГРН": "", "НаимПолн": "ОБЩЕСТВО С ОГРАНИЧЕННОЙ ОТВЕТСТВЕННОСТЬЮ \"ТЕСТ\"", "Финансы": {}}
+    year = 2000
+    while len(json.dumps(data, ensure_ascii=False).encode("utf-8")) < size_kb * 1024:
+        data["Финансы"][str(year)] = {str(code): rng.randint(-10 ** 9, 10 ** 9) for code in range(1100, 2500, 10)}
+        year += 1
+    return json.dumps(data, ensure_ascii=False).encode("utf-8")
+
+
+class MockChecko:
+    def __init__(self, latency_ms=100, latency_sigma=0.5, error_rate=0.0, not_found_rate=0.0,
+                 daily_limit=99, bad_key_prefix="BAD", payloads=None, seed=None):
+        self.latency = latency_ms / 1000
+        self.latency_sigma = latency_sigma
+        self.error_rate = error_rate
+        self.not_found_rate = not_found_rate
+        self.daily_limit = daily_limit
+        self.bad_key_prefix = bad_key_prefix
+        self.payloads = payloads or [synthetic_payload(30)]
+        self.random = random.Random(seed)
+        self.lock = threading.Lock()
+        self.counts = {}
+        self.stats = {"requests": 0, "ok": 0, "limit": 0, "unauthorized": 0, "not_found": 0, "errors": 0}
+
+    def delay(self):
+        if self.latency_sigma <= 0:
+            return self.latency
+        with self.lock:
+            return self.latency * self.random.lognormvariate(0, self.latency_sigma)
+
+    def is_not_found(self, ogrn):
+        # Решение зависит только от ОГРН, поэтому при повторе ответ тот же
+        return zlib.crc32(ogrn.encode()) % 10000 < self.not_found_rate * 10000
+
+    def respond(self, key, ogrn):
+        """Возвращает (код HTTP, тело ответа)."""
+        with self.lock:
+            self.stats["requests"] += 1
+            if self.error_rate and self.random.random() < self.error_rate:
+                self.stats["errors"] += 1
+                return self.random.choice((500, 502, 503, 504)), b'{"error": "upstream"}'
+            if key.startswith(self.bad_key_prefix):
+                self.stats["unauthorized"] += 1
+                return 401, b'{"meta": {"status": "error", "message": "Unauthorized"}}'
+            used = self.counts.get(key, 0)
+            if used >= self.daily_limit:
+                self.stats["limit"] += 1
+                return 200, b'{"meta": {"status": "error", "message": "Daily limit exceeded"}}'
+            self.counts[key] = used + 1
+            if self.is_not_found(ogrn):
+                self.stats["not_found"] += 1
+                meta = {"status": "error", "message": "Компания не найдена", "today_request_count": used + 1}
+                return 200, json.dumps({"meta": meta}, ensure_ascii=False).encode("utf-8")
+            self.stats["ok"] += 1
+            payload = self.payloads[self.random.randrange(len(self.payloads))]
+        meta = json.dumps({"status": "ok", "today_request_count": used + 1}).encode("utf-8")
+        return 200, b'{"data": ' + payload + b', "meta": ' + meta + b'}'
+
+    def handler(self):
+        mock = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = "HTTP/1.1"
+            disable_nagle_algorithm = True  # иначе заголовки и тело уходят разными пакетами с задержкой ACK
+
+            def do_GET(self):
+                query = parse_qs(urlparse(self.path).query)
+                key = query.get("key", [""])[0]
+                ogrn = query.get("ogrn", [""])[0]
+                time.sleep(mock.delay())
+                status, body = mock.respond(key, ogrn)
+                self.send_response(status)
+                self.send_header("Content-Type", "application/json; charset=utf-8")
+                self.send_header("Content-Length", str(len(body)))
+                self.end_headers()
+                self.wfile.write(body)
+
+            def log_message(self, *args):
+                pass
+
+        return Handler
+
+    def start(self, host="127.0.0.1", port=0):
+        """Запускает сервер в фоновом потоке и возвращает его (адрес - `server.server_port`)."""
+        server = ThreadingHTTPServer((host, port), self.handler())
+        server.daemon_threads = True
+        threading.Thread(target=server.serve_forever, name="mock-checko", daemon=True).start()
+        return server
+
+
+def add_arguments(parser):
+    parser.add_argument("--latency-ms", type=float, default=100, help="медиана задержки ответа, мс")
+    parser.add_argument("--latency-sigma", type=float, default=0.5, help="разброс логнормальной задержки (0 - постоянная)")
+    parser.add_argument("--error-rate", type=float, default=0.0, help="доля ответов 5xx")
+    parser.add_argument("--not-found-rate", type=float, default=0.01, help="доля несуществующих ОГРН")
+    parser.add_argument("--daily-limit", type=int, default=99, help="дневной лимит запросов на ключ")
+    parser.add_argument("--bad-key-prefix", default="BAD", help="ключи с этим префиксом получают 401")
+    parser.add_argument("--samples", default="", help="шаблон glob реальных ответов, например \"JSONs/*.json.gz\"")
+    parser.add_argument("--payload-kb", type=float, default=30, help="размер синтетического ответа, если нет --samples")
+    parser.add_argument("--seed", type=int, default=None, help="зерно генератора случайных чисел")
+
+
+def mock_from_args(args):
+    payloads = load_samples(args.samples) if args.samples else []
+    if args.samples and not payloads:
+        print(f"По шаблону {args.samples} не найдено ни одного ответа, используется синтетический.")
+    return MockChecko(
+        args.latency_ms, args.latency_sigma, args.error_rate, args.not_found_rate, args.daily_limit,
+        args.bad_key_prefix, payloads or [synthetic_payload(args.payload_kb)], args.seed,
+    )
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--host", default="127.0.0.1")
+    parser.add_argument("--port", type=int, default=8080)
+    add_arguments(parser)
+    args = parser.parse_args()
+
+    mock = mock_from_args(args)
+    server = mock.start(args.host, args.port)
+    print(f"Заглушка Checko: http://{args.host}:{server.server_port}/v2/company ({len(mock.payloads)} вариантов ответа)")
+    try:
+        while True:
+            time.sleep(3600)
+    except KeyboardInterrupt:
+        server.shutdown()
+        print(json.dumps(mock.stats, ensure_ascii=False))
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,144 @@
+"""
+Адаптивное ограничение числа одновременных запросов к API Checko (AIMD) и адаптивный таймаут запроса.
+
+Рабочих потоков запускается столько, сколько слотов у ключей, но одновременно к API уходит не больше `limit`
+запросов. Лимит подстраивается по наблюдаемым задержкам и ошибкам, как окно перегрузки TCP:
+- каждые `limit` (но не меньше `window_min`) завершенных попыток считаются p95 задержки и доля ошибок окна;
+  если окно "здоровое", лимит растет на 1 (аддитивный рост) до `max_limit`;
+- таймаут, ответ 429 или 5xx, доля ошибок окна выше `error_rate_max` или p95 окна больше базовой задержки
+  в `latency_tolerance` раз уменьшают лимит в `backoff` раз (мультипликативное снижение), но не чаще раза
+  за окно и не ниже `min_limit`. Базовая задержка - сглаженный p95 окон, она медленно следует
+  за устойчивым ростом задержки (например, в часы пик), поэтому лимит не прижимается к минимуму навсегда.
+
+Таймаут запроса - p99 последних успешных попыток, умноженный на `timeout_multiplier`, в пределах
+`min_timeout`..`max_timeout`. Пока наблюдений мало, действует `max_timeout`. После таймаута значение
+удваивается (до `max_timeout`), чтобы слишком тесный таймаут не обрывал медленные, но рабочие ответы.
+
+Попытки сообщает HTTP-клиент (`http_client.CheckoClient.observer`), поэтому повторы после таймаутов и 5xx
+тоже учитываются.
+"""
+
+import collections
+import logging
+import math
+import threading
+
+logger = logging.getLogger("api_scraper")
+
+OUTCOME_OK = "ok"
+OUTCOME_TIMEOUT = "timeout"
+OUTCOME_OVERLOAD = "overload"  # 429 и 5xx
+OUTCOME_ERROR = "error"  # разрыв соединения и прочие ошибки запроса
+
+
+def percentile(values, q):
+    """Перцентиль q (0..1) по отсортированному списку."""
+    if not values:
+        return None
+    return values[min(len(values) - 1, max(0, math.ceil(q * len(values)) - 1))]
+
+
+class AdaptiveLimiter:
+    def __init__(self, max_limit, min_limit=1, initial_limit=None, backoff=0.7, error_rate_max=0.1,
+                 latency_tolerance=2.0, window_min=20, min_timeout=5.0, max_timeout=30.0,
+                 timeout_multiplier=4.0, latency_samples=500):
+        self.max_limit = max(1, max_limit)
+        self.requested_min_limit = max(1, min_limit)  # Заданный минимум; ограничивается верхней границей
+        self.min_limit = min(self.requested_min_limit, self.max_limit)
+        self.limit = float(min(self.max_limit, max(self.min_limit, initial_limit or self.max_limit)))
+        self.backoff = backoff
+        self.error_rate_max = error_rate_max
+        self.latency_tolerance = latency_tolerance
+        self.window_min = window_min
+        self.min_timeout = min_timeout
+        self.max_timeout = max_timeout
+        self.timeout_multiplier = timeout_multiplier
+        self.current_timeout = max_timeout
+        self.latencies = collections.deque(maxlen=latency_samples)  # Задержки успешных попыток для таймаута
+        self.window = []  # Задержки успешных попыток текущего окна
+        self.window_errors = 0
+        self.since_decrease = 0  # Попыток с последнего снижения лимита
+        self.baseline = None
+        self.in_flight = 0
+        self.decreases = 0
+        self.condition = threading.Condition()
+
+    def set_max_limit(self, max_limit):
+        """Верхняя граница по числу рабочих потоков; лимит начинает с нее."""
+        with self.condition:
+            self.max_limit = max(1, max_limit)
+            self.min_limit = min(self.requested_min_limit, self.max_limit)
+            self.limit = float(self.max_limit)
+            self.condition.notify_all()
+
+    def acquire(self, timeout=None):
+        """Ждет свободного места в пределах лимита. Возвращает False, если за `timeout` секунд места не появилось."""
+        with self.condition:
+            if not self.condition.wait_for(lambda: self.in_flight < int(self.limit), timeout):
+                return False
+            self.in_flight += 1
+            return True
+
+    def release(self):
+        with self.condition:
+            self.in_flight -= 1
+            self.condition.notify()
+
+    def timeout(self):
+        return self.current_timeout
+
+    def observe(self, latency, outcome):
+        """Итог одной попытки запроса: задержка в секундах и исход (`OUTCOME_*`)."""
+        with self.condition:
+            self.since_decrease += 1
+            if outcome == OUTCOME_OK:
+                self.window.append(latency)
+                self.latencies.append(latency)
+            else:
+                self.window_errors += 1
+                if outcome == OUTCOME_TIMEOUT:
+                    self.current_timeout = min(self.max_timeout, self.current_timeout * 2)
+                if outcome in (OUTCOME_TIMEOUT, OUTCOME_OVERLOAD):
+                    self._decrease("таймаут" if outcome == OUTCOME_TIMEOUT else "перегрузка сервера")
+            if len(self.window) + self.window_errors >= max(self.window_min, int(self.limit)):
+                self._close_window()
+
+    def _close_window(self):
+        total = len(self.window) + self.window_errors
+        error_rate = self.window_errors / total
+        p95 = percentile(sorted(self.window), 0.95)
+        if error_rate > self.error_rate_max:
+            self._decrease(f"доля ошибок {error_rate:.0%}")
+        elif p95 is not None and self.baseline is not None and p95 > self.baseline * self.latency_tolerance:
+            self._decrease(f"p95 задержки {p95:.2f} с при обычной {self.baseline:.2f} с")
+        elif self.limit < self.max_limit:
+            self.limit = min(self.max_limit, self.limit + 1)
+            self.condition.notify()
+        if p95 is not None:
+            # Базовая задержка быстро опускается и медленно поднимается
+            alpha = 0.5 if self.baseline is None or p95 < self.baseline else 0.05
+            self.baseline = p95 if self.baseline is None else self.baseline + alpha * (p95 - self.baseline)
+        if len(self.latencies) >= self.window_min:
+            p99 = percentile(sorted(self.latencies), 0.99)
+            self.current_timeout = min(self.max_timeout, max(self.min_timeout, p99 * self.timeout_multiplier))
+        self.window = []
+        self.window_errors = 0
+
+    def _decrease(self, reason):
+        if self.since_decrease < max(self.window_min, int(self.limit)) and self.decreases:
+            return  # Не чаще раза за окно: ошибки уже отправленных запросов относятся к прежнему лимиту
+        previous = int(self.limit)
+        self.limit = max(self.min_limit, self.limit * self.backoff)
+        self.since_decrease = 0
+        self.decreases += 1
+        if int(self.limit) < previous:
+            logger.warning(f"Одновременных запросов: {previous} -> {int(self.limit)} ({reason}).")
+
+    def snapshot(self):
+        with self.condition:
+            return {
+                "concurrency_limit": int(self.limit),
+                "concurrency_in_flight": self.in_flight,
+                "request_timeout_seconds": round(self.current_timeout, 3),
+                "concurrency_decreases": self.decreases,
+            }
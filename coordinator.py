@@ -0,0 +1,516 @@
+"""
+Координатор для нескольких воркеров: общая очередь ОГРН и аренда API-ключей.
+
+Вместо собственных `APIs.txt`, `ogrns.txt` и `api_count.json` воркеры берут ОГРН и ключи у координатора
+во временную аренду (lease) и сообщают ему результаты. Аренда продлевается, пока воркер жив; если воркер упал,
+по истечении срока его ОГРН и ключи возвращаются в общий пул. Ключ в каждый момент арендован только одним
+воркером, а его статистика хранится у координатора, поэтому два воркера никогда не расходуют лимит одного ключа
+одновременно. Когда у арендованных ключей исчерпан лимит, воркер арендует следующие, пока в пуле есть ключи
+с остатком лимита. Результаты по ОГРН воркер копит и отправляет пачками из фонового потока, повторяя отправку,
+если координатор временно недоступен.
+
+Хранилище - файл SQLite. Воркеры на одной машине (или на общем диске) подключаются к нему напрямую, воркеры на
+разных машинах - через небольшой HTTP-сервис поверх той же базы (`python coordinator.py serve`). Сервис выдает
+ключи API, поэтому принимает только запросы с общим секретом `COORDINATOR_TOKEN` в заголовке `X-Coordinator-Token`
+(без него сервис не запускается) и по умолчанию слушает только 127.0.0.1.
+
+Запуск:
+    python coordinator.py init --db coordinator.sqlite --keys "api_keys_part_*.txt" --ogrns "ogrns_part_*.txt"
+    COORDINATOR_TOKEN=секрет python coordinator.py serve --db coordinator.sqlite --host 0.0.0.0 --port 8765
+    python coordinator.py status --db coordinator.sqlite
+    python coordinator.py reset --db coordinator.sqlite    # вернуть в работу ОГРН, исчерпавшие число попыток
+    COORDINATOR=coordinator.sqlite python api_scraper.py        # или COORDINATOR=http://host:8765 COORDINATOR_TOKEN=секрет
+"""
+
+import argparse
+import datetime
+import glob
+import hmac
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import timezone
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+import requests
+
+from ogrn_input import OgrnStream
+
+logger = logging.getLogger("api_scraper")
+
+FINAL_STATUSES = ("ok", "dead")
+TOKEN_HEADER = "X-Coordinator-Token"
+RESULT_FLUSH_ATTEMPTS = 5  # Попыток отправить оставшиеся результаты при завершении воркера
+DEFAULT_USAGE = {"total_requests": 0, "today_requests": 0, "last_used": None, "last_reset": None}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS ogrns (
+    ogrn TEXT PRIMARY KEY,
+    status TEXT NOT NULL DEFAULT 'pending',
+    lease_owner TEXT,
+    lease_expires REAL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    updated_at REAL
+);
+CREATE INDEX IF NOT EXISTS ogrns_status ON ogrns (status, lease_expires);
+CREATE TABLE IF NOT EXISTS api_keys (
+    api_key TEXT PRIMARY KEY,
+    usage TEXT NOT NULL DEFAULT '{}',
+    removed INTEGER NOT NULL DEFAULT 0,
+    lease_owner TEXT,
+    lease_expires REAL
+);
+"""
+
+
+def key_has_quota(usage, daily_limit, now):
+    """Повторяет правило api_scraper: ключ доступен, если лимит не исчерпан или время сброса уже наступило."""
+    if usage.get("today_requests", 0) < daily_limit:
+        return True
+    try:
+        next_reset = datetime.datetime.fromisoformat(usage.get("next_reset") or "")
+    except ValueError:
+        return True
+    if next_reset.tzinfo is None:
+        next_reset = next_reset.replace(tzinfo=timezone.utc)
+    return now >= next_reset
+
+
+class SqliteCoordinator:
+    """Координатор поверх файла SQLite. Все изменения выполняются в транзакциях BEGIN IMMEDIATE."""
+
+    def __init__(self, db_path, lease_seconds=300, daily_limit=99, max_attempts=3):
+        self.db_path = db_path
+        self.lease_seconds = lease_seconds
+        self.daily_limit = daily_limit
+        self.max_attempts = max_attempts
+        self.lock = threading.Lock()
+        self.conn = sqlite3.connect(db_path, timeout=30, check_same_thread=False, isolation_level=None)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.executescript(SCHEMA)
+
+    def _transaction(self, work):
+        with self.lock:
+            self.conn.execute("BEGIN IMMEDIATE")
+            try:
+                result = work(self.conn)
+                self.conn.execute("COMMIT")
+                return result
+            except BaseException:
+                self.conn.execute("ROLLBACK")
+                raise
+
+    def add_ogrns(self, ogrns):
+        def work(conn):
+            before = conn.total_changes
+            conn.executemany("INSERT OR IGNORE INTO ogrns (ogrn) VALUES (?)", ((ogrn,) for ogrn in ogrns))
+            return conn.total_changes - before
+        return self._transaction(work)
+
+    def add_keys(self, api_keys, api_usage=None):
+        api_usage = api_usage or {}
+        def work(conn):
+            before = conn.total_changes
+            conn.executemany(
+                "INSERT OR IGNORE INTO api_keys (api_key, usage) VALUES (?, ?)",
+                ((key, json.dumps(api_usage.get(key, DEFAULT_USAGE), ensure_ascii=False)) for key in api_keys),
+            )
+            return conn.total_changes - before
+        return self._transaction(work)
+
+    def lease_keys(self, worker, count):
+        """Арендует до `count` свободных ключей с остатком лимита. Возвращает {ключ: статистика}."""
+        now = time.time()
+        utc_now = datetime.datetime.now(timezone.utc)
+        def work(conn):
+            rows = conn.execute(
+                "SELECT api_key, usage FROM api_keys WHERE removed = 0 AND "
+                "(lease_owner IS NULL OR lease_owner = ? OR lease_expires < ?)",
+                (worker, now),
+            ).fetchall()
+            leased = {}
+            for api_key, usage in rows:
+                usage = json.loads(usage)
+                if len(leased) < count and key_has_quota(usage, self.daily_limit, utc_now):
+                    leased[api_key] = usage
+            conn.executemany(
+                "UPDATE api_keys SET lease_owner = ?, lease_expires = ? WHERE api_key = ?",
+                ((worker, now + self.lease_seconds, key) for key in leased),
+            )
+            return leased
+        return self._transaction(work)
+
+    def lease_ogrns(self, worker, count):
+        """Арендует до `count` ОГРН: новые, с временной ошибкой или с истекшей арендой.
+        Попытка засчитывается, когда воркер сообщил временную ошибку (`report`) или не вернул аренду (упал);
+        ОГРН, который воркер не успел запросить и вернул при завершении, попытку не тратит.
+        ОГРН с `max_attempts` попытками больше не выдаются (их возвращает команда reset)."""
+        now = time.time()
+        def work(conn):
+            rows = conn.execute(
+                "SELECT ogrn FROM ogrns WHERE status NOT IN (?, ?) AND attempts < ? AND "
+                "(lease_owner IS NULL OR lease_expires < ?) ORDER BY attempts, rowid LIMIT ?",
+                (*FINAL_STATUSES, self.max_attempts, now, count),
+            ).fetchall()
+            ogrns = [row[0] for row in rows]
+            # lease_owner в выражении - прежний владелец: аренда истекла, значит воркер упал на этом ОГРН
+            conn.executemany(
+                "UPDATE ogrns SET lease_owner = ?, lease_expires = ?, attempts = attempts + (lease_owner IS NOT NULL) "
+                "WHERE ogrn = ?",
+                ((worker, now + self.lease_seconds, ogrn) for ogrn in ogrns),
+            )
+            return ogrns
+        return self._transaction(work)
+
+    def report(self, worker, results):
+        """Записывает результаты [(ОГРН, статус)] и снимает аренду с этих ОГРН."""
+        now = time.time()
+        def work(conn):
+            conn.executemany(
+                "UPDATE ogrns SET status = ?, lease_owner = NULL, lease_expires = NULL, updated_at = ?, "
+                "attempts = attempts + (? = 'retry') WHERE ogrn = ? AND (lease_owner = ? OR lease_owner IS NULL)",
+                ((status, now, status, ogrn, worker) for ogrn, status in results),
+            )
+        self._transaction(work)
+
+    def sync(self, worker, api_usage, removed=(), release=False):
+        """Сохраняет статистику арендованных ключей и продлевает аренду воркера (или снимает ее при release=True)."""
+        now = time.time()
+        expires = None if release else now + self.lease_seconds
+        owner = None if release else worker
+        def work(conn):
+            conn.executemany(
+                "UPDATE api_keys SET usage = ? WHERE api_key = ? AND lease_owner = ?",
+                ((json.dumps(usage, ensure_ascii=False), key, worker) for key, usage in api_usage.items()),
+            )
+            conn.executemany("UPDATE api_keys SET removed = 1 WHERE api_key = ?", ((key,) for key in removed))
+            conn.execute("UPDATE api_keys SET lease_owner = ?, lease_expires = ? WHERE lease_owner = ?", (owner, expires, worker))
+            conn.execute("UPDATE ogrns SET lease_owner = ?, lease_expires = ? WHERE lease_owner = ?", (owner, expires, worker))
+        self._transaction(work)
+
+    def reset_attempts(self):
+        """Обнуляет счетчик попыток у необработанных ОГРН (например, перед запуском на следующий день)."""
+        def work(conn):
+            return conn.execute("UPDATE ogrns SET attempts = 0 WHERE status NOT IN (?, ?)", FINAL_STATUSES).rowcount
+        return self._transaction(work)
+
+    def status(self):
+        with self.lock:
+            ogrns = dict(self.conn.execute("SELECT status, COUNT(*) FROM ogrns GROUP BY status").fetchall())
+            leased = self.conn.execute("SELECT COUNT(*) FROM ogrns WHERE lease_owner IS NOT NULL").fetchone()[0]
+            keys = self.conn.execute(
+                "SELECT COUNT(*), SUM(removed), SUM(lease_owner IS NOT NULL AND removed = 0) FROM api_keys"
+            ).fetchone()
+        return {"ogrns": ogrns, "ogrns_leased": leased, "keys": keys[0], "keys_removed": keys[1] or 0, "keys_leased": keys[2] or 0}
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class RemoteCoordinator:
+    """Клиент HTTP-сервиса координатора с тем же набором методов, что и SqliteCoordinator."""
+
+    def __init__(self, base_url, token="", timeout=30):
+        self.base_url = base_url.rstrip("/")
+        self.timeout = timeout
+        self.session = requests.Session()
+        self.session.headers[TOKEN_HEADER] = token
+
+    def _call(self, method, **payload):
+        response = self.session.post(f"{self.base_url}/{method}", json=payload, timeout=self.timeout)
+        response.raise_for_status()
+        return response.json()
+
+    def lease_keys(self, worker, count):
+        return self._call("lease_keys", worker=worker, count=count)
+
+    def lease_ogrns(self, worker, count):
+        return self._call("lease_ogrns", worker=worker, count=count)
+
+    def report(self, worker, results):
+        self._call("report", worker=worker, results=results)
+
+    def sync(self, worker, api_usage, removed=(), release=False):
+        self._call("sync", worker=worker, api_usage=api_usage, removed=list(removed), release=release)
+
+    def status(self):
+        return self._call("status")
+
+    def close(self):
+        self.session.close()
+
+
+def open_coordinator(target, lease_seconds=300, daily_limit=99, token=""):
+    """Подключается к координатору: по URL - к HTTP-сервису (с секретом `token`), иначе - к файлу SQLite."""
+    if target.startswith(("http://", "https://")):
+        if not token:
+            logger.warning("COORDINATOR_TOKEN не задан: сервис координатора отклонит запросы.")
+        return RemoteCoordinator(target, token)
+    return SqliteCoordinator(target, lease_seconds, daily_limit)
+
+
+class CoordinatorSession:
+    """Сторона воркера: выдает ОГРН из арендованных пачек, пишет результаты (как журнал прогресса)
+    и в фоне продлевает аренду, сохраняя статистику ключей у координатора.
+
+    Результаты не отправляются по одному из потоков запросов и записи: `record` только кладет их в буфер,
+    а фоновый поток отправляет буфер пачками каждые `flush_seconds` секунд (или как только набралась пачка).
+    Если координатор недоступен, пачка остается в буфере и отправляется при следующей попытке."""
+
+    def __init__(self, backend, worker, batch_size=50, heartbeat_seconds=60, flush_seconds=5):
+        self.backend = backend
+        self.worker = worker
+        self.batch_size = batch_size
+        self.heartbeat_seconds = heartbeat_seconds
+        self.flush_seconds = flush_seconds
+        self.leased_keys = set()
+        self._usage_snapshot = None
+        self._results = []
+        self._results_lock = threading.Lock()
+        self._flush_lock = threading.Lock()
+        self._wake = threading.Event()
+        self._stop = threading.Event()
+        self._thread = None
+
+    def lease_keys(self, count):
+        leased = self.backend.lease_keys(self.worker, count)
+        self.leased_keys.update(leased)
+        logger.info(f"Координатор выдал {len(leased)} API-ключей воркеру {self.worker}.")
+        return leased
+
+    def lease_more_keys(self, count):
+        """Арендует еще ключи, когда у арендованных исчерпан лимит. Сначала сохраняет статистику ключей у координатора,
+        иначе он снова выдал бы воркеру его же исчерпанные ключи."""
+        if self._usage_snapshot:
+            self._sync(release=False)
+        return self.lease_keys(count)
+
+    def iter_ogrns(self):
+        """Генератор ОГРН: арендует у координатора следующую пачку, когда предыдущая выдана."""
+        while True:
+            batch = self.backend.lease_ogrns(self.worker, self.batch_size)
+            if not batch and self._results:
+                # Неотправленные результаты `retry` вернут свои ОГРН в очередь - отправляем их и спрашиваем еще раз
+                try:
+                    self.flush_results()
+                except Exception as e:
+                    logger.warning(f"Не удалось отправить результаты координатору: {e}")
+                batch = self.backend.lease_ogrns(self.worker, self.batch_size)
+            if not batch:
+                return
+            logger.debug(f"Координатор выдал пачку из {len(batch)} ОГРН.")
+            yield from batch
+
+    def record(self, ogrn, status):
+        """Кладет результат в буфер; координатору его отправляет фоновый поток (`flush_results`)."""
+        with self._results_lock:
+            self._results.append((ogrn, status))
+            if len(self._results) >= self.batch_size:
+                self._wake.set()
+
+    def flush_results(self):
+        """Отправляет буфер результатов одной пачкой. При ошибке пачка возвращается в буфер, исключение пробрасывается."""
+        with self._flush_lock:
+            with self._results_lock:
+                results, self._results = self._results, []
+            if not results:
+                return
+            try:
+                self.backend.report(self.worker, results)
+            except Exception:
+                with self._results_lock:
+                    self._results[:0] = results
+                raise
+
+    def start_heartbeat(self, usage_snapshot):
+        """`usage_snapshot()` возвращает (статистика ключей, список действующих ключей) для синхронизации."""
+        self._usage_snapshot = usage_snapshot
+        def run():
+            next_sync = time.monotonic() + self.heartbeat_seconds
+            while not self._stop.is_set():
+                self._wake.wait(max(0.0, min(self.flush_seconds, next_sync - time.monotonic())))
+                self._wake.clear()
+                try:
+                    self.flush_results()
+                except Exception as e:
+                    logger.warning(f"Не удалось отправить результаты координатору (повтор через {self.flush_seconds:g} с): {e}")
+                if time.monotonic() >= next_sync:
+                    next_sync = time.monotonic() + self.heartbeat_seconds
+                    try:
+                        self._sync(release=False)
+                    except Exception as e:
+                        logger.error(f"Ошибка синхронизации с координатором: {e}")
+        self._thread = threading.Thread(target=run, name="coordinator-heartbeat", daemon=True)
+        self._thread.start()
+
+    def _sync(self, release):
+        api_usage, active_keys = self._usage_snapshot() if self._usage_snapshot else ({}, self.leased_keys)
+        usage = {key: api_usage[key] for key in self.leased_keys if key in api_usage}
+        removed = [key for key in self.leased_keys if key not in active_keys]
+        self.backend.sync(self.worker, usage, removed, release=release)
+
+    def close(self):
+        """Сохраняет статистику ключей и возвращает в пул все невыполненные ОГРН и ключи воркера."""
+        self._stop.set()
+        self._wake.set()
+        if self._thread:
+            self._thread.join()
+        for attempt in range(RESULT_FLUSH_ATTEMPTS):
+            try:
+                self.flush_results()
+                break
+            except Exception as e:
+                logger.warning(f"Не удалось отправить результаты координатору (попытка {attempt + 1}): {e}")
+                time.sleep(min(30, 2 ** attempt))
+        else:
+            logger.error(f"Координатору не отправлено результатов: {len(self._results)}; их ОГРН вернутся в очередь.")
+        try:
+            self._sync(release=True)
+        finally:
+            self.backend.close()
+
+
+class CoordinatorHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    disable_nagle_algorithm = True
+    coordinator = None
+    token = ""
+
+    def do_POST(self):
+        method = self.path.strip("/")
+        if not hmac.compare_digest(self.headers.get(TOKEN_HEADER, "").encode(), self.token.encode()):
+            self.close_connection = True  # Тело запроса не читается
+            self.send_error(401)
+            return
+        try:
+            length = int(self.headers.get("Content-Length") or 0)
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if method == "lease_keys":
+                result = self.coordinator.lease_keys(payload["worker"], int(payload["count"]))
+            elif method == "lease_ogrns":
+                result = self.coordinator.lease_ogrns(payload["worker"], int(payload["count"]))
+            elif method == "report":
+                result = self.coordinator.report(payload["worker"], [tuple(item) for item in payload["results"]])
+            elif method == "sync":
+                result = self.coordinator.sync(payload["worker"], payload["api_usage"], payload.get("removed", ()), payload.get("release", False))
+            elif method == "status":
+                result = self.coordinator.status()
+            else:
+                self.send_error(404)
+                return
+            body = json.dumps(result, ensure_ascii=False).encode("utf-8")
+            self.send_response(200)
+        except (KeyError, ValueError) as e:
+            body = json.dumps({"error": str(e)}, ensure_ascii=False).encode("utf-8")
+            self.send_response(400)
+        except Exception as e:
+            # Например, "database is locked" при множестве воркеров: клиент получит ответ 5xx, а не разрыв соединения
+            logger.error(f"Ошибка координатора в методе {method}: {e}")
+            body = json.dumps({"error": str(e)}, ensure_ascii=False).encode("utf-8")
+            self.send_response(503 if isinstance(e, sqlite3.OperationalError) else 500)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        logger.debug(f"Координатор: {format % args}")
+
+
+def serve(coordinator, token, host="127.0.0.1", port=8765):
+    """Запускает HTTP-сервис координатора в фоновом потоке и возвращает сервер (server.shutdown() - остановка).
+    Запросы без секрета `token` в заголовке `X-Coordinator-Token` отклоняются с кодом 401."""
+    if not token:
+        raise ValueError("Для сервиса координатора нужен секрет COORDINATOR_TOKEN")
+    handler = type("BoundCoordinatorHandler", (CoordinatorHandler,), {"coordinator": coordinator, "token": token})
+    server = ThreadingHTTPServer((host, port), handler)
+    threading.Thread(target=server.serve_forever, name="coordinator-http", daemon=True).start()
+    return server
+
+
+def read_lines(patterns):
+    seen = set()
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            with open(path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    line = line.strip()
+                    if line and line not in seen:
+                        seen.add(line)
+                        yield line
+
+
+def read_ogrns(patterns):
+    """ОГРН из файлов (текст, gzip, CSV) с проверкой контрольных сумм. Повторы отбрасывает сама база."""
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            ogrn_stream = OgrnStream(path, dedup="none")
+            yield from ogrn_stream
+            if ogrn_stream.invalid:
+                logger.warning(f"В файле {path} пропущено {ogrn_stream.invalid} неверных ОГРН.")
+
+
+def main():
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    subparsers = parser.add_subparsers(dest="command", required=True)
+
+    init_parser = subparsers.add_parser("init", help="загрузить ключи, ОГРН и статистику в базу координатора")
+    init_parser.add_argument("--db", default="coordinator.sqlite")
+    init_parser.add_argument("--keys", nargs="+", default=["api_keys_part_*.txt"])
+    init_parser.add_argument("--ogrns", nargs="+", default=["ogrns_part_*.txt"])
+    init_parser.add_argument("--usage", nargs="*", default=[], help="файлы api_count.json со статистикой ключей")
+
+    serve_parser = subparsers.add_parser("serve", help="запустить HTTP-сервис координатора")
+    serve_parser.add_argument("--db", default="coordinator.sqlite")
+    serve_parser.add_argument("--host", default="127.0.0.1", help="адрес (0.0.0.0 - для воркеров на других машинах)")
+    serve_parser.add_argument("--token", default=os.environ.get("COORDINATOR_TOKEN", ""),
+                              help="общий секрет воркеров (по умолчанию COORDINATOR_TOKEN)")
+    serve_parser.add_argument("--port", type=int, default=8765)
+    serve_parser.add_argument("--lease-seconds", type=int, default=300)
+
+    status_parser = subparsers.add_parser("status", help="показать состояние очереди и ключей")
+    status_parser.add_argument("--db", default="coordinator.sqlite")
+
+    reset_parser = subparsers.add_parser("reset", help="обнулить счетчик попыток у необработанных ОГРН")
+    reset_parser.add_argument("--db", default="coordinator.sqlite")
+
+    args = parser.parse_args()
+    if args.command == "init":
+        coordinator = SqliteCoordinator(args.db)
+        api_usage = {}
+        for path in args.usage:
+            with open(path, 'r', encoding='utf-8') as f:
+                api_usage.update(json.load(f))
+        logger.info(f"Добавлено ключей: {coordinator.add_keys(list(read_lines(args.keys)), api_usage)}")
+        logger.info(f"Добавлено ОГРН: {coordinator.add_ogrns(read_ogrns(args.ogrns))}")
+        coordinator.close()
+    elif args.command == "serve":
+        if not args.token:
+            logger.critical("Задайте общий секрет воркеров: COORDINATOR_TOKEN или --token.")
+            return
+        coordinator = SqliteCoordinator(args.db, args.lease_seconds)
+        server = serve(coordinator, args.token, args.host, args.port)
+        logger.info(f"Координатор слушает http://{args.host}:{args.port} (база {args.db}).")
+        try:
+            while True:
+                time.sleep(3600)
+        except KeyboardInterrupt:
+            server.shutdown()
+            coordinator.close()
+    elif args.command == "status":
+        coordinator = SqliteCoordinator(args.db)
+        print(json.dumps(coordinator.status(), ensure_ascii=False, indent=4))
+        coordinator.close()
+    elif args.command == "reset":
+        coordinator = SqliteCoordinator(args.db)
+        logger.info(f"Счетчик попыток обнулен у {coordinator.reset_attempts()} ОГРН.")
+        coordinator.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,332 @@
+"""
+Разбор сохраненных ответов API Checko в таблицы для запросов (этап после скачивания).
+
+Читает ответы из хранилища скрапера (`--sink`: `files` - `JSONs/*.json.gz`, `ndjson` - сегменты с индексом,
+`sqlite` - `JSONs/responses.sqlite`) и раскладывает основные поля в базу SQLite `tables.sqlite` с индексами:
+    companies - ОГРН, ИНН, КПП, ОКПО, наименования, статус, дата регистрации, регион, юридический адрес,
+                основной ОКВЭД, уставный капитал;
+    okved     - все виды деятельности (основной и дополнительные), индекс по коду;
+    founders  - учредители (вид, наименование или ФИО, ИНН, ОГРН, доля), индексы по ИНН и ОГРН учредителя;
+    finances  - финансовые показатели `Финансы` в длинном формате (год, код строки, значение).
+
+Ответы читаются и разбираются в пуле процессов пачками по `--batch`, запись в базу - в основном процессе.
+Обновление инкрементальное: таблица `extracted` хранит для каждого ОГРН версию источника (размер и время
+изменения файла, место в сегменте или время сохранения в SQLite) и хеш содержимого (`response_cache.payload_digest`,
+без объекта `meta`). Ответы с прежней версией не читаются; перечитанные ответы с прежним хешем не разбираются
+и не перезаписываются. `--full` разбирает все ответы заново.
+
+С `--parquet` таблицы дополнительно выгружаются в файлы Parquet (нужен пакет `pyarrow`).
+
+Запуск:
+    python extract_tables.py
+    python extract_tables.py --sink ndjson --workers 8 --parquet tables/
+"""
+
+import argparse
+import concurrent.futures
+import json
+import logging
+import os
+import sqlite3
+import time
+
+try:
+    import pyarrow
+    import pyarrow.parquet
+except ImportError:
+    pyarrow = None
+
+from output_sinks import CODEC_EXTENSIONS, decompress
+from response_cache import payload_digest
+
+logger = logging.getLogger("api_scraper")
+
+OUTPUT_SINK = os.environ.get("OUTPUT_SINK", "files")  # Тот же параметр, что и у api_scraper.py
+
+# Колонки таблиц: (имя, тип SQLite). Тип определяет и тип колонки Parquet.
+TABLES = {
+    "companies": [
+        ("ogrn", "TEXT"), ("inn", "TEXT"), ("kpp", "TEXT"), ("okpo", "TEXT"), ("name_short", "TEXT"),
+        ("name_full", "TEXT"), ("status", "TEXT"), ("reg_date", "TEXT"), ("liquidation_date", "TEXT"),
+        ("region", "TEXT"), ("locality", "TEXT"), ("address", "TEXT"), ("okved_code", "TEXT"),
+        ("okved_name", "TEXT"), ("capital", "REAL"),
+    ],
+    "okved": [("ogrn", "TEXT"), ("code", "TEXT"), ("name", "TEXT"), ("is_main", "INTEGER")],
+    "founders": [
+        ("ogrn", "TEXT"), ("kind", "TEXT"), ("name", "TEXT"), ("inn", "TEXT"), ("founder_ogrn", "TEXT"),
+        ("share_percent", "REAL"), ("share_nominal", "REAL"),
+    ],
+    "finances": [("ogrn", "TEXT"), ("year", "INTEGER"), ("code", "TEXT"), ("value", "REAL")],
+}
+INDEXES = [
+    "CREATE INDEX IF NOT EXISTS companies_inn ON companies (inn)",
+    "CREATE INDEX IF NOT EXISTS okved_ogrn ON okved (ogrn)",
+    "CREATE INDEX IF NOT EXISTS okved_code ON okved (code)",
+    "CREATE INDEX IF NOT EXISTS founders_ogrn ON founders (ogrn)",
+    "CREATE INDEX IF NOT EXISTS founders_inn ON founders (inn)",
+    "CREATE INDEX IF NOT EXISTS founders_founder_ogrn ON founders (founder_ogrn)",
+    "CREATE INDEX IF NOT EXISTS finances_ogrn ON finances (ogrn, year)",
+    "CREATE INDEX IF NOT EXISTS finances_code ON finances (code, year)",
+]
+PARQUET_TYPES = {"TEXT": "string", "REAL": "float64", "INTEGER": "int64"}
+
+
+def open_tables(db_path):
+    os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+    conn = sqlite3.connect(db_path)
+    conn.execute("PRAGMA journal_mode=WAL")
+    conn.execute("PRAGMA synchronous=NORMAL")
+    for table, columns in TABLES.items():
+        definition = ", ".join(f"{name} {kind}" + (" PRIMARY KEY" if table == "companies" and name == "ogrn" else "")
+                               for name, kind in columns)
+        conn.execute(f"CREATE TABLE IF NOT EXISTS {table} ({definition})")
+    conn.execute(
+        "CREATE TABLE IF NOT EXISTS extracted (ogrn TEXT PRIMARY KEY, version TEXT, hash TEXT, extracted_at REAL)"
+    )
+    for statement in INDEXES:
+        conn.execute(statement)
+    conn.commit()
+    return conn
+
+
+def stored_sources(kind, output_dir):
+    """(ОГРН, версия, место) по всем сохраненным ответам. Версия меняется при каждой перезаписи ответа."""
+    if kind == "ndjson":
+        segments_dir = os.path.join(output_dir, "segments")
+        locations = {}
+        index_path = os.path.join(segments_dir, "index.tsv")
+        if os.path.exists(index_path):
+            with open(index_path, 'r', encoding='utf-8') as f:
+                for line in f:
+                    parts = line.rstrip("\n").split("\t")
+                    if len(parts) == 4:
+                        locations[parts[0]] = (parts[1], int(parts[2]), int(parts[3]))  # Последняя запись важнее
+        for ogrn, (segment, offset, length) in locations.items():
+            codec = "zstd" if segment.endswith(CODEC_EXTENSIONS["zstd"]) else "gzip"
+            yield ogrn, f"{segment}:{offset}", ("ndjson", os.path.join(segments_dir, segment), offset, length, codec)
+    elif kind == "sqlite":
+        db_path = os.path.join(output_dir, "responses.sqlite")
+        if not os.path.exists(db_path):
+            return
+        conn = sqlite3.connect(db_path)
+        try:
+            for ogrn, saved_at in conn.execute("SELECT ogrn, saved_at FROM responses"):
+                yield ogrn, saved_at, ("sqlite", db_path)
+        finally:
+            conn.close()
+    else:
+        if not os.path.isdir(output_dir):
+            return
+        with os.scandir(output_dir) as entries:
+            for entry in entries:
+                if entry.name.endswith(".json.gz"):
+                    stat = entry.stat()
+                    yield entry.name[:-len(".json.gz")], f"{stat.st_size}:{stat.st_mtime_ns}", ("files", entry.path)
+
+
+_sqlite_connections = {}  # Соединения с базой ответов, по одному на процесс пула
+
+
+def read_raw(ogrn, location):
+    kind = location[0]
+    if kind == "ndjson":
+        _, path, offset, length, codec = location
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            return decompress(codec, f.read(length))
+    if kind == "sqlite":
+        conn = _sqlite_connections.get(location[1])
+        if conn is None:
+            conn = _sqlite_connections[location[1]] = sqlite3.connect(f"file:{location[1]}?mode=ro", uri=True)
+        row = conn.execute("SELECT codec, data FROM responses WHERE ogrn = ?", (ogrn,)).fetchone()
+        if row is None:
+            raise FileNotFoundError(f"ОГРН {ogrn} нет в {location[1]}")
+        return decompress(row[0], row[1])
+    with open(location[1], 'rb') as f:
+        return decompress("gzip", f.read())
+
+
+def number(value):
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return float(value)
+    if isinstance(value, str):
+        try:
+            return float(value.replace(" ", "").replace(",", "."))
+        except ValueError:
+            return None
+    return None
+
+
+def nested(data, *path):
+    for name in path:
+        if not isinstance(data, dict):
+            return None
+        data = data.get(name)
+    return data
+
+
+def flatten(ogrn, data):
+    """Строки таблиц по полю `data` ответа: {таблица: [кортежи в порядке колонок TABLES]}."""
+    okved_main = data.get("ОКВЭД") if isinstance(data.get("ОКВЭД"), dict) else {}
+    rows = {"companies": [(
+        ogrn, data.get("ИНН"), data.get("КПП"), data.get("ОКПО"),
+        data.get("НаимСокр") or data.get("ФИО"), data.get("НаимПолн") or data.get("ФИО"),
+        nested(data, "Статус", "Наим"), data.get("ДатаРег") or data.get("ДатаОГРН"), nested(data, "Ликвид", "Дата"),
+        nested(data, "Регион", "Наим"), nested(data, "ЮрАдрес", "НасПункт"), nested(data, "ЮрАдрес", "АдресРФ"),
+        okved_main.get("Код"), okved_main.get("Наим"), number(nested(data, "УстКап", "Сумма")),
+    )], "okved": [], "founders": [], "finances": []}
+
+    if okved_main.get("Код"):
+        rows["okved"].append((ogrn, okved_main.get("Код"), okved_main.get("Наим"), 1))
+    for item in data.get("ОКВЭДДоп") or []:
+        if isinstance(item, dict) and item.get("Код"):
+            rows["okved"].append((ogrn, item.get("Код"), item.get("Наим"), 0))
+
+    founders = data.get("Учред") if isinstance(data.get("Учред"), dict) else {}
+    for founder_kind, items in founders.items():
+        for item in items if isinstance(items, list) else []:
+            if not isinstance(item, dict):
+                continue
+            rows["founders"].append((
+                ogrn, founder_kind, item.get("ФИО") or item.get("НаимСокр") or item.get("НаимПолн"),
+                item.get("ИНН"), item.get("ОГРН"),
+                number(nested(item, "Доля", "Процент")), number(nested(item, "Доля", "Номинал")),
+            ))
+
+    finances = data.get("Финансы") if isinstance(data.get("Финансы"), dict) else {}
+    for year, lines in finances.items():
+        if not str(year).isdigit() or not isinstance(lines, dict):
+            continue
+        for code, value in lines.items():
+            value = number(value)
+            if value is not None:
+                rows["finances"].append((ogrn, int(year), str(code), value))
+    return rows
+
+
+def extract_batch(items):
+    """Выполняется в процессе пула. Для каждого (ОГРН, версия, место, прежний хеш) возвращает
+    (ОГРН, версия, хеш, строки таблиц или None, если содержимое не изменилось, текст ошибки или None)."""
+    results = []
+    for ogrn, version, location, known_hash in items:
+        try:
+            raw = read_raw(ogrn, location)
+            digest = payload_digest(raw)
+            if digest == known_hash:
+                results.append((ogrn, version, digest, None, None))
+                continue
+            data = json.loads(raw).get("data")
+            if not isinstance(data, dict):
+                raise ValueError("в ответе нет объекта data")
+            results.append((ogrn, version, digest, flatten(ogrn, data), None))
+        except Exception as e:
+            results.append((ogrn, version, None, None, f"{type(e).__name__}: {e}"))
+    return results
+
+
+def apply_results(conn, results, counters):
+    now = time.time()
+    with conn:
+        for ogrn, version, digest, rows, error in results:
+            if error:
+                counters["errors"] += 1
+                logger.error(f"Не удалось разобрать ответ ОГРН {ogrn}: {error}")
+                continue
+            if rows is None:
+                counters["unchanged"] += 1
+                conn.execute("UPDATE extracted SET version = ?, extracted_at = ? WHERE ogrn = ?", (version, now, ogrn))
+                continue
+            counters["changed"] += 1
+            for table, columns in TABLES.items():
+                if table != "companies":
+                    conn.execute(f"DELETE FROM {table} WHERE ogrn = ?", (ogrn,))
+                placeholders = ", ".join("?" * len(columns))
+                verb = "INSERT OR REPLACE" if table == "companies" else "INSERT"
+                conn.executemany(f"{verb} INTO {table} VALUES ({placeholders})", rows[table])
+            conn.execute("INSERT OR REPLACE INTO extracted (ogrn, version, hash, extracted_at) VALUES (?, ?, ?, ?)",
+                         (ogrn, version, digest, now))
+
+
+def pending_batches(sources, known, batch_size, full, counters):
+    batch = []
+    for ogrn, version, location in sources:
+        counters["stored"] += 1
+        previous = known.get(ogrn)
+        if previous is not None and previous[0] == version and not full:
+            counters["skipped"] += 1
+            continue
+        batch.append((ogrn, version, location, None if full or previous is None else previous[1]))
+        if len(batch) >= batch_size:
+            yield batch
+            batch = []
+    if batch:
+        yield batch
+
+
+def extract(sink, output_dir, db_path, workers, batch_size=200, full=False):
+    conn = open_tables(db_path)
+    known = {row[0]: (row[1], row[2]) for row in conn.execute("SELECT ogrn, version, hash FROM extracted")}
+    counters = {"stored": 0, "skipped": 0, "changed": 0, "unchanged": 0, "errors": 0}
+    started = time.monotonic()
+    batches = pending_batches(stored_sources(sink, output_dir), known, batch_size, full, counters)
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        # Не больше двух пачек на процесс в очереди: ответы читаются по мере записи, а не все сразу
+        running = set()
+        for batch in batches:
+            running.add(pool.submit(extract_batch, batch))
+            if len(running) >= workers * 2:
+                done, running = concurrent.futures.wait(running, return_when=concurrent.futures.FIRST_COMPLETED)
+                for future in done:
+                    apply_results(conn, future.result(), counters)
+        for future in concurrent.futures.as_completed(running):
+            apply_results(conn, future.result(), counters)
+    counters["seconds"] = round(time.monotonic() - started, 1)
+    return conn, counters
+
+
+def export_parquet(conn, out_dir, batch_rows=100_000):
+    if pyarrow is None:
+        logger.warning("Пакет pyarrow не установлен (pip install pyarrow). Выгрузка в Parquet пропущена.")
+        return
+    os.makedirs(out_dir, exist_ok=True)
+    for table, columns in TABLES.items():
+        schema = pyarrow.schema([(name, PARQUET_TYPES[kind]) for name, kind in columns])
+        path = os.path.join(out_dir, f"{table}.parquet")
+        cursor = conn.execute(f"SELECT * FROM {table}")
+        with pyarrow.parquet.ParquetWriter(path, schema) as writer:
+            while True:
+                rows = cursor.fetchmany(batch_rows)
+                if not rows:
+                    break
+                writer.write_table(pyarrow.Table.from_pylist([dict(zip(schema.names, row)) for row in rows], schema))
+        logger.info(f"Таблица {table} выгружена в {path}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--sink", default=OUTPUT_SINK, choices=("files", "ndjson", "sqlite"),
+                        help="способ, которым сохранены ответы (по умолчанию OUTPUT_SINK)")
+    parser.add_argument("--input", default="JSONs", help="папка с сохраненными ответами")
+    parser.add_argument("--db", default="tables.sqlite", help="база SQLite с таблицами")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="число процессов разбора")
+    parser.add_argument("--batch", type=int, default=200, help="ответов в пачке для одного процесса")
+    parser.add_argument("--full", action="store_true", help="разобрать все ответы заново")
+    parser.add_argument("--parquet", default="", help="папка для выгрузки таблиц в Parquet")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+
+    conn, counters = extract(args.sink, args.input, args.db, max(1, args.workers), max(1, args.batch), args.full)
+    logger.info(
+        f"Ответов в хранилище: {counters['stored']}, без изменений (не читались): {counters['skipped']}, "
+        f"разобрано: {counters['changed']}, содержимое не изменилось: {counters['unchanged']}, "
+        f"ошибок: {counters['errors']} за {counters['seconds']} с."
+    )
+    for table in TABLES:
+        logger.info(f"Строк в таблице {table}: {conn.execute(f'SELECT COUNT(*) FROM {table}').fetchone()[0]}")
+    if args.parquet:
+        export_parquet(conn, args.parquet)
+    conn.close()
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,154 @@
+"""
+HTTP-клиент для запросов к API Checko.
+
+Все рабочие потоки используют одну сессию `requests.Session` с пулом постоянных соединений (keep-alive),
+поэтому TCP- и TLS-рукопожатие с api.checko.ru выполняется один раз на соединение, а не на каждый ОГРН.
+Размер пула подстраивается под число рабочих потоков.
+
+Временные ошибки (таймауты, разрывы соединения, ответы 5xx) повторяются с экспоненциальной паузой
+и случайным разбросом (jitter). Ответы с ошибкой ключа (401) и ошибки лимита не повторяются:
+их обрабатывает вызывающий код.
+
+До `max_retries` раз повторяются только ошибки установки соединения: такой запрос до Checko не дошел.
+Запрос, завершившийся таймаутом чтения, разрывом после отправки или ответом 5xx, мог дойти до API и быть
+засчитан в дневной лимит ключа. Поэтому:
+- каждая такая попытка сообщается вызывающему коду через `charge_attempt()`, и он учитывает ее в счетчике ключа
+  (с запасом: счетчик уточняется по `today_request_count` из следующего успешного ответа API);
+- таких повторов не больше `max_sent_retries` (по умолчанию один) на запрос;
+- перед повтором вызывается `before_retry()` - вызывающий код берет в нем новый токен у планировщика скорости.
+
+Если задан список прокси, каждая попытка идет через следующий прокси из списка по кругу.
+
+Если задан `observer(задержка, исход)`, ему сообщается итог каждой попытки (в том числе повторяемой):
+`ok`, `timeout`, `overload` (429 и 5xx) или `error` (разрыв соединения). Так адаптивный ограничитель
+(`concurrency_limiter.py`) видит перегрузку сервера до того, как исчерпаны повторы.
+"""
+
+import itertools
+import logging
+import random
+import threading
+import time
+
+import requests
+import urllib3
+from requests.adapters import HTTPAdapter
+
+logger = logging.getLogger("api_scraper")
+
+RETRY_STATUS_CODES = frozenset({500, 502, 503, 504})
+OVERLOAD_STATUS_CODES = RETRY_STATUS_CODES | {429}
+
+
+def request_not_sent(e):
+    """True, если ошибка возникла при установке соединения и запрос до сервера не дошел."""
+    if isinstance(e, requests.exceptions.ConnectTimeout):
+        return True
+    if not isinstance(e, requests.exceptions.ConnectionError) or isinstance(e, requests.exceptions.ReadTimeout):
+        return False
+    reason = getattr(e.args[0], "reason", None) if e.args else None
+    return isinstance(reason, (urllib3.exceptions.NewConnectionError, urllib3.exceptions.ProxyError))
+
+
+def load_proxies(file_path):
+    """Загружает список прокси (host:port или полный URL) из текстового файла. Файл необязателен."""
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            proxies = [line.strip() for line in f if line.strip() and not line.startswith("#")]
+        logger.info(f"Загружено {len(proxies)} прокси из файла {file_path}")
+        return proxies
+    except FileNotFoundError:
+        return []
+    except Exception as e:
+        logger.error(f"Ошибка при загрузке списка прокси из файла {file_path}: {e}")
+        return []
+
+
+class CheckoClient:
+    """Пул соединений с повторами временных ошибок и необязательным пулом прокси."""
+
+    def __init__(self, pool_size=10, max_retries=3, backoff_base=0.5, backoff_max=30.0, proxies=None, observer=None,
+                 max_sent_retries=1):
+        self.max_retries = max_retries
+        self.max_sent_retries = max_sent_retries  # Повторов запросов, которые могли дойти до API (и расходуют лимит)
+        self.observer = observer
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.session = requests.Session()
+        self.set_pool_size(pool_size)
+        self.set_proxies(proxies or [])
+
+    def set_pool_size(self, pool_size):
+        """Пересоздает пул соединений так, чтобы каждому рабочему потоку хватало своего соединения."""
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=max(1, pool_size), pool_block=True)
+        self.session.mount("https://", adapter)
+        self.session.mount("http://", adapter)
+
+    def set_proxies(self, proxies):
+        self.proxies = list(proxies)
+        self._proxy_cycle = itertools.cycle(self.proxies) if self.proxies else None
+        self._proxy_lock = threading.Lock()
+
+    def _next_proxy(self):
+        if not self._proxy_cycle:
+            return None
+        with self._proxy_lock:
+            return next(self._proxy_cycle)
+
+    def backoff_delay(self, attempt):
+        """Экспоненциальная пауза с полным случайным разбросом: от 0 до base * 2^attempt (не больше backoff_max)."""
+        return random.uniform(0, min(self.backoff_max, self.backoff_base * (2 ** attempt)))
+
+    def get(self, url, params=None, timeout=30, proxy=None, before_retry=None, charge_attempt=None):
+        """GET-запрос с повторами временных ошибок. Для каждой неудачной попытки, которая могла дойти до сервера
+        (таймаут чтения, разрыв после отправки, 5xx), вызывается `charge_attempt()`, а перед ее повтором -
+        `before_retry()`; таких повторов не больше `max_sent_retries`.
+
+        Возвращает последний полученный ответ (в том числе 5xx, если повторы исчерпаны).
+        Если ответа так и не было, пробрасывает последнее исключение requests."""
+        sent_retries = 0
+        for attempt in range(self.max_retries + 1):
+            attempt_proxy = proxy or self._next_proxy()
+            proxies = None
+            if attempt_proxy:
+                proxy_url = attempt_proxy if "://" in attempt_proxy else f"http://{attempt_proxy}"
+                proxies = {'http': proxy_url, 'https': proxy_url}
+
+            started = time.monotonic()
+            try:
+                response = self.session.get(url, params=params, proxies=proxies, timeout=timeout)
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout) as e:
+                self._observe(started, "timeout" if isinstance(e, requests.exceptions.Timeout) else "error")
+                sent = not request_not_sent(e)
+                if sent and charge_attempt is not None:
+                    charge_attempt()
+                if attempt >= self.max_retries or (sent and sent_retries >= self.max_sent_retries):
+                    raise
+                delay = self.backoff_delay(attempt)
+                logger.warning(f"Временная ошибка соединения ({type(e).__name__}), повтор {attempt + 1}/{self.max_retries} через {delay:.1f} с.")
+                time.sleep(delay)
+                if sent:
+                    sent_retries += 1
+                    if before_retry is not None:
+                        before_retry()
+                continue
+
+            self._observe(started, "overload" if response.status_code in OVERLOAD_STATUS_CODES else "ok")
+            if response.status_code in RETRY_STATUS_CODES:
+                if charge_attempt is not None:
+                    charge_attempt()
+                if attempt < self.max_retries and sent_retries < self.max_sent_retries:
+                    delay = self.backoff_delay(attempt)
+                    logger.warning(f"Ответ сервера {response.status_code}, повтор {attempt + 1}/{self.max_retries} через {delay:.1f} с.")
+                    response.close()
+                    time.sleep(delay)
+                    sent_retries += 1
+                    if before_retry is not None:
+                        before_retry()
+                    continue
+
+            return response
+
+    def _observe(self, started, outcome):
+        if self.observer is not None:
+            self.observer(time.monotonic() - started, outcome)
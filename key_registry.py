@@ -0,0 +1,299 @@
+"""
+Реестр API-ключей в памяти: выбор ключа за O(log n) вместо перебора всех ключей.
+
+Состояние каждого ключа - компактный объект со слотами (`KeyState`), время хранится уже разобранным
+(секунды UTC от эпохи), поэтому строки ISO из `api_count.json` разбираются один раз при загрузке.
+
+- Ключи, с которыми можно сделать запрос (лимит не исчерпан, есть свободный слот), лежат в min-куче по числу
+  использованных запросов (вместе с запросами "в полете"). Выбор ключа - извлечение вершины кучи, возврат ключа
+  и обновление статистики - добавление новой записи. Устаревшие записи кучи отбрасываются при извлечении
+  (у каждой записи есть номер версии состояния ключа).
+- Ключ, у которого планировщик скорости еще не накопил токен, переходит во вторую кучу - по времени появления
+  токена - и возвращается в первую, когда это время наступит. Поэтому выбор ключа проверяет только ключи,
+  готовые к запросу, а не перебирает все ожидающие.
+- Ключи с исчерпанным лимитом в кучу не попадают, а ставятся в колесо таймеров (`TimerWheel`) на время сброса
+  `next_reset`. Колесо проверяется при каждом выборе ключа и возвращает в кучу ключи, у которых наступило время сброса.
+
+Реестр пишет изменения и в словарь статистики `api_usage` (формат `api_count.json`), который записывается на диск
+и передается координатору. Все методы выполняются под общей блокировкой `lock`.
+"""
+
+import datetime
+import heapq
+import logging
+import threading
+import time
+from datetime import timezone
+
+logger = logging.getLogger("api_scraper")
+
+
+def parse_timestamp(value):
+    """Строка ISO (время без часового пояса считается UTC) -> секунды от эпохи. ValueError/TypeError при ошибке."""
+    moment = datetime.datetime.fromisoformat(value)
+    if moment.tzinfo is None:
+        moment = moment.replace(tzinfo=timezone.utc)
+    return moment.timestamp()
+
+
+def format_timestamp(value):
+    return datetime.datetime.fromtimestamp(value, timezone.utc).isoformat() if value is not None else None
+
+
+class KeyState:
+    __slots__ = ("key", "today_requests", "total_requests", "next_reset", "in_flight", "version", "removed", "data",
+                 "ready_at")
+
+    def __init__(self, key, data):
+        self.key = key
+        self.data = data  # Запись ключа в словаре api_usage
+        self.today_requests = data.get("today_requests", 0)
+        self.total_requests = data.get("total_requests", 0)
+        self.next_reset = None
+        self.in_flight = 0
+        self.version = 0
+        self.removed = False
+        self.ready_at = None  # Время (monotonic) появления токена, если ключ ждет во второй куче
+
+
+class TimerWheel:
+    """Колесо таймеров: `size` ячеек по `resolution` секунд. Таймер срабатывает не раньше, чем начнется секунда
+    (ячейка) его срока; таймеры дальше одного оборота колеса ждут в своей ячейке следующих оборотов."""
+
+    __slots__ = ("resolution", "size", "slots", "current")
+
+    def __init__(self, resolution=1.0, size=4096, now=None):
+        self.resolution = resolution
+        self.size = size
+        self.slots = [[] for _ in range(size)]
+        self.current = int((time.time() if now is None else now) // resolution)
+
+    def schedule(self, deadline, item):
+        """Ставит таймер. Возвращает False, если срок уже наступил (таймер не ставится)."""
+        tick = int(deadline // self.resolution)
+        if tick <= self.current:
+            return False
+        self.slots[tick % self.size].append((tick, item))
+        return True
+
+    def advance(self, now):
+        """Сдвигает колесо до момента `now` и возвращает сработавшие элементы."""
+        target = int(now // self.resolution)
+        if target <= self.current:
+            return []
+        fired = []
+        for tick in range(self.current + 1, min(target, self.current + self.size) + 1):
+            index = tick % self.size
+            slot = self.slots[index]
+            if slot:
+                keep = [entry for entry in slot if entry[0] > target]
+                if len(keep) != len(slot):
+                    fired.extend(item for entry_tick, item in slot if entry_tick <= target)
+                    self.slots[index] = keep
+        self.current = target
+        return fired
+
+
+class KeyRegistry:
+    def __init__(self, daily_limit, concurrency_per_key=1, reset_hours=25, lock=None):
+        self.daily_limit = daily_limit
+        self.concurrency_per_key = concurrency_per_key
+        self.reset_seconds = reset_hours * 3600
+        self.lock = lock or threading.RLock()
+        self.api_usage = None
+        self.states = {}
+        self.heap = []
+        self.waiting = []  # (время появления токена, версия, ключ)
+        self.wheel = TimerWheel()
+        self.in_flight_total = 0
+
+    def load(self, api_keys, api_usage):
+        """Строит реестр по списку ключей и словарю статистики (отсутствующие записи создаются)."""
+        with self.lock:
+            now = time.time()
+            self.api_usage = api_usage
+            self.states = {}
+            self.heap = []
+            self.waiting = []
+            self.wheel = TimerWheel(now=now)
+            self.in_flight_total = 0
+            for key in api_keys:
+                self._add(key, now)
+        return self
+
+    def add(self, api_keys):
+        """Добавляет ключи (например, арендованные у координатора) к уже загруженному реестру."""
+        with self.lock:
+            now = time.time()
+            for key in api_keys:
+                if key not in self.states:
+                    self._add(key, now)
+
+    def _add(self, key, now):
+        data = self.api_usage.setdefault(key, {"total_requests": 0, "today_requests": 0, "last_used": None, "last_reset": None})
+        state = self.states[key] = KeyState(key, data)
+        if data.get("next_reset"):
+            try:
+                state.next_reset = parse_timestamp(data["next_reset"])
+            except (ValueError, TypeError):
+                logger.warning(f"Некорректный формат времени сброса для ключа ...{key[-4:]}. Сбрасываем счетчик.")
+                self._reset(state, now, log=False)
+                return
+            if state.next_reset <= now or not self.wheel.schedule(state.next_reset, (key, state.next_reset)):
+                self._reset(state, now)
+                return
+        self._push(state)
+
+    def _available(self, state):
+        return (not state.removed and state.in_flight < self.concurrency_per_key
+                and state.today_requests + state.in_flight < self.daily_limit)
+
+    def _push(self, state):
+        """Новая версия состояния ключа; в кучу кладется, только если с ключом можно сделать запрос."""
+        state.version += 1
+        state.ready_at = None
+        if self._available(state):
+            heapq.heappush(self.heap, (state.today_requests + state.in_flight, state.version, state.key))
+            if len(self.heap) + len(self.waiting) > 4 * len(self.states) + 64:
+                self._compact()
+
+    def _compact(self):
+        available = [state for state in self.states.values() if self._available(state)]
+        self.heap = [(state.today_requests + state.in_flight, state.version, state.key)
+                     for state in available if state.ready_at is None]
+        self.waiting = [(state.ready_at, state.version, state.key) for state in available if state.ready_at is not None]
+        heapq.heapify(self.heap)
+        heapq.heapify(self.waiting)
+
+    def _current(self, entry):
+        state = self.states.get(entry[2])
+        return state if state is not None and state.version == entry[1] else None
+
+    def _reset(self, state, now, log=True):
+        if log:
+            logger.info(f"Сброс счетчика для ключа ...{state.key[-4:]} по таймеру (UTC).")
+        state.today_requests = 0
+        state.next_reset = None
+        state.data["today_requests"] = 0
+        state.data.pop("next_reset", None)
+        state.data["last_reset"] = format_timestamp(now)
+        self._push(state)
+
+    def advance(self, now=None):
+        """Сбрасывает счетчики ключей, у которых наступило время сброса."""
+        now = time.time() if now is None else now
+        for key, deadline in self.wheel.advance(now):
+            state = self.states.get(key)
+            if state is not None and state.next_reset == deadline:
+                self._reset(state, now)
+
+    def acquire(self, try_key):
+        """Занимает слот ключа с наименьшим числом использованных запросов, готового к запросу.
+
+        `try_key(key)` возвращает, сколько секунд ждать до запроса с этим ключом (0 - можно сейчас, токен списан).
+        Ключ, который ответил ожиданием, переходит во вторую кучу и до появления токена не проверяется.
+        Возвращает (ключ, 0), (None, секунды ожидания) или (None, None), если свободных ключей нет."""
+        with self.lock:
+            self.advance()
+            now = time.monotonic()
+            while self.waiting and self.waiting[0][0] <= now:
+                entry = heapq.heappop(self.waiting)
+                state = self._current(entry)
+                if state is not None:
+                    state.ready_at = None
+                    heapq.heappush(self.heap, (state.today_requests + state.in_flight, state.version, state.key))
+            while self.heap:
+                state = self._current(heapq.heappop(self.heap))
+                if state is None:
+                    continue
+                delay = try_key(state.key)
+                if delay > 0:
+                    state.ready_at = now + delay
+                    heapq.heappush(self.waiting, (state.ready_at, state.version, state.key))
+                    continue
+                state.in_flight += 1
+                self.in_flight_total += 1
+                self._push(state)
+                return state.key, 0.0
+            self._drop_stale(self.waiting)
+            return None, (max(0.0, self.waiting[0][0] - now) if self.waiting else None)
+
+    def _drop_stale(self, heap):
+        while heap and self._current(heap[0]) is None:
+            heapq.heappop(heap)
+
+    def release(self, key):
+        with self.lock:
+            state = self.states.get(key)
+            if state is not None and state.in_flight > 0:
+                state.in_flight -= 1
+                self.in_flight_total -= 1
+                self._push(state)
+
+    def peek(self):
+        """Ключ с наименьшим числом использованных запросов без занятия слота (или None). Если все такие ключи
+        ждут токена, возвращает тот, у которого токен появится раньше."""
+        with self.lock:
+            self.advance()
+            for heap in (self.heap, self.waiting):
+                self._drop_stale(heap)
+                if heap:
+                    return heap[0][2]
+            return None
+
+    def earliest_reset(self):
+        """Ближайшее время сброса лимита среди ключей (секунды UTC) или None, если сбросов не назначено."""
+        with self.lock:
+            return min((state.next_reset for state in self.states.values()
+                        if state.next_reset is not None and not state.removed), default=None)
+
+    def set_today_requests(self, key, count):
+        """Счетчик запросов ключа по данным API (или лимит, если API сообщил о его превышении)."""
+        with self.lock:
+            state = self.states.get(key)
+            if state is not None:
+                state.today_requests = count
+                state.data["today_requests"] = count
+                self._push(state)
+
+    def today_requests(self, key):
+        state = self.states.get(key)
+        return state.today_requests if state is not None else 0
+
+    def record_request(self, key, success=True, now=None):
+        """Учитывает запрос с ключом. При достижении лимита назначает сброс через `reset_hours` часов.
+        Возвращает время сброса (секунды UTC) или None, если лимит не достигнут."""
+        with self.lock:
+            state = self.states.get(key)
+            if state is None:
+                return None
+            now = time.time() if now is None else now
+            if success:
+                state.total_requests += 1
+                state.today_requests += 1
+                state.data["total_requests"] = state.total_requests
+                state.data["today_requests"] = state.today_requests
+                state.data["last_used"] = format_timestamp(now)
+            # Время сброса назначается и тогда, когда о превышении лимита сообщил сам API (success=False)
+            if state.today_requests >= self.daily_limit and (success or state.next_reset is None):
+                state.next_reset = now + self.reset_seconds
+                state.data["next_reset"] = format_timestamp(state.next_reset)
+                self.wheel.schedule(state.next_reset, (key, state.next_reset))
+                self._push(state)
+                return state.next_reset
+            self._push(state)
+            return None
+
+    def remove(self, key):
+        with self.lock:
+            state = self.states.pop(key, None)
+            if state is not None:
+                state.removed = True
+                self.in_flight_total -= state.in_flight
+
+    def remaining_quota(self):
+        with self.lock:
+            return sum(max(0, self.daily_limit - state.today_requests) for state in self.states.values())
+
+    def __len__(self):
+        return len(self.states)
@@ -0,0 +1,195 @@
+"""
+Потоковое чтение списков ОГРН.
+
+`OgrnStream` читает список построчно и отдает ОГРН по одному, не загружая файл в память, поэтому на вход можно
+подать весь реестр (миллионы строк). Поддерживаются:
+- обычный текст, по ОГРН на строке (`ogrns.txt`);
+- сжатый gzip (`ogrns.txt.gz`, определяется по сигнатуре файла);
+- CSV (`*.csv`, `*.csv.gz`): колонка с ОГРН задается номером или названием, по умолчанию ищется колонка
+  с "ОГРН" / "ogrn" в заголовке, иначе берется первая. Разделитель (`,` `;` или табуляция) определяется по заголовку.
+
+По пути ОГРН проверяется контрольная сумма (ОГРН - 13 цифр, ОГРНИП - 15 цифр), и неверные номера отбрасываются
+до того, как на них будет потрачен запрос к API. Повторы отбрасываются одним из способов (`dedup`):
+- `set` (по умолчанию): точное множество номеров в виде чисел, память растет с числом уникальных ОГРН;
+- `bloom`: фильтр Блума фиксированного размера (`bloom_capacity`, `bloom_error`), память не зависит от длины
+  списка, но с вероятностью `bloom_error` уникальный ОГРН может быть принят за повтор и пропущен;
+- `none`: без проверки повторов.
+
+Прогресс - смещение в байтах в исходном файле (для gzip - в сжатом файле) и его размер.
+"""
+
+import csv
+import gzip
+import hashlib
+import io
+import logging
+import math
+import os
+
+logger = logging.getLogger("api_scraper")
+
+GZIP_MAGIC = b"\x1f\x8b"
+CSV_COLUMN_NAMES = ("огрн", "огрнип", "ogrn")
+
+
+def is_valid_ogrn(value):
+    """Проверка контрольной суммы: ОГРН (13 цифр) - остаток от деления первых 12 цифр на 11, ОГРНИП (15 цифр) -
+    первых 14 цифр на 13; младший разряд остатка должен совпасть с последней цифрой."""
+    if not value.isdigit() or not value.isascii():
+        return False
+    if len(value) == 13:
+        return int(value[:12]) % 11 % 10 == int(value[12])
+    if len(value) == 15:
+        return int(value[:14]) % 13 % 10 == int(value[14])
+    return False
+
+
+class BloomFilter:
+    """Фильтр Блума на bytearray: `bits` бит, `hashes` хеш-функций (двойное хеширование blake2b)."""
+
+    __slots__ = ("bits", "hashes", "array")
+
+    def __init__(self, capacity, error_rate=1e-5):
+        capacity = max(1, capacity)
+        self.bits = max(8, int(-capacity * math.log(error_rate) / math.log(2) ** 2))
+        self.hashes = max(1, round(self.bits / capacity * math.log(2)))
+        self.array = bytearray((self.bits + 7) // 8)
+
+    def add(self, value):
+        """Добавляет значение. Возвращает True, если оно (вероятно) уже было в фильтре."""
+        digest = hashlib.blake2b(value.encode(), digest_size=16).digest()
+        h1 = int.from_bytes(digest[:8], "little")
+        h2 = int.from_bytes(digest[8:], "little") | 1
+        present = True
+        for i in range(self.hashes):
+            bit = (h1 + i * h2) % self.bits
+            byte, mask = bit >> 3, 1 << (bit & 7)
+            if not self.array[byte] & mask:
+                present = False
+                self.array[byte] |= mask
+        return present
+
+
+class ExactSet:
+    """Точное множество ОГРН; номера хранятся как int, это компактнее строк."""
+
+    __slots__ = ("values",)
+
+    def __init__(self):
+        self.values = set()
+
+    def add(self, value):
+        number = int(value)
+        if number in self.values:
+            return True
+        self.values.add(number)
+        return False
+
+
+class OgrnStream:
+    """Итератор по ОГРН из файла: проверка контрольной суммы, отбрасывание повторов и уже обработанных номеров.
+
+    `skip(ogrn)` - необязательная функция; если она возвращает True, ОГРН не выдается (например, уже есть
+    в журнале прогресса). Счетчики `lines`, `invalid`, `duplicates`, `skipped`, `yielded` и смещение `offset`
+    обновляются по мере чтения."""
+
+    def __init__(self, file_path, dedup="set", csv_column=None, skip=None,
+                 bloom_capacity=10_000_000, bloom_error=1e-5):
+        self.file_path = file_path
+        self.csv_column = csv_column
+        self.skip = skip
+        self.size = os.path.getsize(file_path)
+        self.offset = 0
+        self.lines = self.invalid = self.duplicates = self.skipped = self.yielded = 0
+        if dedup == "bloom":
+            self.seen = BloomFilter(bloom_capacity, bloom_error)
+        elif dedup == "none":
+            self.seen = None
+        else:
+            if dedup != "set":
+                logger.warning(f"Неизвестный способ отбрасывания повторов {dedup}. Используется точное множество.")
+            self.seen = ExactSet()
+
+    def is_csv(self):
+        name = self.file_path.lower()
+        return name.endswith(".csv") or name.endswith(".csv.gz")
+
+    def _raw_lines(self):
+        """Строки файла (байты) и смещение после каждой строки."""
+        with open(self.file_path, 'rb') as raw:
+            compressed = raw.read(2) == GZIP_MAGIC
+            raw.seek(0)
+            source = gzip.GzipFile(fileobj=raw) if compressed else raw
+            for line in source:
+                # Для gzip смещение берется в сжатом файле: оно растет блоками, но сравнимо с размером файла
+                yield line, raw.tell() if compressed else None, len(line)
+
+    def _values(self):
+        position = 0
+        lines = self._raw_lines()
+        if not self.is_csv():
+            for line, compressed_offset, length in lines:
+                position += length
+                self.offset = compressed_offset if compressed_offset is not None else position
+                yield line.strip().decode("utf-8", errors="replace")
+            return
+
+        def text_lines():
+            nonlocal position
+            for line, compressed_offset, length in lines:
+                position += length
+                self.offset = compressed_offset if compressed_offset is not None else position
+                yield line.decode("utf-8-sig", errors="replace")
+
+        text = text_lines()
+        header = next(text, "")
+        delimiter = max((",", ";", "\t"), key=header.count)
+        header_cells = next(csv.reader(io.StringIO(header), delimiter=delimiter), [])
+        column, has_header = self._csv_column(header_cells)
+        if not has_header and len(header_cells) > column:
+            yield header_cells[column].strip()
+        for row in csv.reader(text, delimiter=delimiter):
+            if len(row) > column:
+                yield row[column].strip()
+
+    def _csv_column(self, header_cells):
+        """Номер колонки с ОГРН и признак того, что первая строка - заголовок."""
+        names = [cell.strip().lower() for cell in header_cells]
+        has_header = not any(is_valid_ogrn(cell) for cell in names)
+        if self.csv_column not in (None, ""):
+            if str(self.csv_column).isdigit():
+                return int(self.csv_column), has_header
+            if self.csv_column.lower() in names:
+                return names.index(self.csv_column.lower()), True
+            logger.warning(f"Колонка {self.csv_column} не найдена в {self.file_path}. Используется первая колонка.")
+            return 0, has_header
+        for i, name in enumerate(names):
+            if name in CSV_COLUMN_NAMES:
+                return i, True
+        return 0, has_header
+
+    def __iter__(self):
+        for value in self._values():
+            if not value:
+                continue
+            self.lines += 1
+            if not is_valid_ogrn(value):
+                self.invalid += 1
+                logger.debug(f"Неверный ОГРН (контрольная сумма или длина) пропущен: {value[:40]}")
+                continue
+            if self.seen is not None and self.seen.add(value):
+                self.duplicates += 1
+                continue
+            if self.skip is not None and self.skip(value):
+                self.skipped += 1
+                continue
+            self.yielded += 1
+            yield value
+
+    def progress(self):
+        """Доля прочитанного файла (0..1)."""
+        return self.offset / self.size if self.size else 1.0
+
+    def summary(self):
+        return (f"строк {self.lines}, неверных {self.invalid}, повторов {self.duplicates}, "
+                f"уже обработанных {self.skipped}, выдано {self.yielded}")
@@ -0,0 +1,259 @@
+"""
+Способы сохранения ответов API Checko (выбираются переменной окружения `OUTPUT_SINK`).
+
+- `files` (по умолчанию): отдельный файл `JSONs/{ОГРН}.json.gz` на каждую компанию, как раньше.
+- `ndjson`: сегменты `JSONs/segments/part-NNNNN.ndjson.gz` (или `.ndjson.zst`) по `OUTPUT_SEGMENT_MB` мегабайт.
+  Каждая запись - одна строка JSON (ответ API как есть, многострочный - в компактном виде), сжатая отдельным
+  блоком (gzip member / zstd frame), поэтому сегмент целиком читается обычным `zcat`/`zstdcat` как NDJSON.
+  Файл `JSONs/segments/index.tsv` хранит для каждого ОГРН сегмент, смещение и длину блока, так что одну запись
+  можно прочитать, не распаковывая сегмент.
+- `sqlite`: база `JSONs/responses.sqlite`, таблица `responses` с первичным ключом по ОГРН и сжатым JSON.
+
+Все способы принимают ответ в виде сырых байтов, как его вернул API, и сохраняют их без повторного
+разбора и сериализации JSON (кроме многострочных ответов в `ndjson`: их приходится переписать в одну строку).
+Сжатие zstd требует пакета `zstandard`; если он не установлен, используется gzip.
+"""
+
+import gzip
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+import datetime
+from datetime import timezone
+
+try:
+    import zstandard
+except ImportError:
+    zstandard = None
+
+from scraper_metrics import metrics
+
+logger = logging.getLogger("api_scraper")
+
+CODEC_EXTENSIONS = {"gzip": ".gz", "zstd": ".zst"}
+
+
+def resolve_codec(codec):
+    if codec == "zstd" and zstandard is None:
+        logger.warning("Пакет zstandard не установлен (pip install zstandard). Используется сжатие gzip.")
+        return "gzip"
+    if codec not in CODEC_EXTENSIONS:
+        logger.warning(f"Неизвестный формат сжатия {codec}. Используется gzip.")
+        return "gzip"
+    return codec
+
+
+def compress(codec, payload):
+    started = time.monotonic()
+    if codec == "zstd":
+        blob = zstandard.ZstdCompressor(level=3).compress(payload)
+    else:
+        blob = gzip.compress(payload, compresslevel=6)
+    metrics.observe("compress", time.monotonic() - started)
+    return blob
+
+
+def decompress(codec, blob):
+    if codec == "zstd":
+        return zstandard.ZstdDecompressor().decompress(blob)
+    return gzip.decompress(blob)
+
+
+def single_line(raw):
+    """Одна строка NDJSON. Однострочный ответ сохраняется как есть, без разбора; многострочный (с отступами)
+    переписывается в компактный JSON. Если он не разбирается, переводы строк заменяются пробелами: внутри строк
+    JSON они всегда экранированы, поэтому это только пробельные символы."""
+    if b"\n" in raw or b"\r" in raw:
+        try:
+            raw = json.dumps(json.loads(raw), ensure_ascii=False, separators=(",", ":")).encode("utf-8")
+        except ValueError:
+            raw = raw.replace(b"\r", b" ").replace(b"\n", b" ")
+    return raw.rstrip() + b"\n"
+
+
+class PerFileSink:
+    """Один файл JSON.GZ на ОГРН (исходный формат)."""
+
+    def __init__(self, output_dir="JSONs"):
+        self.output_dir = output_dir
+        os.makedirs(output_dir, exist_ok=True)
+
+    def path(self, ogrn):
+        return os.path.join(self.output_dir, f"{ogrn}.json.gz")
+
+    def write(self, ogrn, raw):
+        """Пишет через временный файл и os.replace: прерванная запись не оставляет обрезанный `{ОГРН}.json.gz`,
+        который иначе считался бы сохраненным ответом."""
+        full_path = self.path(ogrn)
+        tmp_path = f"{full_path}.tmp"
+        try:
+            with gzip.open(tmp_path, 'wb') as f:
+                f.write(raw)
+            os.replace(tmp_path, full_path)
+            logger.info(f"Успешно: данные для ОГРН {ogrn} сохранены в {os.path.basename(full_path)}.")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении данных в файл {full_path}: {e}")
+            try:
+                os.remove(tmp_path)
+            except OSError:
+                pass
+            return False
+
+    def read(self, ogrn):
+        try:
+            with gzip.open(self.path(ogrn), 'rt', encoding='utf-8') as f:
+                return json.load(f)
+        except FileNotFoundError:
+            return None
+
+    def stored_ogrns(self):
+        if not os.path.isdir(self.output_dir):
+            return []
+        with os.scandir(self.output_dir) as entries:
+            return [entry.name[:-len(".json.gz")] for entry in entries if entry.name.endswith(".json.gz")]
+
+    def close(self):
+        pass
+
+
+class SegmentSink:
+    """Сегменты NDJSON со сжатием по записям и индексом ОГРН -> (сегмент, смещение, длина)."""
+
+    def __init__(self, output_dir="JSONs/segments", codec="gzip", segment_bytes=64 * 1024 * 1024):
+        self.output_dir = output_dir
+        self.codec = resolve_codec(codec)
+        self.segment_bytes = segment_bytes
+        self.index_path = os.path.join(output_dir, "index.tsv")
+        self.lock = threading.Lock()
+        self._index = None
+        os.makedirs(output_dir, exist_ok=True)
+
+        suffix = f".ndjson{CODEC_EXTENSIONS[self.codec]}"
+        parts = sorted(name for name in os.listdir(output_dir) if name.startswith("part-") and name.endswith(suffix))
+        self.segment_no = int(parts[-1][5:10]) if parts else 1
+        self._open_segment()
+        self._index_file = open(self.index_path, 'a', encoding='utf-8')
+
+    def _segment_name(self, segment_no):
+        return f"part-{segment_no:05d}.ndjson{CODEC_EXTENSIONS[self.codec]}"
+
+    def _open_segment(self):
+        self.segment_name = self._segment_name(self.segment_no)
+        self._segment = open(os.path.join(self.output_dir, self.segment_name), 'ab')
+        if self._segment.tell() >= self.segment_bytes:
+            self._segment.close()
+            self.segment_no += 1
+            self._open_segment()
+
+    def write(self, ogrn, raw):
+        try:
+            blob = compress(self.codec, single_line(raw))
+            with self.lock:
+                if self._segment.tell() >= self.segment_bytes:
+                    self._segment.close()
+                    self.segment_no += 1
+                    self._open_segment()
+                offset = self._segment.tell()
+                self._segment.write(blob)
+                self._segment.flush()
+                self._index_file.write(f"{ogrn}\t{self.segment_name}\t{offset}\t{len(blob)}\n")
+                self._index_file.flush()
+                if self._index is not None:
+                    self._index[ogrn] = (self.segment_name, offset, len(blob))
+            logger.info(f"Успешно: данные для ОГРН {ogrn} сохранены в {self.segment_name}.")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении данных ОГРН {ogrn} в сегмент {self.segment_name}: {e}")
+            return False
+
+    def index(self):
+        """Индекс ОГРН -> (сегмент, смещение, длина). Последняя запись по ОГРН важнее предыдущих."""
+        with self.lock:
+            if self._index is None:
+                self._index = {}
+                with open(self.index_path, 'r', encoding='utf-8') as f:
+                    for line in f:
+                        parts = line.rstrip("\n").split("\t")
+                        if len(parts) == 4:
+                            self._index[parts[0]] = (parts[1], int(parts[2]), int(parts[3]))
+            return self._index
+
+    def read(self, ogrn):
+        location = self.index().get(ogrn)
+        if location is None:
+            return None
+        segment_name, offset, length = location
+        with open(os.path.join(self.output_dir, segment_name), 'rb') as f:
+            f.seek(offset)
+            return json.loads(decompress(self.codec, f.read(length)))
+
+    def stored_ogrns(self):
+        return list(self.index())
+
+    def close(self):
+        with self.lock:
+            self._segment.close()
+            self._index_file.close()
+
+
+class SqliteSink:
+    """Ответы в SQLite: первичный ключ по ОГРН служит индексом, JSON хранится сжатым."""
+
+    def __init__(self, db_path="JSONs/responses.sqlite", codec="gzip"):
+        self.db_path = db_path
+        self.codec = resolve_codec(codec)
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.execute(
+            "CREATE TABLE IF NOT EXISTS responses ("
+            "ogrn TEXT PRIMARY KEY, saved_at TEXT NOT NULL, codec TEXT NOT NULL, data BLOB NOT NULL)"
+        )
+        self.conn.commit()
+
+    def write(self, ogrn, raw):
+        try:
+            blob = compress(self.codec, raw)
+            saved_at = datetime.datetime.now(timezone.utc).isoformat()
+            with self.lock:
+                self.conn.execute(
+                    "INSERT OR REPLACE INTO responses (ogrn, saved_at, codec, data) VALUES (?, ?, ?, ?)",
+                    (ogrn, saved_at, self.codec, blob),
+                )
+                self.conn.commit()
+            logger.info(f"Успешно: данные для ОГРН {ogrn} сохранены в {os.path.basename(self.db_path)}.")
+            return True
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении данных ОГРН {ogrn} в {self.db_path}: {e}")
+            return False
+
+    def read(self, ogrn):
+        with self.lock:
+            row = self.conn.execute("SELECT codec, data FROM responses WHERE ogrn = ?", (ogrn,)).fetchone()
+        if row is None:
+            return None
+        return json.loads(decompress(row[0], row[1]))
+
+    def stored_ogrns(self):
+        with self.lock:
+            return [row[0] for row in self.conn.execute("SELECT ogrn FROM responses")]
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+def create_sink(kind, output_dir="JSONs", codec="gzip", segment_bytes=64 * 1024 * 1024):
+    if kind == "ndjson":
+        return SegmentSink(os.path.join(output_dir, "segments"), codec, segment_bytes)
+    if kind == "sqlite":
+        return SqliteSink(os.path.join(output_dir, "responses.sqlite"), codec)
+    if kind != "files":
+        logger.warning(f"Неизвестный способ сохранения OUTPUT_SINK={kind}. Используются отдельные файлы JSON.GZ.")
+    return PerFileSink(output_dir)
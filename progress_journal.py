@@ -0,0 +1,80 @@
+"""
+Журнал прогресса обработки ОГРН.
+
+Журнал - это текстовый файл, в который только дописываются строки вида `ОГРН<TAB>статус`. Статусы:
+- `ok`: данные получены и сохранены;
+- `dead`: постоянная ошибка (например, компания не найдена) - повторно такой ОГРН не запрашивается;
+- `retry`: временная ошибка - ОГРН будет запрошен при следующем запуске.
+
+Журнал читается один раз при старте, после чего список работы вычисляется как разность множеств,
+без проверки существования файла для каждого ОГРН. Если журнала еще нет, он заполняется по списку
+уже сохраненных ОГРН (для отдельных файлов - одним просмотром папки с результатами).
+
+В памяти ОГРН хранится как int, а статус - как небольшое число (`STATUS_CODES`): это примерно вдвое меньше,
+чем словарь строк.
+"""
+
+import logging
+import os
+import threading
+
+logger = logging.getLogger("api_scraper")
+
+STATUS_OK = "ok"
+STATUS_DEAD = "dead"
+STATUS_RETRY = "retry"
+FINAL_STATUSES = frozenset({STATUS_OK, STATUS_DEAD})
+# Коды статусов в памяти; малые int в Python общие, поэтому значение словаря не занимает отдельной памяти
+STATUS_CODES = {STATUS_OK: 1, STATUS_DEAD: 2, STATUS_RETRY: 3}
+STATUS_NAMES = {code: status for status, code in STATUS_CODES.items()}
+
+
+class ProgressJournal:
+    def __init__(self, file_path):
+        self.file_path = file_path
+        self.statuses = {}  # ОГРН (int) -> код статуса
+        self.lock = threading.Lock()
+        self._file = None
+
+    def load(self, stored_ogrns=None):
+        """Читает журнал. Если его нет, создает по списку сохраненных ОГРН, который возвращает `stored_ogrns()`."""
+        if os.path.exists(self.file_path):
+            with open(self.file_path, 'r', encoding='utf-8') as f:
+                statuses, codes = self.statuses, STATUS_CODES
+                for line in f:
+                    ogrn, _, status = line.rstrip("\n").partition("\t")
+                    code = codes.get(status)
+                    if code and ogrn.isdigit():
+                        statuses[int(ogrn)] = code  # Последняя запись важнее предыдущих
+            logger.info(f"Журнал прогресса {self.file_path}: {len(self.statuses)} записей.")
+        elif stored_ogrns is not None:
+            done = stored_ogrns()
+            self._append((ogrn, STATUS_OK) for ogrn in done)
+            logger.info(f"Журнал прогресса {self.file_path} создан по сохраненным результатам: {len(done)} обработанных ОГРН.")
+        self._file = open(self.file_path, 'a', encoding='utf-8')
+        return self
+
+    def _append(self, records):
+        with open(self.file_path, 'a', encoding='utf-8') as f:
+            for ogrn, status in records:
+                if ogrn.isdigit():
+                    self.statuses[int(ogrn)] = STATUS_CODES[status]
+                f.write(f"{ogrn}\t{status}\n")
+
+    def status(self, ogrn):
+        return STATUS_NAMES.get(self.statuses.get(int(ogrn)))
+
+    def is_final(self, ogrn):
+        return self.status(ogrn) in FINAL_STATUSES
+
+    def record(self, ogrn, status):
+        with self.lock:
+            self.statuses[int(ogrn)] = STATUS_CODES[status]
+            self._file.write(f"{ogrn}\t{status}\n")
+            self._file.flush()
+
+    def close(self):
+        with self.lock:
+            if self._file:
+                self._file.close()
+                self._file = None
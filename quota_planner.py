@@ -0,0 +1,254 @@
+"""
+Планировщик распределения ключей и ОГРН между воркерами (шардами).
+
+Вместо фиксированных пар `api_keys_part_N.txt` / `ogrns_part_N.txt` планировщик собирает все ключи и все ОГРН,
+объединяет статистику `api_count.json` из предыдущих запусков и вычисляет остаток дневного лимита каждого ключа
+(по тем же правилам `API_DAILY_LIMIT` / `next_reset`, что и реестр ключей скрапера). Сам скрапер планировщик
+не импортирует: загрузчики файлов и лимит берутся из `scraper_files.py`. Затем ключи раскладываются
+по шардам так, чтобы суммарные остатки были как можно ближе, а ОГРН делятся пропорционально остатку шарда.
+Так каждый воркер исчерпывает лимиты своих ключей примерно одновременно, и никакая квота не простаивает.
+
+Уже скачанные и несуществующие ОГРН (по журналам `progress_journal.txt`) в план не попадают.
+
+Ключи с исчерпанным лимитом, у которых сброс наступит в пределах запуска (`--window-hours`, по умолчанию 6 часов -
+предел задания GitHub Actions), тоже раздаются шардам с полным дневным лимитом: скрапер сбросит их счетчик
+по таймеру посреди работы.
+
+Результат - папка `plan/`:
+    plan/part_N/APIs.txt, plan/part_N/ogrns.txt, plan/part_N/api_count.json - готовые входные файлы воркера;
+    plan/plan.json - сводка: номера шардов, ключи, остаток квоты, число ОГРН, ближайшие сбросы лимитов;
+    plan/state/api_count.json, plan/state/progress_journal.txt - объединенная статистика всех ключей и завершенные ОГРН,
+    чтобы следующий запуск учел и ключи, не попавшие в этот план.
+
+Запуск:
+    python quota_planner.py --workers 7
+    python quota_planner.py --usage "state/**/api_count.json" --journal "state/**/progress_journal.txt" --github-output
+"""
+
+import argparse
+import datetime
+import glob
+import heapq
+import json
+import logging
+import os
+import shutil
+import time
+from datetime import timezone
+
+from key_registry import parse_timestamp
+from progress_journal import FINAL_STATUSES
+from scraper_files import API_DAILY_LIMIT, load_api_keys, load_api_usage, load_ogrns_from_file, write_file_atomic
+
+logger = logging.getLogger("api_scraper")
+
+
+def expand_patterns(patterns):
+    paths = []
+    for pattern in patterns:
+        for path in sorted(glob.glob(pattern, recursive=True)):
+            if path not in paths:
+                paths.append(path)
+    return paths
+
+
+def parse_time(value):
+    """Строка ISO из api_count.json -> секунды UTC от эпохи (None, если строки нет или она некорректна)."""
+    if not value:
+        return None
+    try:
+        return parse_timestamp(value)
+    except (ValueError, TypeError):
+        return None
+
+
+def save_api_usage(api_usage, file_path):
+    write_file_atomic(file_path, json.dumps(api_usage, indent=4, ensure_ascii=False))
+
+
+def merge_api_usage(usage_files):
+    """Объединяет статистику ключей из нескольких api_count.json: для каждого ключа берется самая свежая запись."""
+    merged = {}
+    for path in usage_files:
+        for key, key_data in load_api_usage(path).items():
+            current = merged.get(key)
+            if current is None or (parse_time(key_data.get("last_used")) or 0) > (parse_time(current.get("last_used")) or 0):
+                merged[key] = dict(key_data)
+    return merged
+
+
+def load_finished_ogrns(journal_files):
+    """ОГРН с итоговым статусом (ok/dead) по журналам прогресса: {ОГРН: статус}."""
+    finished = {}
+    for path in journal_files:
+        statuses = {}
+        with open(path, 'r', encoding='utf-8') as f:
+            for line in f:
+                ogrn, _, status = line.rstrip("\n").partition("\t")
+                if ogrn and status:
+                    statuses[ogrn] = status
+        finished.update((ogrn, status) for ogrn, status in statuses.items() if status in FINAL_STATUSES)
+    return finished
+
+
+def key_capacities(api_keys, api_usage, window_hours=0):
+    """Остаток дневного лимита по каждому ключу (по тем же правилам, что и `KeyRegistry.load`: наступивший или
+    некорректный `next_reset` обнуляет счетчик). Ключ, у которого сброс наступит в ближайшие `window_hours` часов,
+    получает полный лимит: его сбросит таймер скрапера посреди запуска."""
+    now = time.time()
+    deadline = now + window_hours * 3600
+    capacities = {}
+    for key in api_keys:
+        key_data = api_usage.get(key, {})
+        next_reset = parse_time(key_data.get("next_reset"))
+        if key_data.get("next_reset") and (next_reset is None or next_reset <= now):
+            capacities[key] = API_DAILY_LIMIT  # Сброс уже наступил
+        elif next_reset is not None and next_reset <= deadline:
+            capacities[key] = API_DAILY_LIMIT  # Сбросится во время запуска
+        else:
+            capacities[key] = max(0, API_DAILY_LIMIT - key_data.get("today_requests", 0))
+    return capacities
+
+
+def assign_keys(capacities, workers):
+    """Раскладывает ключи по шардам: от больших остатков к меньшим, каждый в шард с наименьшей суммой."""
+    shards = [[] for _ in range(workers)]
+    heap = [(0, i) for i in range(workers)]
+    for key, capacity in sorted(capacities.items(), key=lambda item: -item[1]):
+        total, i = heapq.heappop(heap)
+        shards[i].append(key)
+        heapq.heappush(heap, (total + capacity, i))
+    return shards
+
+
+def split_proportionally(items, weights):
+    """Делит список на части, пропорциональные весам (метод наибольших остатков)."""
+    total_weight = sum(weights)
+    exact = [len(items) * weight / total_weight for weight in weights]
+    sizes = [int(value) for value in exact]
+    by_remainder = sorted(range(len(weights)), key=lambda i: exact[i] - sizes[i], reverse=True)
+    for i in by_remainder[:len(items) - sum(sizes)]:
+        sizes[i] += 1
+    parts, start = [], 0
+    for size in sizes:
+        parts.append(items[start:start + size])
+        start += size
+    return parts
+
+
+def build_plan(key_files, ogrn_files, usage_files, journal_files, workers, window_hours=6):
+    api_keys = []
+    for path in key_files:
+        api_keys.extend(key for key in load_api_keys(path) if key not in api_keys)
+
+    finished = load_finished_ogrns(journal_files)
+    seen = set()
+    pending = []
+    for path in ogrn_files:
+        for ogrn in load_ogrns_from_file(path):
+            if ogrn not in seen and ogrn not in finished:
+                seen.add(ogrn)
+                pending.append(ogrn)
+
+    api_usage = merge_api_usage(usage_files)
+    capacities = key_capacities(api_keys, api_usage, window_hours)
+    usable = {key: capacity for key, capacity in capacities.items() if capacity > 0}
+    exhausted = sorted(
+        (api_usage.get(key, {}).get("next_reset") or "", key) for key in api_keys if capacities[key] == 0
+    )
+
+    workers = min(workers, len(usable))
+    shards = []
+    if workers and pending:
+        key_shards = assign_keys(usable, workers)
+        shard_capacity = [sum(usable[key] for key in keys) for keys in key_shards]
+        ogrn_shards = split_proportionally(pending, shard_capacity)
+        for i, (keys, capacity, ogrns) in enumerate(zip(key_shards, shard_capacity, ogrn_shards), start=1):
+            shards.append({"part": i, "keys": keys, "capacity": capacity, "ogrns": ogrns})
+
+    return {
+        "api_usage": api_usage,
+        "pending": len(pending),
+        "finished": finished,
+        "capacity": sum(usable.values()),
+        "exhausted": exhausted,
+        "shards": shards,
+    }
+
+
+def write_plan(plan, out_dir):
+    if os.path.isdir(out_dir):
+        shutil.rmtree(out_dir)
+    os.makedirs(out_dir)
+    summary = []
+    for shard in plan["shards"]:
+        part_dir = os.path.join(out_dir, f"part_{shard['part']}")
+        os.makedirs(part_dir)
+        with open(os.path.join(part_dir, "APIs.txt"), 'w', encoding='utf-8') as f:
+            f.writelines(f"{key}\n" for key in shard["keys"])
+        with open(os.path.join(part_dir, "ogrns.txt"), 'w', encoding='utf-8') as f:
+            f.writelines(f"{ogrn}\n" for ogrn in shard["ogrns"])
+        shard_usage = {key: plan["api_usage"][key] for key in shard["keys"] if key in plan["api_usage"]}
+        save_api_usage(shard_usage, os.path.join(part_dir, "api_count.json"))
+        summary.append({"part": shard["part"], "keys": len(shard["keys"]), "capacity": shard["capacity"], "ogrns": len(shard["ogrns"])})
+
+    with open(os.path.join(out_dir, "plan.json"), 'w', encoding='utf-8') as f:
+        json.dump({
+            "created_at": datetime.datetime.now(timezone.utc).isoformat(),
+            "pending_ogrns": plan["pending"],
+            "finished_ogrns": len(plan["finished"]),
+            "total_capacity": plan["capacity"],
+            "exhausted_keys": [{"key": f"...{key[-4:]}", "next_reset": reset} for reset, key in plan["exhausted"]],
+            "shards": summary,
+        }, f, indent=4, ensure_ascii=False)
+
+    # Состояние для следующего запуска: статистика ключей вне плана и уже завершенные ОГРН не должны потеряться
+    state_dir = os.path.join(out_dir, "state")
+    os.makedirs(state_dir)
+    save_api_usage(plan["api_usage"], os.path.join(state_dir, "api_count.json"))
+    with open(os.path.join(state_dir, "progress_journal.txt"), 'w', encoding='utf-8') as f:
+        f.writelines(f"{ogrn}\t{status}\n" for ogrn, status in plan["finished"].items())
+    return summary
+
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__, formatter_class=argparse.RawDescriptionHelpFormatter)
+    parser.add_argument("--keys", nargs="+", default=["api_keys_part_*.txt"], help="файлы с ключами (шаблоны glob)")
+    parser.add_argument("--ogrns", nargs="+", default=["ogrns_part_*.txt"], help="файлы с ОГРН (шаблоны glob)")
+    parser.add_argument("--usage", nargs="+", default=["api_count.json", "state/**/api_count.json"],
+                        help="файлы статистики api_count.json из предыдущих запусков (шаблоны glob)")
+    parser.add_argument("--journal", nargs="+", default=["progress_journal.txt", "state/**/progress_journal.txt"],
+                        help="журналы прогресса из предыдущих запусков (шаблоны glob)")
+    parser.add_argument("--workers", type=int, default=0, help="число шардов (по умолчанию - число файлов с ключами)")
+    parser.add_argument("--window-hours", type=float, default=6,
+                        help="длительность запуска в часах: ключи со сбросом лимита в этом окне тоже раздаются шардам")
+    parser.add_argument("--out", default="plan", help="папка для плана")
+    parser.add_argument("--github-output", action="store_true",
+                        help="записать матрицу шардов в $GITHUB_OUTPUT (ключ matrix)")
+    args = parser.parse_args()
+    logging.basicConfig(level=logging.INFO, format='%(levelname)s: %(message)s')
+
+    key_files = expand_patterns(args.keys)
+    ogrn_files = expand_patterns(args.ogrns)
+    workers = args.workers or len(key_files)
+    plan = build_plan(key_files, ogrn_files, expand_patterns(args.usage), expand_patterns(args.journal), workers,
+                      args.window_hours)
+    summary = write_plan(plan, args.out)
+
+    logger.info(f"ОГРН к обработке: {plan['pending']} (уже обработано: {len(plan['finished'])}). Остаток квоты всех ключей: {plan['capacity']}.")
+    for reset, key in plan["exhausted"]:
+        logger.info(f"Ключ ...{key[-4:]} исчерпан, сброс в UTC: {reset or 'неизвестно'}")
+    for shard in summary:
+        logger.info(f"Шард {shard['part']}: ключей {shard['keys']}, квота {shard['capacity']}, ОГРН {shard['ogrns']}")
+    if not summary:
+        logger.critical("Нет ни ключей с остатком квоты, ни ОГРН для обработки. План пуст.")
+
+    matrix = json.dumps([shard["part"] for shard in summary])
+    print(matrix)
+    if args.github_output and os.environ.get("GITHUB_OUTPUT"):
+        with open(os.environ["GITHUB_OUTPUT"], 'a', encoding='utf-8') as f:
+            f.write(f"matrix={matrix}\n")
+
+
+if __name__ == "__main__":
+    main()
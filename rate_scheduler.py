@@ -0,0 +1,95 @@
+"""
+Планировщик скорости запросов к API Checko.
+
+Для каждого API-ключа ведется свое "ведро токенов" (token bucket): токены пополняются со скоростью
+`rate` запросов в секунду и копятся не больше `burst` штук. Дополнительное общее ведро ограничивает
+суммарную скорость по всем ключам. Запрос можно отправить, только если в ведре ключа и в общем ведре
+есть токен, поэтому пауза добавляется лишь перед реальными запросами и ровно на столько, сколько нужно.
+
+Планировщик не знает о дневных лимитах: ключ с неисчерпанным лимитом и свободным слотом выбирает реестр ключей
+`key_registry.py`, а планировщик для этого ключа либо списывает токен, либо сообщает, сколько ждать (`try_key`).
+"""
+
+import logging
+import threading
+import time
+
+logger = logging.getLogger("api_scraper")
+
+
+class TokenBucket:
+    """Ведро токенов: `rate` токенов в секунду, не больше `burst` в запасе. rate <= 0 - без ограничений."""
+
+    __slots__ = ("rate", "burst", "tokens", "updated")
+
+    def __init__(self, rate, burst, now=None):
+        self.rate = rate
+        self.burst = max(1.0, burst)
+        self.tokens = self.burst
+        self.updated = time.monotonic() if now is None else now
+
+    def refill(self, now):
+        if self.rate > 0 and now > self.updated:
+            self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, now):
+        """Сколько секунд ждать до появления токена (0 - можно отправлять сразу)."""
+        if self.rate <= 0:
+            return 0.0
+        self.refill(now)
+        if self.tokens >= 1:
+            return 0.0
+        return (1 - self.tokens) / self.rate
+
+    def consume(self, now):
+        if self.rate <= 0:
+            return
+        self.refill(now)
+        self.tokens -= 1
+
+
+class RateScheduler:
+    """Ведра токенов всех ключей и общее ограничение скорости."""
+
+    def __init__(self, rate_per_key, burst_per_key=1, global_rate=0, global_burst=1):
+        self.rate_per_key = rate_per_key
+        self.burst_per_key = burst_per_key
+        self.global_bucket = TokenBucket(global_rate, global_burst)
+        self.buckets = {}
+        self.lock = threading.Lock()
+
+    def _bucket(self, api_key, now):
+        bucket = self.buckets.get(api_key)
+        if bucket is None:
+            bucket = self.buckets[api_key] = TokenBucket(self.rate_per_key, self.burst_per_key, now)
+        return bucket
+
+    def try_key(self, api_key):
+        """Если с ключом можно отправить запрос немедленно, списывает токен и возвращает 0.
+        Иначе возвращает, сколько секунд ждать (с учетом общего ограничения скорости)."""
+        with self.lock:
+            now = time.monotonic()
+            delay = max(self.global_bucket.delay(now), self._bucket(api_key, now).delay(now))
+            if delay > 0:
+                return delay
+            self.buckets[api_key].consume(now)
+            self.global_bucket.consume(now)
+            return 0.0
+
+    def wait_key(self, api_key):
+        """Ждет токена ключа и списывает его (для повтора запроса, который мог дойти до API)."""
+        while True:
+            delay = self.try_key(api_key)
+            if delay <= 0:
+                return
+            time.sleep(delay)
+
+    def global_delay(self):
+        """Сколько секунд ждать до токена в общем ведре (0 - общее ограничение не мешает)."""
+        with self.lock:
+            return self.global_bucket.delay(time.monotonic())
+
+    def remove_key(self, api_key):
+        with self.lock:
+            self.buckets.pop(api_key, None)
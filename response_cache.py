@@ -0,0 +1,222 @@
+"""
+Кэш ответов API с временем получения, сроком годности (TTL) и ограничением размера.
+
+Кэш - база SQLite (`RESPONSE_CACHE`, например `JSONs/cache.sqlite`) из двух таблиц:
+- `entries`: ОГРН -> хеш содержимого, время последнего получения (`fetched_at`), время последнего изменения
+  (`changed_at`), время последнего обращения;
+- `objects`: хеш -> сжатое тело ответа. Одинаковые ответы хранятся один раз (адресация по содержимому).
+
+Хеш считается по ответу без объекта `meta`: в нем API возвращает счетчик запросов ключа, который меняется
+при каждом запросе. Если повторно полученный ответ совпал по хешу с сохраненным, он не записывается заново,
+обновляется только время получения.
+
+Тела ответов вытесняются по давности обращения (LRU), когда их общий объем превышает `max_bytes`. Записи `entries`
+при этом остаются, поэтому проверка изменений по хешу и выбор устаревших записей работают и без тел.
+
+`CachingSink` оборачивает любой способ сохранения из `output_sinks.py`: неизмененные ответы не перезаписываются,
+чтение берет тело из кэша, если оно там есть. В режиме обновления (`REFRESH=1` в `api_scraper.py`) список работы -
+записи старше TTL, от самых старых к новым (`stale_ogrns`).
+"""
+
+import hashlib
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+
+from output_sinks import compress, decompress, resolve_codec
+from scraper_metrics import metrics
+
+logger = logging.getLogger("api_scraper")
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS entries (
+    ogrn TEXT PRIMARY KEY,
+    hash TEXT,
+    fetched_at REAL NOT NULL,
+    changed_at REAL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS entries_fetched_at ON entries (fetched_at, ogrn);
+CREATE TABLE IF NOT EXISTS objects (
+    hash TEXT PRIMARY KEY,
+    codec TEXT NOT NULL,
+    data BLOB NOT NULL,
+    size INTEGER NOT NULL,
+    accessed_at REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS objects_accessed_at ON objects (accessed_at);
+"""
+
+
+def payload_digest(raw):
+    """Хеш ответа без завершающего объекта "meta" (API отдает его после "data")."""
+    meta_pos = raw.rfind(b'"meta"')
+    if meta_pos > raw.find(b'"data"') >= 0:
+        raw = raw[:meta_pos]
+    return hashlib.blake2b(raw, digest_size=20).hexdigest()
+
+
+class ResponseCache:
+    def __init__(self, db_path, ttl_seconds, max_bytes, codec="gzip"):
+        self.db_path = db_path
+        self.ttl_seconds = ttl_seconds
+        self.max_bytes = max_bytes
+        self.codec = resolve_codec(codec)
+        self.lock = threading.Lock()
+        os.makedirs(os.path.dirname(db_path) or ".", exist_ok=True)
+        self.conn = sqlite3.connect(db_path, check_same_thread=False)
+        self.conn.execute("PRAGMA journal_mode=WAL")
+        self.conn.execute("PRAGMA synchronous=NORMAL")
+        self.conn.executescript(SCHEMA)
+        self.conn.commit()
+        self.total_bytes = self.conn.execute("SELECT COALESCE(SUM(size), 0) FROM objects").fetchone()[0]
+
+    def bootstrap(self, stored_ogrns):
+        """Заполняет пустой кэш уже сохраненными ОГРН. Время их получения неизвестно, поэтому они считаются самыми
+        устаревшими, а хеш появится при первом обновлении."""
+        with self.lock:
+            if self.conn.execute("SELECT 1 FROM entries LIMIT 1").fetchone():
+                return 0
+        ogrns = stored_ogrns()
+        with self.lock:
+            self.conn.executemany(
+                "INSERT OR IGNORE INTO entries (ogrn, hash, fetched_at, changed_at, accessed_at) VALUES (?, NULL, 0, NULL, 0)",
+                ((ogrn,) for ogrn in ogrns),
+            )
+            self.conn.commit()
+        if ogrns:
+            logger.info(f"Кэш ответов {self.db_path} создан по сохраненным результатам: {len(ogrns)} ОГРН.")
+        return len(ogrns)
+
+    def is_fresh(self, ogrn):
+        with self.lock:
+            row = self.conn.execute("SELECT fetched_at FROM entries WHERE ogrn = ?", (ogrn,)).fetchone()
+        return row is not None and time.time() - row[0] < self.ttl_seconds
+
+    def count_stale(self):
+        with self.lock:
+            return self.conn.execute(
+                "SELECT COUNT(*) FROM entries WHERE fetched_at < ?", (time.time() - self.ttl_seconds,)
+            ).fetchone()[0]
+
+    def stale_ogrns(self, batch=1000):
+        """ОГРН старше TTL, от самых старых к новым. Читается пачками, поэтому обновленные за время обхода записи
+        (их время получения становится больше порога) повторно не выдаются."""
+        cutoff = time.time() - self.ttl_seconds
+        last = (-1.0, "")
+        while True:
+            with self.lock:
+                rows = self.conn.execute(
+                    "SELECT fetched_at, ogrn FROM entries WHERE fetched_at < ? AND (fetched_at, ogrn) > (?, ?) "
+                    "ORDER BY fetched_at, ogrn LIMIT ?",
+                    (cutoff, last[0], last[1], batch),
+                ).fetchall()
+            if not rows:
+                return
+            for row in rows:
+                yield row[1]
+            last = rows[-1]
+
+    def stored_hash(self, ogrn):
+        with self.lock:
+            row = self.conn.execute("SELECT hash FROM entries WHERE ogrn = ?", (ogrn,)).fetchone()
+        return row[0] if row else None
+
+    def touch(self, ogrn):
+        """Ответ получен заново и не изменился: обновляется только время получения."""
+        now = time.time()
+        with self.lock:
+            self.conn.execute("UPDATE entries SET fetched_at = ?, accessed_at = ? WHERE ogrn = ?", (now, now, ogrn))
+            self.conn.commit()
+
+    def put(self, ogrn, raw, digest=None):
+        digest = digest or payload_digest(raw)
+        blob = compress(self.codec, raw)
+        now = time.time()
+        with self.lock:
+            inserted = self.conn.execute(
+                "INSERT OR IGNORE INTO objects (hash, codec, data, size, accessed_at) VALUES (?, ?, ?, ?, ?)",
+                (digest, self.codec, blob, len(blob), now),
+            ).rowcount
+            if inserted:
+                self.total_bytes += len(blob)
+            self.conn.execute(
+                "INSERT INTO entries (ogrn, hash, fetched_at, changed_at, accessed_at) VALUES (?, ?, ?, ?, ?) "
+                "ON CONFLICT(ogrn) DO UPDATE SET hash = excluded.hash, fetched_at = excluded.fetched_at, "
+                "changed_at = excluded.changed_at, accessed_at = excluded.accessed_at",
+                (ogrn, digest, now, now, now),
+            )
+            if self.total_bytes > self.max_bytes:
+                self._evict()
+            self.conn.commit()
+
+    def _evict(self):
+        """Удаляет тела ответов, к которым дольше всего не обращались, пока объем не станет меньше 90% лимита."""
+        target = self.max_bytes * 0.9
+        evicted = 0
+        while self.total_bytes > target:
+            rows = self.conn.execute("SELECT hash, size FROM objects ORDER BY accessed_at LIMIT 256").fetchall()
+            if not rows:
+                self.total_bytes = 0
+                break
+            self.conn.executemany("DELETE FROM objects WHERE hash = ?", ((row[0],) for row in rows))
+            self.total_bytes -= sum(row[1] for row in rows)
+            evicted += len(rows)
+        metrics.inc("cache_evicted", evicted)
+        logger.debug(f"Из кэша ответов вытеснено {evicted} тел ответов.")
+
+    def get(self, ogrn):
+        """Сырые байты ответа из кэша или None, если тела нет (не сохранялось или вытеснено)."""
+        now = time.time()
+        with self.lock:
+            row = self.conn.execute(
+                "SELECT objects.hash, objects.codec, objects.data FROM entries "
+                "JOIN objects ON objects.hash = entries.hash WHERE entries.ogrn = ?",
+                (ogrn,),
+            ).fetchone()
+            if row is None:
+                return None
+            self.conn.execute("UPDATE objects SET accessed_at = ? WHERE hash = ?", (now, row[0]))
+            self.conn.execute("UPDATE entries SET accessed_at = ? WHERE ogrn = ?", (now, ogrn))
+            self.conn.commit()
+        return decompress(row[1], row[2])
+
+    def close(self):
+        with self.lock:
+            self.conn.close()
+
+
+class CachingSink:
+    """Способ сохранения с кэшем: ответ, совпавший по хешу с сохраненным, не перезаписывается."""
+
+    def __init__(self, sink, cache):
+        self.sink = sink
+        self.cache = cache
+
+    def write(self, ogrn, raw):
+        digest = payload_digest(raw)
+        if self.cache.stored_hash(ogrn) == digest:
+            self.cache.touch(ogrn)
+            metrics.inc("unchanged")
+            logger.info(f"Данные ОГРН {ogrn} не изменились, повторная запись не нужна.")
+            return True
+        if not self.sink.write(ogrn, raw):
+            return False
+        self.cache.put(ogrn, raw, digest)
+        return True
+
+    def read(self, ogrn):
+        raw = self.cache.get(ogrn)
+        if raw is not None:
+            return json.loads(raw)
+        return self.sink.read(ogrn)
+
+    def stored_ogrns(self):
+        return self.sink.stored_ogrns()
+
+    def close(self):
+        self.sink.close()
+        self.cache.close()
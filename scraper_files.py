@@ -0,0 +1,66 @@
+"""
+Входные и выходные файлы скрапера: список ключей `APIs.txt`, статистика ключей `api_count.json`, списки ОГРН,
+а также дневной лимит API, по которому считается остаток квоты ключа.
+
+Модуль не имеет побочных эффектов при импорте (не создает логов, HTTP-сессии и реестра ключей), поэтому
+его используют и `api_scraper.py`, и планировщик квот `quota_planner.py`.
+"""
+
+import json
+import logging
+import os
+
+from ogrn_input import OgrnStream
+
+logger = logging.getLogger("api_scraper")
+
+API_DAILY_LIMIT = 99
+API_RESET_HOURS = 25  # 24 часа + 1 час запаса для гарантированного сброса
+
+
+def load_api_keys(file_path):
+    try:
+        with open(file_path, 'r', encoding='utf-8') as f:
+            api_keys = [line.strip() for line in f if line.strip()]
+        logger.info(f"Загружено {len(api_keys)} API-ключей из файла {file_path}")
+        return api_keys
+    except Exception as e:
+        logger.error(f"Ошибка при загрузке списка API-ключей из файла {file_path}: {e}")
+        return []
+
+
+def load_api_usage(file_path):
+    try:
+        if os.path.exists(file_path):
+            with open(file_path, 'r', encoding='utf-8') as f:
+                return json.load(f)
+        logger.info(f"Файл статистики {file_path} не существует. Создаем новый.")
+        return {}
+    except Exception as e:
+        logger.error(f"Ошибка при загрузке статистики использования API-ключей: {e}")
+        return {}
+
+
+def write_file_atomic(file_path, content):
+    """Записывает файл через временный файл и os.replace, чтобы сбой посреди записи не испортил старую версию."""
+    tmp_path = f"{file_path}.tmp"
+    with open(tmp_path, 'w', encoding='utf-8') as f:
+        f.write(content)
+        f.flush()
+        os.fsync(f.fileno())
+    os.replace(tmp_path, file_path)
+
+
+def load_ogrns_from_file(file_path):
+    """Загружает весь список ОГРН в память (для небольших списков, например в планировщике квот).
+    Читает те же форматы и так же проверяет контрольные суммы, как потоковое чтение в `api_scraper.main()`."""
+    try:
+        ogrn_stream = OgrnStream(file_path, dedup="none")
+        ogrns_list = list(ogrn_stream)
+        if ogrn_stream.invalid:
+            logger.warning(f"В файле {file_path} пропущено {ogrn_stream.invalid} неверных ОГРН.")
+        logger.info(f"Загружено {len(ogrns_list)} ОГРН из файла {file_path} для обработки.")
+        return ogrns_list
+    except Exception as e:
+        logger.error(f"Ошибка при загрузке списка ОГРН из файла {file_path}: {e}")
+        return []
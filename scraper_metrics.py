@@ -0,0 +1,296 @@
+"""
+Метрики работы скрапера.
+
+- Гистограммы: задержка запроса к API, время сжатия и записи ответа, время ожидания в очереди записи,
+  ожидание свободного ключа (токена или слота).
+- Счетчики по ключам: запросы, достижения лимита, ошибки 401, ошибки по классам (таймаут, соединение, 5xx и т.д.).
+- Показатели пропускной способности: ОГРН и запросов в минуту, остаток квоты ключей, оценка времени до ее
+  исчерпания (`quota_eta_seconds`) и до конца списка ОГРН (`ogrns_eta_seconds`).
+
+Метрики доступны по HTTP (`/metrics` - формат Prometheus, `/metrics.json` - JSON), если задан порт, и
+периодически записываются в JSON-файл рядом с `api_count.json`. Ключи в метриках маскируются (`...abcd`).
+
+Квантили гистограмм точны только до границы корзины. Для замеров (`benchmarks/bench_scraper.py`) гистограммы
+могут дополнительно хранить все наблюдения (`Metrics.record_samples`) - память растет с числом запросов.
+"""
+
+import bisect
+import json
+import logging
+import os
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+logger = logging.getLogger("api_scraper")
+
+# Границы корзин гистограмм в секундах
+DEFAULT_BUCKETS = (0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+# Счетчики, для которых считается скорость в минуту, и окно расчета
+RATE_COUNTERS = ("ogrn_processed", "requests")
+RATE_WINDOW_SECONDS = 300
+
+
+class Histogram:
+    __slots__ = ("buckets", "counts", "total", "count", "samples", "lock")
+
+    def __init__(self, buckets=DEFAULT_BUCKETS, keep_samples=False):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.total = 0.0
+        self.count = 0
+        self.samples = [] if keep_samples else None  # Все наблюдения (только для замеров)
+        self.lock = threading.Lock()
+
+    def observe(self, value):
+        index = bisect.bisect_left(self.buckets, value)
+        with self.lock:
+            self.counts[index] += 1
+            self.total += value
+            self.count += 1
+            if self.samples is not None:
+                self.samples.append(value)
+
+    def quantile(self, q):
+        """Оценка квантиля по корзинам (верхняя граница корзины, в которую попадает квантиль)."""
+        with self.lock:
+            if not self.count:
+                return None
+            rank = q * self.count
+            seen = 0
+            for bound, bucket_count in zip(self.buckets, self.counts):
+                seen += bucket_count
+                if seen >= rank:
+                    return bound
+            return float("inf")
+
+    def snapshot(self):
+        with self.lock:
+            count, total = self.count, self.total
+        return {
+            "count": count,
+            "sum": round(total, 6),
+            "avg": round(total / count, 6) if count else None,
+            "p50": self.quantile(0.5),
+            "p95": self.quantile(0.95),
+            "p99": self.quantile(0.99),
+        }
+
+
+def mask_key(api_key):
+    return f"...{api_key[-4:]}"
+
+
+class Metrics:
+    def __init__(self):
+        self.started = time.monotonic()
+        self.lock = threading.Lock()
+        self.histograms = {}
+        self.key_counters = {}  # ключ -> {имя счетчика: значение}
+        self.counters = {}
+        self.gauge_callback = None
+        self.keep_samples = False
+        self._rate_marks = []  # (время, значения RATE_COUNTERS) для расчета скорости
+
+    def histogram(self, name):
+        histogram = self.histograms.get(name)
+        if histogram is None:
+            with self.lock:
+                histogram = self.histograms.setdefault(name, Histogram(keep_samples=self.keep_samples))
+        return histogram
+
+    def record_samples(self):
+        """Хранить все наблюдения гистограмм, созданных после вызова (для точных квантилей в замерах)."""
+        self.keep_samples = True
+
+    def observe(self, name, seconds):
+        self.histogram(name).observe(seconds)
+
+    def inc(self, name, value=1):
+        with self.lock:
+            self.counters[name] = self.counters.get(name, 0) + value
+
+    def inc_key(self, api_key, name, value=1):
+        label = mask_key(api_key)
+        with self.lock:
+            counters = self.key_counters.setdefault(label, {})
+            counters[name] = counters.get(name, 0) + value
+
+    def set_gauge_callback(self, callback):
+        """`callback()` возвращает dict с текущими значениями (остаток квоты `remaining_quota`, оставшиеся ОГРН `remaining_ogrns` и т.д.)."""
+        self.gauge_callback = callback
+
+    def gauges(self):
+        """Скорости (в минуту) по окну последних 5 минут, значения от `gauge_callback` и оценки времени (ETA)."""
+        now = time.monotonic()
+        with self.lock:
+            current = {name: self.counters.get(name, 0) for name in RATE_COUNTERS}
+            self._rate_marks.append((now, current))
+            while len(self._rate_marks) > 2 and now - self._rate_marks[0][0] > RATE_WINDOW_SECONDS:
+                self._rate_marks.pop(0)
+            first_time, first = self._rate_marks[0]
+        if now - first_time < 1:
+            # Окна еще нет (первый замер) - считаем от начала работы
+            first_time, first = self.started, {}
+        elapsed = now - first_time
+        rates = {
+            name: (current[name] - first.get(name, 0)) / elapsed * 60 if elapsed > 0 else 0.0
+            for name in RATE_COUNTERS
+        }
+
+        gauges = {
+            "uptime_seconds": round(now - self.started, 1),
+            "ogrn_per_minute": round(rates["ogrn_processed"], 2),
+            "requests_per_minute": round(rates["requests"], 2),
+        }
+        if self.gauge_callback:
+            try:
+                gauges.update(self.gauge_callback())
+            except Exception as e:
+                logger.debug(f"Ошибка расчета показателей метрик: {e}")
+        remaining_quota = gauges.get("remaining_quota")
+        if remaining_quota is not None and rates["requests"] > 0:
+            gauges["quota_eta_seconds"] = round(remaining_quota / rates["requests"] * 60)
+        remaining_ogrns = gauges.get("remaining_ogrns")
+        if remaining_ogrns is not None and rates["ogrn_processed"] > 0:
+            gauges["ogrns_eta_seconds"] = round(remaining_ogrns / rates["ogrn_processed"] * 60)
+        return gauges
+
+    def _copy(self):
+        with self.lock:
+            counters = dict(self.counters)
+            key_counters = {key: dict(values) for key, values in self.key_counters.items()}
+            histograms = dict(self.histograms)
+        return counters, key_counters, histograms
+
+    def snapshot(self):
+        counters, key_counters, histograms = self._copy()
+        return {
+            "time": time.strftime("%Y-%m-%dT%H:%M:%SZ", time.gmtime()),
+            "gauges": self.gauges(),
+            "counters": counters,
+            "histograms": {name: histogram.snapshot() for name, histogram in sorted(histograms.items())},
+            "keys": key_counters,
+        }
+
+    def prometheus(self):
+        """Текст в формате Prometheus exposition."""
+        lines = []
+        for name, value in self.gauges().items():
+            if value is None:
+                continue
+            lines.append(f"# TYPE scraper_{name} gauge")
+            lines.append(f"scraper_{name} {value}")
+        counters, key_counters, histograms = self._copy()
+        for name, value in sorted(counters.items()):
+            lines.append(f"# TYPE scraper_{name}_total counter")
+            lines.append(f"scraper_{name}_total {value}")
+        for name in sorted({name for values in key_counters.values() for name in values}):
+            lines.append(f"# TYPE scraper_key_{name}_total counter")
+            for key, values in sorted(key_counters.items()):
+                if name in values:
+                    lines.append(f'scraper_key_{name}_total{{key="{key}"}} {values[name]}')
+        for name, histogram in sorted(histograms.items()):
+            lines.append(f"# TYPE scraper_{name}_seconds histogram")
+            with histogram.lock:
+                counts, total, count = list(histogram.counts), histogram.total, histogram.count
+            cumulative = 0
+            for bound, bucket_count in zip(histogram.buckets, counts):
+                cumulative += bucket_count
+                lines.append(f'scraper_{name}_seconds_bucket{{le="{bound}"}} {cumulative}')
+            lines.append(f'scraper_{name}_seconds_bucket{{le="+Inf"}} {count}')
+            lines.append(f"scraper_{name}_seconds_sum {total}")
+            lines.append(f"scraper_{name}_seconds_count {count}")
+        return "\n".join(lines) + "\n"
+
+    def write_snapshot(self, file_path):
+        tmp_path = f"{file_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(self.snapshot(), f, indent=4, ensure_ascii=False)
+            os.replace(tmp_path, file_path)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении снимка метрик в {file_path}: {e}")
+
+
+    def write_samples(self, file_path):
+        """Записывает все наблюдения гистограмм в секундах: {имя: [значения]}."""
+        _, _, histograms = self._copy()
+        samples = {}
+        for name, histogram in sorted(histograms.items()):
+            with histogram.lock:
+                if histogram.samples is not None:
+                    samples[name] = list(histogram.samples)
+        tmp_path = f"{file_path}.tmp"
+        try:
+            with open(tmp_path, 'w', encoding='utf-8') as f:
+                json.dump(samples, f)
+            os.replace(tmp_path, file_path)
+        except Exception as e:
+            logger.error(f"Ошибка при сохранении наблюдений метрик в {file_path}: {e}")
+
+
+class MetricsHandler(BaseHTTPRequestHandler):
+    metrics = None
+
+    def do_GET(self):
+        if self.path.startswith("/metrics.json"):
+            body = json.dumps(self.metrics.snapshot(), ensure_ascii=False).encode("utf-8")
+            content_type = "application/json; charset=utf-8"
+        elif self.path.startswith("/metrics"):
+            body = self.metrics.prometheus().encode("utf-8")
+            content_type = "text/plain; version=0.0.4; charset=utf-8"
+        else:
+            self.send_error(404)
+            return
+        self.send_response(200)
+        self.send_header("Content-Type", content_type)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, format, *args):
+        pass
+
+
+class MetricsReporter:
+    """Периодически пишет снимок метрик в файл и (если задан порт) отдает метрики по HTTP."""
+
+    def __init__(self, metrics, snapshot_path, interval=30, port=0, host="127.0.0.1"):
+        self.metrics = metrics
+        self.snapshot_path = snapshot_path
+        self.interval = interval
+        self.port = port
+        self.host = host
+        self.server = None
+        self._stop = threading.Event()
+        self._thread = None
+
+    def start(self):
+        if self.port:
+            handler = type("BoundMetricsHandler", (MetricsHandler,), {"metrics": self.metrics})
+            try:
+                self.server = ThreadingHTTPServer((self.host, self.port), handler)
+                threading.Thread(target=self.server.serve_forever, name="metrics-http", daemon=True).start()
+                logger.info(f"Метрики доступны на http://{self.host}:{self.server.server_port}/metrics")
+            except OSError as e:
+                logger.error(f"Не удалось запустить HTTP-сервер метрик на порту {self.port}: {e}")
+
+        def run():
+            while not self._stop.wait(self.interval):
+                self.metrics.write_snapshot(self.snapshot_path)
+        self._stop.clear()
+        self._thread = threading.Thread(target=run, name="metrics-snapshot", daemon=True)
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        if self._thread:
+            self._thread.join()
+        if self.server:
+            self.server.shutdown()
+            self.server.server_close()
+        self.metrics.write_snapshot(self.snapshot_path)
+
+
+metrics = Metrics()
@@ -0,0 +1,85 @@
+"""
+Фоновая запись ответов на диск.
+
+Рабочие потоки, выполняющие HTTP-запросы, только кладут сырые байты ответа в ограниченную очередь,
+а сжатие и запись выполняет отдельный пул потоков записи. Так время сжатия не добавляется к времени
+сетевого запроса. Если потоки записи не успевают, очередь заполняется и `submit` блокируется
+(обратное давление), поэтому память не растет без ограничений.
+
+В метрики (`scraper_metrics.py`) попадают время ожидания места в очереди (`write_submit_wait`), время
+ожидания ответа в очереди (`write_queue_wait`) и время сжатия и записи (`write`).
+"""
+
+import logging
+import queue
+import threading
+import time
+
+from scraper_metrics import metrics
+
+logger = logging.getLogger("api_scraper")
+
+_STOP = object()
+
+
+class WritePipeline:
+    """Очередь (ОГРН, сырые байты) -> пул потоков, вызывающих `sink.write`.
+
+    После каждой записи вызывается `on_written(ogrn, success)`: там фиксируется результат (журнал, счетчики)."""
+
+    def __init__(self, sink, on_written, num_writers=2, queue_size=64):
+        self.sink = sink
+        self.on_written = on_written
+        self.queue = queue.Queue(maxsize=max(1, queue_size))
+        self.threads = [
+            threading.Thread(target=self._run, name=f"writer-{i + 1}", daemon=True)
+            for i in range(max(1, num_writers))
+        ]
+        for thread in self.threads:
+            thread.start()
+
+    def submit(self, ogrn, raw):
+        """Ставит ответ в очередь на запись. Блокируется, пока в очереди нет места."""
+        started = time.monotonic()
+        self.queue.put((ogrn, raw, started))
+        waited = time.monotonic() - started
+        metrics.observe("write_submit_wait", waited)
+        if waited > 1:
+            logger.debug(f"Очередь записи заполнена: ОГРН {ogrn} ждал {waited:.1f} с.")
+
+    def _run(self):
+        while True:
+            item = self.queue.get()
+            try:
+                if item is _STOP:
+                    return
+                ogrn, raw, enqueued = item
+                started = time.monotonic()
+                metrics.observe("write_queue_wait", started - enqueued)
+                try:
+                    success = self.sink.write(ogrn, raw)
+                except Exception as e:
+                    logger.error(f"Ошибка записи данных ОГРН {ogrn}: {e}")
+                    success = False
+                metrics.observe("write", time.monotonic() - started)
+                metrics.inc("bytes_received", len(raw))
+                try:
+                    self.on_written(ogrn, success)
+                except Exception as e:
+                    # Поток записи не должен завершаться: иначе очередь заполнится и submit заблокируется навсегда
+                    logger.error(f"Ошибка учета результата записи ОГРН {ogrn}: {e}")
+            finally:
+                self.queue.task_done()
+
+    def close(self):
+        """Дожидается записи всех ответов из очереди и останавливает потоки записи.
+        Если живых потоков записи не осталось, не ждет места в заполненной очереди."""
+        stops = 0
+        while stops < len(self.threads) and any(thread.is_alive() for thread in self.threads):
+            try:
+                self.queue.put(_STOP, timeout=1)
+                stops += 1
+            except queue.Full:
+                continue
+        for thread in self.threads:
+            thread.join()